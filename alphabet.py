@@ -0,0 +1,91 @@
+from array import array
+
+# class id of every symbol that no transition consumes, including the symbols outside the alphabet
+DEAD_CLASS = 0
+
+class SymbolClasses:
+    '''
+    SymbolClasses class
+
+    The partition of the alphabet of an automaton into equivalence classes: two symbols share a class if every state has the same transitions on
+    both, so no transition can tell them apart. Table-based engines then need one column per class instead of one per symbol
+
+    Classes are numbered from 1 in the sorted order of their smallest symbol. Class DEAD_CLASS (0) holds every symbol without a transition, so an
+    input character is mapped to its class with one lookup, and a character outside the alphabet lands in a class that always rejects
+    '''
+
+    def __init__(self, class_of):
+        '''
+        initialize the SymbolClasses object
+
+        class_of: Dict{Symbol : Int}: the class id of every symbol that has a transition
+        '''
+        self._class_of = class_of
+        self._num_classes = max(class_of.values(), default=DEAD_CLASS) + 1
+
+        # the smallest symbol of every class, None for DEAD_CLASS
+        self._representatives = [None] * self._num_classes
+        for sym in sorted(class_of, reverse=True):
+            self._representatives[class_of[sym]] = sym
+
+    @property
+    def class_of(self):
+        '''
+        return the Dict{Symbol : Int} that maps every symbol with a transition to its class id
+        '''
+        return self._class_of
+
+    @property
+    def num_classes(self):
+        '''
+        return the number of classes, DEAD_CLASS included
+        '''
+        return self._num_classes
+
+    @property
+    def representatives(self):
+        '''
+        return the smallest symbol of every class, indexed by class id (None for DEAD_CLASS)
+        '''
+        return self._representatives
+
+    def lookup(self, ch):
+        '''
+        return the class id of the character ch
+        '''
+        return self._class_of.get(ch, DEAD_CLASS)
+
+    def symbols(self, class_id):
+        '''
+        return the set of symbols of the class class_id (empty for DEAD_CLASS, which also holds every symbol outside the alphabet)
+        '''
+        return {sym for sym, c in self._class_of.items() if c == class_id}
+
+    def byte_table(self):
+        '''
+        return an array of 256 class ids indexed by byte value, to map bytes input (read as latin-1 characters) to classes without a dict lookup
+        '''
+        return array('i', (self.lookup(chr(b)) for b in range(256)))
+
+    def __repr__(self):
+        return f"SymbolClasses({[''.join(sorted(self.symbols(c))) for c in range(1, self._num_classes)]!r})"
+
+def symbol_classes(automaton):
+    '''
+    return the SymbolClasses of automaton (an NFA, a CompactNFA or a DFA)
+
+    The signature of a symbol is the set of its (source state, destinations) pairs; symbols with the same signature get the same class
+    '''
+    signatures = {}
+
+    for (src, sym), dests in automaton.trans_func.items():
+        if sym != "ε":
+            signatures.setdefault(sym, []).append((src, dests if isinstance(dests, int) else frozenset(dests)))
+
+    ids = {}
+    class_of = {}
+
+    for sym in sorted(signatures):
+        class_of[sym] = ids.setdefault(frozenset(signatures[sym]), len(ids) + 1)
+
+    return SymbolClasses(class_of)
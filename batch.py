@@ -0,0 +1,92 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+
+# number of strings sent to a worker at a time
+DEFAULT_CHUNKSIZE = 10000
+
+# chunks in flight per worker, bounds the memory used when the input is a long stream
+PENDING_CHUNKS_PER_WORKER = 2
+
+# the automaton of the current worker process, set once by _init_worker
+_worker_pattern = None
+
+def _init_worker(pattern):
+    '''
+    process pool initializer: receive the automaton once per worker
+    '''
+    global _worker_pattern
+    _worker_pattern = pattern
+
+def _match_chunk(chunk):
+    '''
+    match every string of chunk against the worker's automaton, return the results as bytes of 0/1
+    '''
+    return bytes(map(_worker_pattern.match, chunk))
+
+def _chunks(iterable, chunksize):
+    '''
+    yield the items of iterable in lists of chunksize
+    '''
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, chunksize))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+def _iter_result_chunks(pattern, iterable, chunksize, workers):
+    '''
+    yield, in input order, the bytes of 0/1 results of every chunk of iterable
+    '''
+    if workers == 1:
+        for chunk in _chunks(iterable, chunksize):
+            yield bytes(map(pattern.match, chunk))
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * PENDING_CHUNKS_PER_WORKER
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pattern,)) as executor:
+        pending = deque()
+
+        for chunk in _chunks(iterable, chunksize):
+            pending.append(executor.submit(_match_chunk, chunk))
+
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def _iter_results(pattern, iterable, chunksize, workers):
+    for results in _iter_result_chunks(pattern, iterable, chunksize, workers):
+        for result in results:
+            yield result == 1
+
+def match_many(pattern, iterable, chunksize=DEFAULT_CHUNKSIZE, workers=None, lazy=False):
+    '''
+    match every string of iterable against pattern (a CompiledPattern, or any picklable object with a match method)
+
+    The strings are streamed in chunks of chunksize to a pool of workers processes (one per CPU by default, workers=1 matches in this process).
+    The automaton is shipped once per worker through the pool initializer, never per item, and only a few chunks are in flight at a time, so
+    iterable can be a stream larger than memory
+
+    Return a bytearray with 1 for every matching string and 0 otherwise, in input order. If lazy is True, return an iterator of bools instead
+    '''
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    if lazy:
+        return _iter_results(pattern, iterable, chunksize, workers)
+
+    results = bytearray()
+
+    for chunk_results in _iter_result_chunks(pattern, iterable, chunksize, workers):
+        results += chunk_results
+
+    return results
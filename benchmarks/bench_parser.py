@@ -0,0 +1,66 @@
+'''
+Parser scaling benchmark
+
+Times parse_regex on generated patterns of 10^3 to 10^6 symbols and prints the time per symbol, which should stay flat if parsing is linear.
+The patterns include deeply nested groups, which a recursive parser cannot handle.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parser [--max-exp 6]
+'''
+
+import argparse
+import time
+
+from parser import parse_regex
+
+def literal_run(n):
+    return "ab" * (n // 2)
+
+def nested_groups(n):
+    return "(" * (n // 2) + "a" + ")" * (n // 2)
+
+def wide_union(n):
+    return "|".join("abcdefgh"[i % 8] for i in range(n // 2))
+
+def nested_stars(n):
+    return "(a*)" * (n // 4)
+
+PATTERN_FAMILIES = {
+    "literal_run": literal_run,
+    "nested_groups": nested_groups,
+    "wide_union": wide_union,
+    "nested_stars": nested_stars,
+}
+
+def time_parse(pattern, repeat):
+    '''
+    return the best wall time of repeat runs of parse_regex(pattern)
+    '''
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_regex(pattern)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--min-exp", type=int, default=3, help="smallest pattern size, as a power of 10")
+    arg_parser.add_argument("--max-exp", type=int, default=6, help="largest pattern size, as a power of 10")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    args = arg_parser.parse_args()
+
+    print(f"{'family':<16}{'symbols':>10}{'seconds':>12}{'ns/symbol':>12}")
+
+    for name, family in PATTERN_FAMILIES.items():
+        for exp in range(args.min_exp, args.max_exp + 1):
+            pattern = family(10 ** exp)
+            seconds = time_parse(pattern, args.repeat)
+
+            print(f"{name:<16}{len(pattern):>10}{seconds:>12.4f}{seconds / len(pattern) * 1e9:>12.1f}")
+
+if __name__ == "__main__":
+    main()
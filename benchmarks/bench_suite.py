@@ -0,0 +1,178 @@
+'''
+Hot path benchmark suite
+
+Times parse_regex, Regex.to_nfa, NFA.get_epsilon_closure, NFA.match, NFA.trace_match, layered_layout and nfa_to_cytoscape_elems over
+parameterized pattern families, with match inputs from 1 to 10^max-exp characters. Every case reports its best time per call, and the results can be written as JSON.
+
+Given a baseline (a JSON file written earlier with --save-baseline), the suite compares every case against it and exits with status 1 when one
+got slower by more than --threshold (0.25 = 25%). Baselines are machine-specific: record one on the machine that runs the comparison.
+
+nfa_to_cytoscape_elems needs the Graphviz dot binary and the Dash dependencies, and is skipped when they are missing.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite [--max-exp 6] [--save-baseline benchmarks/baseline.json]
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json [--threshold 0.25] [--json results.json]
+'''
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import timeit
+
+from layered_layout import layered_layout
+from layout_cache import canonical_key
+from nfa import NFA
+from parser import parse_regex
+
+def literal_pattern(n):
+    return "ab" * (n // 2) + "a" * (n % 2)
+
+def nested_stars_pattern(n):
+    return "(a*)*" * n
+
+def wide_union_pattern(n):
+    return "|".join("abcdefgh"[i % 8] * (i // 8 + 1) for i in range(n))
+
+def visualizer_pattern(n):
+    # the (a|b)*(bc|ab)(dasf|bfaskd)* example of graphviz_visualizer.py, with the trailing group repeated
+    return "(a|b)*(bc|ab)" + "(dasf|bfaskd)*" * n
+
+# family: (pattern of size n, pattern used by the match cases, match input of a given length). The inputs keep the match pattern alive up to
+# their last character, so every match scans the whole input
+PATTERN_FAMILIES = {
+    "literal": (literal_pattern, "(" + literal_pattern(8) + ")*", literal_pattern),
+    "nested_stars": (nested_stars_pattern, nested_stars_pattern(8), lambda length: "a" * length),
+    "wide_union": (wide_union_pattern, "(" + wide_union_pattern(8) + ")*", lambda length: "a" * length),
+    "visualizer": (visualizer_pattern, visualizer_pattern(8), lambda length: "a" * length),
+}
+
+def best_time(function, repeat):
+    '''
+    return the best time of one call of function, over repeat timings of as many calls as fit in about 0.2 seconds
+    '''
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def cytoscape_available():
+    '''
+    return nfa_to_cytoscape_elems if the visualizer and the Graphviz dot binary can be used, None otherwise
+    '''
+    if shutil.which("dot") is None:
+        return None
+
+    try:
+        from web_visualizer import nfa_to_cytoscape_elems
+    except ImportError:
+        return None
+
+    return nfa_to_cytoscape_elems
+
+def cases(max_exp, max_pattern_exp):
+    '''
+    yield the (case name, function) pairs of the suite
+    '''
+    to_cytoscape = cytoscape_available()
+
+    for family, (make_pattern, match_pattern, make_input) in PATTERN_FAMILIES.items():
+        for exp in range(1, max_pattern_exp + 1):
+            n = 10 ** exp
+            pattern = make_pattern(n)
+            regex = parse_regex(pattern)
+            nfa = regex.to_nfa()
+
+            yield f"parse/{family}/n={n}", lambda pattern=pattern: parse_regex(pattern)
+            yield f"to_nfa/{family}/n={n}", lambda regex=regex: regex.to_nfa()
+
+            # a fresh NFA over the same transitions per call, so the cached closure index is rebuilt every time
+            yield f"closure/{family}/n={n}", lambda nfa=nfa: NFA(nfa.states, nfa.alphabet, nfa.start_state, nfa.accept_state,
+                                                               nfa.trans_func).get_epsilon_closure(nfa.states)
+
+            _, _, edges = canonical_key(nfa)
+            yield f"layered_layout/{family}/n={n}", lambda nfa=nfa, edges=edges, pattern=pattern: layered_layout(nfa, edges, pattern)
+
+            if to_cytoscape is not None and exp <= 2:
+                yield f"cytoscape/{family}/n={n}", lambda nfa=nfa: to_cytoscape(nfa)
+
+        nfa = parse_regex(match_pattern).to_nfa()
+
+        for exp in range(0, max_exp + 1):
+            test_str = make_input(10 ** exp)
+
+            yield f"match/{family}/len={10 ** exp}", lambda test_str=test_str, nfa=nfa: nfa.match(test_str)
+            yield f"trace_match/{family}/len={10 ** exp}", lambda test_str=test_str, nfa=nfa: sum(1 for _ in nfa.trace_match(test_str))
+
+def compare(results, baseline, threshold):
+    '''
+    return the (case, baseline seconds, seconds) of every case of results that is slower than its baseline by more than threshold
+    '''
+    regressions = []
+
+    for case, seconds in results.items():
+        reference = baseline.get(case)
+
+        if reference is not None and seconds > reference * (1 + threshold):
+            regressions.append((case, reference, seconds))
+
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--max-exp", type=int, default=6, help="longest match input, as a power of 10")
+    arg_parser.add_argument("--max-pattern-exp", type=int, default=3, help="largest pattern size, as a power of 10")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="timings per case, the best one is kept")
+    arg_parser.add_argument("--filter", default="", help="only run the cases whose name contains this string")
+    arg_parser.add_argument("--json", help="write the results to this JSON file")
+    arg_parser.add_argument("--baseline", help="compare the results against this JSON file")
+    arg_parser.add_argument("--save-baseline", help="write the results to this JSON file, to be used as --baseline later")
+    arg_parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = arg_parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+
+    print(f"{'case':<40}{'seconds':>14}{'baseline':>14}{'change':>10}")
+
+    for case, function in cases(args.max_exp, args.max_pattern_exp):
+        if args.filter not in case:
+            continue
+
+        seconds = best_time(function, args.repeat)
+        results[case] = seconds
+
+        reference = baseline.get(case) if baseline else None
+        if reference:
+            print(f"{case:<40}{seconds:>14.3e}{reference:>14.3e}{(seconds / reference - 1) * 100:>9.1f}%")
+        else:
+            print(f"{case:<40}{seconds:>14.3e}{'-':>14}{'-':>10}")
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+
+        for case, reference, seconds in regressions:
+            print(f"REGRESSION {case}: {reference:.3e}s -> {seconds:.3e}s", file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+'''
+Vectorized batch matching benchmark
+
+Matches a batch of random strings against a few patterns with the scalar matchers (NFA.match, DFA.match) and with the NumPy lockstep simulator of
+vectorized.py, checks that they agree and prints the time per character of each. Requires numpy.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_vectorized [--batch 20000] [--length 64]
+'''
+
+import argparse
+import random
+import time
+
+from parser import parse_regex
+from vectorized import VectorizedDFA
+
+# (pattern, characters the random strings are drawn from)
+PATTERNS = [
+    ("(a|b)*abb", "ab"),
+    ("(a|b|c|d)*d(a|b|c|d)*", "abcd"),
+    ("((a|b)(a|b))*", "ab"),
+]
+
+def best_time(function, repeat):
+    '''
+    return the best wall time of repeat calls of function, and its last result
+    '''
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--batch", type=int, default=20000, help="number of strings per batch")
+    arg_parser.add_argument("--length", type=int, default=64, help="maximum string length, lengths are uniform in [length / 2, length]")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'pattern':<24}{'engine':<12}{'seconds':>10}{'ns/char':>10}{'speedup':>10}")
+
+    for pattern, alphabet in PATTERNS:
+        strings = ["".join(rng.choice(alphabet) for _ in range(rng.randint(args.length // 2, args.length))) for _ in range(args.batch)]
+        chars = sum(map(len, strings))
+
+        nfa = parse_regex(pattern).to_nfa()
+        dfa = nfa.to_dfa().minimize()
+        vectorized = VectorizedDFA(dfa)
+
+        nfa_time, nfa_results = best_time(lambda: [nfa.match(s) for s in strings], 1)
+        dfa_time, dfa_results = best_time(lambda: [dfa.match(s) for s in strings], args.repeat)
+        vec_time, vec_results = best_time(lambda: vectorized.match_batch(strings), args.repeat)
+
+        if not nfa_results == dfa_results == vec_results.tolist():
+            raise AssertionError(f"engines disagree on {pattern!r}")
+
+        for engine, seconds in [("nfa", nfa_time), ("dfa", dfa_time), ("vectorized", vec_time)]:
+            print(f"{pattern:<24}{engine:<12}{seconds:>10.4f}{seconds / chars * 1e9:>10.1f}{nfa_time / seconds:>10.1f}")
+
+if __name__ == "__main__":
+    main()
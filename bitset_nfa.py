@@ -0,0 +1,196 @@
+class BitsetNFA:
+    '''
+    BitsetNFA class
+
+    A matching engine over an NFA that numbers the states densely and keeps every set of states as a Python int bitmask (bit i set <=> the i-th
+    state is in the set). The epsilon-closures and, for every symbol, the closed successors of each state are precomputed as masks
+
+    Thompson NFAs number the states of a literal consecutively, and a concatenation links them to the next literal with one epsilon-edge, so
+    most edges on a symbol go from bit i to bit i + 1, and most of their targets close over at most bit i + 2. Those edges are stepped all at once
+    by a shift of the mask; only the targets with a larger closure (the end of a branch or a loop) and the other edges are OR-ed in one by one.
+    A step on a Thompson NFA therefore costs a few AND/OR/shift operations plus one per branch end reached, rather than one per active state
+
+    Unlike a DFA, the number of masks is linear in the size of the NFA, so there is no risk of state blowup
+    '''
+
+    def __init__(self, nfa):
+        '''
+        initialize the BitsetNFA object from nfa
+        '''
+
+        # bit i stands for the state self._bit_states[i]
+        self._bit_states = sorted(nfa.states)
+        bit_of = {s: i for i, s in enumerate(self._bit_states)}
+
+        def to_mask(states):
+            mask = 0
+            for s in states:
+                mask |= 1 << bit_of[s]
+            return mask
+
+        self._start_mask = to_mask(nfa.get_epsilon_closure({nfa.start_state}))
+        self._accept_mask = to_mask(nfa.accept_states)
+
+        # the closure mask of every state reached by a symbol, by bit index
+        closures = {}
+
+        def closure_of(state):
+            bit = bit_of[state]
+
+            if bit not in closures:
+                closures[bit] = to_mask(nfa.get_epsilon_closure({state}))
+
+            return closures[bit]
+
+        # Dict{Symbol : (Int, Int, Dict{Int : Int})} : for every symbol, the mask of the states whose only transition on it goes to the next bit,
+        # the mask of the other states with a transition on it, and for each of those (by bit index) the mask of the epsilon-closure of its
+        # successors
+        self._steps = {}
+
+        for (src, sym), dests in nfa.trans_func.items():
+            if sym == "ε":
+                continue
+
+            src_bit = bit_of[src]
+            shift_mask, other_mask, successors = self._steps.get(sym, (0, 0, {}))
+            successors[src_bit] = successors.get(src_bit, 0)
+
+            for dest in dests:
+                successors[src_bit] |= closure_of(dest)
+
+            if len(dests) == 1 and bit_of[next(iter(dests))] == src_bit + 1:
+                shift_mask |= 1 << src_bit
+            else:
+                other_mask |= 1 << src_bit
+
+            self._steps[sym] = (shift_mask, other_mask, successors)
+
+        # a state reached by a shift closes over itself (plain), itself and the next bit (chain), or a larger set (its mask in self._closures)
+        self._chain_mask = 0
+        self._complex_mask = 0
+        self._closures = {}
+
+        for bit, closure in closures.items():
+            if closure == 1 << bit:
+                continue
+
+            if closure == 3 << bit:
+                self._chain_mask |= 1 << bit
+            else:
+                self._complex_mask |= 1 << bit
+                self._closures[bit] = closure
+
+        # the states with a shift edge on a symbol and also another edge on it are stepped one by one with all their successors
+        self._steps = {sym: (shift_mask & ~other_mask, other_mask, successors) for sym, (shift_mask, other_mask, successors) in self._steps.items()}
+
+    @property
+    def start_mask(self):
+        '''
+        return the mask of the epsilon-closure of the start state
+        '''
+        return self._start_mask
+
+    def to_states(self, mask):
+        '''
+        return the set of state ids whose bits are set in mask
+        '''
+        states = set()
+
+        while mask:
+            low = mask & -mask
+            states.add(self._bit_states[low.bit_length() - 1])
+            mask ^= low
+
+        return states
+
+    def step(self, active, ch):
+        '''
+        return the mask of the states active after consuming ch from the states in the mask active
+        '''
+        step = self._steps.get(ch)
+
+        if step is None:
+            return 0
+
+        return self._advance(active, step)
+
+    def _advance(self, active, step):
+        '''
+        return the mask of the states active after the transitions of step (an entry of self._steps) from the states in the mask active
+        '''
+        shift_mask, other_mask, successors = step
+
+        # the targets of the next-bit edges, with the next bit of those that close over it
+        shifted = (active & shift_mask) << 1
+        next_active = shifted | ((shifted & self._chain_mask) << 1)
+
+        complex_targets = shifted & self._complex_mask
+
+        while complex_targets:
+            low = complex_targets & -complex_targets
+            next_active |= self._closures[low.bit_length() - 1]
+            complex_targets ^= low
+
+        movers = active & other_mask
+
+        while movers:
+            low = movers & -movers
+            next_active |= successors[low.bit_length() - 1]
+            movers ^= low
+
+        return next_active
+
+    def match(self, test_str):
+        '''
+        return True if the NFA accepts test_str, return False otherwise
+        '''
+        steps = self._steps
+        chain_mask = self._chain_mask
+        complex_mask = self._complex_mask
+        closures = self._closures
+        active = self._start_mask
+
+        # the loop body is _advance, inlined
+        for ch in test_str:
+            step = steps.get(ch)
+
+            # fail-fast if char not in alphabet
+            if step is None:
+                return False
+
+            shift_mask, other_mask, successors = step
+            shifted = (active & shift_mask) << 1
+            movers = active & other_mask
+            active = shifted | ((shifted & chain_mask) << 1)
+
+            complex_targets = shifted & complex_mask
+
+            while complex_targets:
+                low = complex_targets & -complex_targets
+                active |= closures[low.bit_length() - 1]
+                complex_targets ^= low
+
+            while movers:
+                low = movers & -movers
+                active |= successors[low.bit_length() - 1]
+                movers ^= low
+
+            if not active:
+                return False
+
+        return bool(active & self._accept_mask)
+
+    def trace_match(self, test_str):
+        '''
+        Generator that yields the set of active states after each character is processed.
+        '''
+        active = self._start_mask
+        yield self.to_states(active)
+
+        for ch in test_str:
+            if ch not in self._steps:
+                yield set()  # empty = dead
+                return
+
+            active = self.step(active, ch)
+            yield self.to_states(active)
@@ -0,0 +1,303 @@
+from array import array
+from bisect import bisect_left
+
+class CompactNFA:
+    '''
+    CompactNFA class
+
+    A frozen, memory-compact form of an NFA (see NFA.freeze). The states are renumbered densely from 0 and the transitions are stored CSR-style:
+    the edges leaving dense state i are edges[offsets[i]:offsets[i + 1]]. Symbol edges and epsilon-edges are kept in separate arrays, so there is
+    no tuple, set or dict entry per edge
+
+    The public interface mirrors NFA and uses the original state ids, so the visualizers and the other engines can consume a CompactNFA directly
+
+    Attributes:
+        - ids: array[Int] : original id of every dense state, sorted. Every array can also be a memoryview of ints (see serialize.load)
+        - start: Int : dense id of the start state
+        - accepts: array[Int] : dense ids of the accept states
+        - symbols: Tuple[Str] : the alphabet, indexed by symbol id
+        - sym_offsets, sym_labels, sym_targets: array[Int] : CSR arrays of the symbol edges (symbol id and dense target of every edge)
+        - eps_offsets, eps_targets: array[Int] : CSR arrays of the epsilon-edges
+    '''
+
+    __slots__ = ("_ids", "_start", "_accepts", "_accept_set", "_symbols", "_symbol_ids",
+                 "_sym_offsets", "_sym_labels", "_sym_targets", "_eps_offsets", "_eps_targets")
+
+    def __init__(self, ids, start, accepts, symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets):
+        '''
+        initialize the CompactNFA object
+        '''
+        set_attr = object.__setattr__
+
+        set_attr(self, "_ids", ids)
+        set_attr(self, "_start", start)
+        set_attr(self, "_accepts", accepts)
+        set_attr(self, "_accept_set", frozenset(accepts))
+        set_attr(self, "_symbols", tuple(symbols))
+        set_attr(self, "_symbol_ids", {sym: i for i, sym in enumerate(symbols)})
+        set_attr(self, "_sym_offsets", sym_offsets)
+        set_attr(self, "_sym_labels", sym_labels)
+        set_attr(self, "_sym_targets", sym_targets)
+        set_attr(self, "_eps_offsets", eps_offsets)
+        set_attr(self, "_eps_targets", eps_targets)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompactNFA is immutable")
+
+    def __getstate__(self):
+        arrays = (self._ids, self._accepts, self._sym_offsets, self._sym_labels, self._sym_targets, self._eps_offsets, self._eps_targets)
+
+        # arrays loaded from a file are memoryviews over the mapping, which cannot be pickled
+        ids, accepts, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets = (
+            array('i', a) if isinstance(a, memoryview) else a for a in arrays)
+
+        return (ids, self._start, accepts, self._symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @classmethod
+    def from_nfa(cls, nfa):
+        '''
+        return the CompactNFA of nfa
+        '''
+
+        ids = array('i', sorted(nfa.states))
+        dense = {s: i for i, s in enumerate(ids)}
+        symbols = sorted(nfa.alphabet)
+        symbol_ids = {sym: i for i, sym in enumerate(symbols)}
+
+        # group the edges by dense source state
+        sym_edges = [[] for _ in ids]
+        eps_edges = [[] for _ in ids]
+
+        for (src, sym), dests in nfa.trans_func.items():
+            if sym == "ε":
+                eps_edges[dense[src]].extend(sorted(dense[d] for d in dests))
+            else:
+                sym_edges[dense[src]].extend((symbol_ids[sym], dense[d]) for d in sorted(dests))
+
+        sym_offsets = array('i', [0])
+        sym_labels = array('i')
+        sym_targets = array('i')
+
+        for edges in sym_edges:
+            edges.sort()
+            for label, target in edges:
+                sym_labels.append(label)
+                sym_targets.append(target)
+            sym_offsets.append(len(sym_targets))
+
+        eps_offsets = array('i', [0])
+        eps_targets = array('i')
+
+        for edges in eps_edges:
+            eps_targets.extend(edges)
+            eps_offsets.append(len(eps_targets))
+
+        accepts = array('i', sorted(dense[s] for s in nfa.accept_states))
+
+        return cls(ids, dense[nfa.start_state], accepts, symbols,
+                   sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets)
+
+    @property
+    def start_state(self):
+        '''
+        return the start state of the NFA
+        '''
+        return self._ids[self._start]
+
+    @property
+    def alphabet(self):
+        '''
+        return the alphabet of the NFA
+        '''
+        return set(self._symbols)
+
+    @property
+    def accept_state(self):
+        '''
+        return the accept states of the NFA, None if it has several
+        '''
+        if len(self._accepts) != 1:
+            return None
+
+        return self._ids[self._accepts[0]]
+
+    @property
+    def accept_states(self):
+        '''
+        return the set of all the accept states of the NFA
+        '''
+        return {self._ids[s] for s in self._accepts}
+
+    @property
+    def states(self):
+        '''
+        return the states of the NFA
+        '''
+        return set(self._ids)
+
+    @property
+    def trans_func(self):
+        '''
+        return the transition map/ function of the NFA, in the same Dict{(Int, Symbol) : Set[Int]} form as NFA.trans_func
+
+        The dict is rebuilt from the arrays on every access, so callers should bind it once
+        '''
+        ids = self._ids
+        symbols = self._symbols
+        trans_func = {}
+
+        for i in range(len(ids)):
+            for k in range(self._sym_offsets[i], self._sym_offsets[i + 1]):
+                trans_func.setdefault((ids[i], symbols[self._sym_labels[k]]), set()).add(ids[self._sym_targets[k]])
+
+            for k in range(self._eps_offsets[i], self._eps_offsets[i + 1]):
+                trans_func.setdefault((ids[i], "ε"), set()).add(ids[self._eps_targets[k]])
+
+        return trans_func
+
+    def memory_usage(self):
+        '''
+        return the number of bytes used by the transition arrays
+        '''
+        arrays = (self._ids, self._accepts, self._sym_offsets, self._sym_labels, self._sym_targets, self._eps_offsets, self._eps_targets)
+
+        return sum(a.itemsize * len(a) for a in arrays) + sum(len(sym.encode("UTF-8")) for sym in self._symbols)
+
+    def _dense(self, state):
+        '''
+        return the dense id of the original state id state, or None if it is not a state of the NFA
+        '''
+        i = bisect_left(self._ids, state)
+
+        if i < len(self._ids) and self._ids[i] == state:
+            return i
+
+        return None
+
+    def _closure(self, states):
+        '''
+        return the epsilon closure of the dense states
+        '''
+        offsets = self._eps_offsets
+        targets = self._eps_targets
+
+        stack = list(states)
+        closure = set(states)
+
+        while stack:
+            s = stack.pop()
+
+            for k in range(offsets[s], offsets[s + 1]):
+                t = targets[k]
+                if t not in closure:
+                    closure.add(t)
+                    stack.append(t)
+
+        return closure
+
+    def _move(self, states, sym_id):
+        '''
+        return the dense states reachable from the dense states by consuming the symbol sym_id
+        '''
+        offsets = self._sym_offsets
+        labels = self._sym_labels
+        targets = self._sym_targets
+
+        next_states = set()
+
+        for s in states:
+            for k in range(offsets[s], offsets[s + 1]):
+                if labels[k] == sym_id:
+                    next_states.add(targets[k])
+
+        return next_states
+
+    def get_next_state(self, curr_state, curr_char):
+        '''
+        return the set of the next state ids of curr_state, given the input curr_char. Return an empty set if there is no defined transition for curr_state on the input curr_char
+        '''
+        s = self._dense(curr_state)
+
+        if s is None:
+            return set()
+
+        if curr_char == "ε":
+            return {self._ids[self._eps_targets[k]] for k in range(self._eps_offsets[s], self._eps_offsets[s + 1])}
+
+        sym_id = self._symbol_ids.get(curr_char)
+
+        if sym_id is None:
+            return set()
+
+        return {self._ids[t] for t in self._move((s,), sym_id)}
+
+    def get_epsilon_closure(self, states):
+        '''
+        return the epsilon closure of states
+        '''
+        epsilon_closure = set(states)
+        dense = {self._dense(s) for s in states if s is not None}
+        dense.discard(None)
+
+        epsilon_closure |= {self._ids[s] for s in self._closure(dense)}
+
+        return epsilon_closure
+
+    def match(self, test_str):
+        '''
+        return True if the NFA accepts test_str, return False otherwise
+        '''
+        symbol_ids = self._symbol_ids
+        curr_states = self._closure((self._start,))
+
+        for ch in test_str:
+            sym_id = symbol_ids.get(ch)
+
+            # fail-fast if char not in alphabet
+            if sym_id is None:
+                return False
+
+            next_states = self._move(curr_states, sym_id)
+
+            if not next_states:
+                return False
+
+            curr_states = self._closure(next_states)
+
+        return not self._accept_set.isdisjoint(curr_states)
+
+    def trace_match(self, test_str):
+        '''
+        Generator that yields the set of active states after each character is processed.
+        '''
+        ids = self._ids
+        curr_states = self._closure((self._start,))
+        yield {ids[s] for s in curr_states}
+
+        for ch in test_str:
+            sym_id = self._symbol_ids.get(ch)
+
+            if sym_id is None:
+                yield set()  # empty = dead
+                return
+
+            curr_states = self._closure(self._move(curr_states, sym_id))
+            yield {ids[s] for s in curr_states}
+
+    def __repr__(self):
+        '''
+        return a string representation of the NFA
+        '''
+        lines = []
+        lines.append(f"States: {self.states}")
+        lines.append(f"Starting states: {self.start_state}")
+        lines.append(f"Accepting states: {self.accept_state if len(self._accepts) == 1 else self.accept_states}")
+
+        for (src, symbol), dests in self.trans_func.items():
+            for d in dests:
+                lines.append(f"  {src} --{symbol}--> {d}")
+
+        return "\n".join(lines)
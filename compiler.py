@@ -0,0 +1,380 @@
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+
+import batch
+from bitset_nfa import BitsetNFA
+from compact_nfa import CompactNFA
+from dfa import LazyDFA
+from optimize import optimize_nfa
+from parser import parse_regex
+from search import Searcher
+import serialize
+from stream import StreamMatcher
+from simplify import simplify as simplify_ast
+
+# matching engines a pattern can be compiled for
+ENGINES = ("nfa", "dfa", "bitset")
+
+DEFAULT_ENGINE = "dfa"
+
+# default bounds of the module-level pattern cache
+DEFAULT_CACHE_MAXSIZE = 512
+DEFAULT_CACHE_MAX_MEMORY = 64 * 1024 * 1024
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize", "memory", "max_memory"])
+
+class CompiledPattern:
+    '''
+    CompiledPattern class
+
+    The immutable result of compile(pattern). It holds the frozen CompactNFA of the pattern and the matching engine built on top of it. It exposes
+    the read-only NFA interface (states, trans_func, get_epsilon_closure, ...), so it can be passed to the visualizers directly
+
+    Attributes:
+        - pattern: Str : the source regex
+        - engine: Str : the engine used by match, one of ENGINES
+        - nfa: CompactNFA : the Thompson NFA of the pattern
+        - dfa_max_memory: Int : if given, the byte bound of the lazy DFA cache of the "dfa" engine (see LazyDFA)
+    '''
+
+    __slots__ = ("_pattern", "_engine", "_nfa", "_dfa_max_memory", "_matcher", "_searcher")
+
+    def __init__(self, pattern, engine, nfa, dfa_max_memory=None):
+        '''
+        initialize the CompiledPattern object
+        '''
+        if engine == "dfa":
+            matcher = LazyDFA(nfa, max_memory=dfa_max_memory)
+        elif engine == "bitset":
+            matcher = BitsetNFA(nfa)
+        else:
+            matcher = nfa
+
+        set_attr = object.__setattr__
+
+        set_attr(self, "_pattern", pattern)
+        set_attr(self, "_engine", engine)
+        set_attr(self, "_nfa", nfa)
+        set_attr(self, "_dfa_max_memory", dfa_max_memory)
+        set_attr(self, "_matcher", matcher)
+        set_attr(self, "_searcher", Searcher(nfa))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledPattern is immutable")
+
+    def __getstate__(self):
+        # the matcher is rebuilt on unpickling, only the NFA is shipped
+        return (self._pattern, self._engine, self._nfa, self._dfa_max_memory)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def pattern(self):
+        '''
+        return the source regex
+        '''
+        return self._pattern
+
+    @property
+    def engine(self):
+        '''
+        return the name of the matching engine
+        '''
+        return self._engine
+
+    @property
+    def nfa(self):
+        '''
+        return the CompactNFA of the pattern
+        '''
+        return self._nfa
+
+    # read-only NFA interface, delegated to the CompactNFA
+
+    @property
+    def start_state(self):
+        return self._nfa.start_state
+
+    @property
+    def accept_state(self):
+        return self._nfa.accept_state
+
+    @property
+    def accept_states(self):
+        return self._nfa.accept_states
+
+    @property
+    def alphabet(self):
+        return self._nfa.alphabet
+
+    @property
+    def states(self):
+        return self._nfa.states
+
+    @property
+    def trans_func(self):
+        return self._nfa.trans_func
+
+    def get_next_state(self, curr_state, curr_char):
+        return self._nfa.get_next_state(curr_state, curr_char)
+
+    def get_epsilon_closure(self, states):
+        return self._nfa.get_epsilon_closure(states)
+
+    def match(self, test_str):
+        '''
+        return True if the pattern matches the whole of test_str, return False otherwise
+        '''
+        return self._matcher.match(test_str)
+
+    def trace_match(self, test_str):
+        '''
+        Generator that yields the set of active states after each character is processed.
+        '''
+        return self._nfa.trace_match(test_str)
+
+    def search(self, text, pos=0, endpos=None):
+        '''
+        return the Match of the leftmost-longest occurrence of the pattern in text[pos:endpos] (a str, bytes or mmap), or None
+        '''
+        return self._searcher.search(text, pos, endpos)
+
+    def finditer(self, text, pos=0, endpos=None):
+        '''
+        return an iterator over the Match of every non-overlapping leftmost-longest occurrence of the pattern in text[pos:endpos]
+        '''
+        return self._searcher.finditer(text, pos, endpos)
+
+    def match_many(self, iterable, chunksize=batch.DEFAULT_CHUNKSIZE, workers=None, lazy=False):
+        '''
+        match every string of iterable against the pattern in a process pool, see batch.match_many
+        '''
+        return batch.match_many(self, iterable, chunksize, workers, lazy)
+
+    def stream(self):
+        '''
+        return a new StreamMatcher that matches the pattern against an input fed in chunks, through the lazy DFA for the "dfa" engine
+        '''
+        return StreamMatcher(self._nfa, self._matcher if self._engine == "dfa" else None)
+
+    def save(self, path):
+        '''
+        write the NFA of the pattern, with its source regex, to the binary automaton file path (see serialize), to be loaded again with load()
+        '''
+        serialize.save(self._nfa, path, self._pattern)
+
+    def dumps(self):
+        '''
+        return the bytes that save writes, to be loaded again with loads()
+        '''
+        return serialize.dumps(self._nfa, self._pattern)
+
+    def memory_usage(self):
+        '''
+        return an estimate of the number of bytes used by the compiled pattern. The lazy DFA cache of the "dfa" engine is counted at its byte bound
+        when it has one, so the estimate does not change as the cache fills up, and at its current size otherwise
+        '''
+        size = self._nfa.memory_usage() + len(self._pattern)
+
+        if self._engine == "dfa":
+            max_memory = self._matcher.max_memory
+            size += self._matcher.memory_usage() if max_memory is None else max_memory
+
+        return size
+
+    def __repr__(self):
+        return f"CompiledPattern({self._pattern!r}, engine={self._engine!r})"
+
+class PatternCache:
+    '''
+    PatternCache class
+
+    A thread-safe LRU cache of compiled patterns, bounded both by the number of entries (maxsize) and by their total memory_usage() (max_memory).
+    The least recently used entries are evicted first. compile() bounds the bytes of the lazy DFA cache of every pattern by entry_memory, so that
+    a full cache of patterns fits in max_memory even once their DFA caches have filled up
+    '''
+
+    def __init__(self, maxsize=DEFAULT_CACHE_MAXSIZE, max_memory=DEFAULT_CACHE_MAX_MEMORY):
+        self._maxsize = maxsize
+        self._max_memory = max_memory
+        self._entries = OrderedDict()
+        self._memory = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        return the value cached under key and mark it as most recently used, return None on a miss
+        '''
+        with self._lock:
+            value = self._entries.get(key)
+
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._entries.move_to_end(key)
+
+            return value
+
+    def put(self, key, value):
+        '''
+        cache value under key, evicting least recently used entries to stay within the bounds. A value larger than max_memory is not cached
+        '''
+        size = value.memory_usage()
+
+        with self._lock:
+            if key in self._entries:
+                self._memory -= self._entries.pop(key).memory_usage()
+
+            if size > self._max_memory or self._maxsize <= 0:
+                return
+
+            self._entries[key] = value
+            self._memory += size
+
+            while len(self._entries) > self._maxsize or self._memory > self._max_memory:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory -= evicted.memory_usage()
+
+    @property
+    def entry_memory(self):
+        '''
+        return the share of max_memory of one entry when the cache is full
+        '''
+        return self._max_memory // max(self._maxsize, 1)
+
+    def clear(self):
+        '''
+        drop every entry and reset the statistics
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+            self._hits = 0
+            self._misses = 0
+
+    def info(self):
+        '''
+        return the CacheInfo statistics of the cache
+        '''
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._entries), self._memory, self._max_memory)
+
+_cache = PatternCache()
+
+def _compile_uncached(pattern, engine, optimize=False, simplify=False, dfa_max_memory=None):
+    '''
+    parse and build pattern, bypassing the cache
+    '''
+    ast = parse_regex(pattern)
+
+    if simplify:
+        ast = simplify_ast(ast).regex
+
+    nfa = ast.to_nfa()
+
+    if optimize:
+        nfa, _ = optimize_nfa(nfa)
+
+    return CompiledPattern(pattern, engine, nfa.freeze(), dfa_max_memory)
+
+def compile(pattern, engine=DEFAULT_ENGINE, optimize=False, simplify=False):
+    '''
+    return the CompiledPattern of pattern for the given engine. If simplify is True the AST is rewritten by simplify.simplify before the NFA is
+    built, and if optimize is True the NFA is then shrunk by optimize.optimize_nfa
+
+    Results are kept in a module-level LRU cache keyed by (pattern, engine, optimize, simplify), so compiling a recurring pattern is a dict lookup. The
+    lazy DFA cache of the pattern is flushed when it holds its share of the cache memory (see PatternCache.entry_memory). Raise RegexSyntaxError if pattern is not
+    a valid regex
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    key = (pattern, engine, optimize, simplify)
+    compiled = _cache.get(key)
+
+    if compiled is None:
+        compiled = _compile_uncached(pattern, engine, optimize, simplify, _cache.entry_memory)
+        _cache.put(key, compiled)
+
+    return compiled
+
+def compile_many(patterns, engine=DEFAULT_ENGINE, optimize=False, simplify=False, workers=None, use_processes=False):
+    '''
+    return the list of CompiledPattern of patterns, in order
+
+    Patterns missing from the cache are compiled concurrently by workers threads (or processes if use_processes is True, which sidesteps the GIL
+    for large pattern sets) and then added to the cache. Every build numbers its states from 1, so the result does not depend on which worker built
+    which pattern. workers=None uses one worker per CPU
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    patterns = list(patterns)
+    compiled = {}
+
+    for pattern in patterns:
+        if pattern not in compiled:
+            compiled[pattern] = _cache.get((pattern, engine, optimize, simplify))
+
+    missing = [pattern for pattern, value in compiled.items() if value is None]
+
+    if missing:
+        if workers == 1 or len(missing) == 1:
+            built = [_compile_uncached(pattern, engine, optimize, simplify, _cache.entry_memory) for pattern in missing]
+        else:
+            executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+            with executor_class(max_workers=workers) as executor:
+                options = [[option] * len(missing) for option in (engine, optimize, simplify, _cache.entry_memory)]
+                built = list(executor.map(_compile_uncached, missing, *options))
+
+        for pattern, value in zip(missing, built):
+            compiled[pattern] = value
+            _cache.put((pattern, engine, optimize, simplify), value)
+
+    return [compiled[pattern] for pattern in patterns]
+
+def load(path, engine="nfa"):
+    '''
+    return the CompiledPattern saved in the binary automaton file path by CompiledPattern.save
+
+    The file is memory-mapped and nothing is parsed or rebuilt. With the default "nfa" engine the pattern matches straight from the mapped arrays,
+    so loading is instant and processes that load the same file share its pages; the "dfa" and "bitset" engines first build their own tables
+    from it. The pattern is not added to the cache
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    return _from_automaton(*serialize.load(path), engine)
+
+def loads(data, engine="nfa"):
+    '''
+    return the CompiledPattern stored in the bytes-like object data by CompiledPattern.dumps. Like load, the NFA is matched straight from data
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    return _from_automaton(*serialize.loads(data), engine)
+
+def _from_automaton(nfa, pattern, engine):
+    if not isinstance(nfa, CompactNFA):
+        raise ValueError("Automaton file does not hold an NFA")
+
+    return CompiledPattern(pattern, engine, nfa)
+
+def cache_info():
+    '''
+    return the hit/miss and size statistics of the compile cache
+    '''
+    return _cache.info()
+
+def purge():
+    '''
+    clear the compile cache
+    '''
+    _cache.clear()
@@ -0,0 +1,668 @@
+from array import array
+from collections import deque, namedtuple
+from itertools import repeat
+import sys
+import threading
+
+from alphabet import symbol_classes, DEAD_CLASS
+
+# number of DFA states the lazy DFA keeps before its cache is flushed
+DEFAULT_CACHE_SIZE = 4096
+
+# state counts of a DFA before and after minimization
+MinimizationStats = namedtuple("MinimizationStats", ["states_before", "states_after"])
+
+# bytes per cached lazy DFA state on top of its state set and transition row: the dict entry and the list slots
+_STATE_OVERHEAD = 64
+
+# bytes of a state id stored in a transition row, ids above 256 are separate int objects
+_ID_SIZE = sys.getsizeof(DEFAULT_CACHE_SIZE)
+
+# marker stored in the lazy DFA transition rows for transitions that lead to the empty (dead) state set
+DEAD = -1
+
+def _symbol_edges(nfa):
+    '''
+    return a Dict{Int : List[(Symbol, Set[Int])]} that groups the non-epsilon transitions of nfa by their source state
+    '''
+
+    edges = {}
+
+    for (src, sym), dests in nfa.trans_func.items():
+        if sym != "ε":
+            edges.setdefault(src, []).append((sym, dests))
+
+    return edges
+
+def _move(edges, states):
+    '''
+    return a Dict{Symbol : Set[Int]} that maps every symbol to the states reachable from states by consuming it
+    '''
+
+    moves = {}
+
+    for s in states:
+        for sym, dests in edges.get(s, ()):
+            if sym in moves:
+                moves[sym] |= dests
+            else:
+                moves[sym] = set(dests)
+
+    return moves
+
+class DFA:
+    '''
+    DFA class
+
+    A DFA is produced from an NFA by the subset construction (see NFA.to_dfa). States are numbered densely from 0, and the start state is always 0
+
+    Attributes:
+        - states: Set[Int] : Set of all the state ids
+        - alphabet: Set[Str] : The alphabet of the DFA
+        - start: Int : Id of the start state
+        - accept_states: Set[Int] : Ids of the accept states
+        - trans_func: Dict{(Int, Symbol) : Int} : Dictionary that map a pair of state id and symbol in the alphabet to the next state
+        - minimization_stats: MinimizationStats : state counts before and after minimization, None if the DFA was not produced by minimize()
+        - symbol_classes: SymbolClasses : the equivalence classes of the alphabet, the columns of the transition table
+    '''
+
+    def __init__(self, num_states, alphabet, accept_states, trans_func, minimization_stats=None):
+        '''
+        initialize the DFA object
+        '''
+        self._num_states = num_states
+        self._alphabet = alphabet
+        self._accept_states = accept_states
+        self._trans_func = trans_func
+        self._minimization_stats = minimization_stats
+
+        # one row per state so that matching is a single dict lookup per character
+        self._rows = [{} for _ in range(num_states)]
+        for (src, sym), dest in trans_func.items():
+            self._rows[src][sym] = dest
+
+        # SymbolClasses and flat class-indexed transition table, computed on first use
+        self._classes = None
+        self._table = None
+
+    @property
+    def start_state(self):
+        '''
+        return the start state of the DFA
+        '''
+        return 0
+
+    @property
+    def alphabet(self):
+        '''
+        return the alphabet of the DFA
+        '''
+        return self._alphabet
+
+    @property
+    def accept_states(self):
+        '''
+        return the accept states of the DFA
+        '''
+        return self._accept_states
+
+    @property
+    def trans_func(self):
+        '''
+        return the transition map/ function of the DFA
+        '''
+        return self._trans_func
+
+    @property
+    def states(self):
+        '''
+        return the states of the DFA
+        '''
+        return set(range(self._num_states))
+
+    @property
+    def minimization_stats(self):
+        '''
+        return the MinimizationStats of the DFA, or None if it was not produced by minimize()
+        '''
+        return self._minimization_stats
+
+    @property
+    def symbol_classes(self):
+        '''
+        return the SymbolClasses of the alphabet of the DFA
+        '''
+        if self._classes is None:
+            self._classes = symbol_classes(self)
+
+        return self._classes
+
+    @property
+    def table(self):
+        '''
+        return the transition table of the DFA as a flat array('i') with one row per state and one column per symbol class: the next state of s on
+        a character of class c is table[s * num_classes + c], DEAD if there is none. The DEAD_CLASS column is all DEAD
+        '''
+        if self._table is None:
+            classes = self.symbol_classes
+            num_classes = classes.num_classes
+            table = array('i', [DEAD]) * (self._num_states * num_classes)
+
+            for (src, sym), dest in self._trans_func.items():
+                table[src * num_classes + classes.class_of[sym]] = dest
+
+            self._table = table
+
+        return self._table
+
+    def minimize(self):
+        '''
+        return the minimal DFA equivalent to the DFA, built with Hopcroft's algorithm (see hopcroft_minimize)
+        '''
+        return hopcroft_minimize(self)
+
+    def get_next_state(self, curr_state, curr_char):
+        '''
+        return the next state id of curr_state, given the input curr_char. Return None if there is no defined transition (the input is rejected)
+        '''
+        return self._rows[curr_state].get(curr_char)
+
+    def match(self, test_str):
+        '''
+        return True if the DFA accepts test_str, return False otherwise
+        '''
+        rows = self._rows
+        state = 0
+
+        for ch in test_str:
+            state = rows[state].get(ch)
+
+            if state is None:
+                return False
+
+        return state in self._accept_states
+
+    def __repr__(self):
+        '''
+        return a string representation of the DFA
+        '''
+        lines = []
+        lines.append(f"States: {self.states}")
+        lines.append(f"Starting states: {self.start_state}")
+        lines.append(f"Accepting states: {self._accept_states}")
+
+        for (src, symbol), dest in self._trans_func.items():
+            lines.append(f"  {src} --{symbol}--> {dest}")
+
+        return "\n".join(lines)
+
+class TableDFA:
+    '''
+    TableDFA class
+
+    A read-only DFA that matches straight from a flat class-indexed transition table (see DFA.table), without per-state rows. The table can be any
+    int sequence, e.g. a memoryview over a memory-mapped file (see serialize.load), so loading it costs no copy
+
+    Attributes:
+        - num_states: Int : number of states, numbered from 0 (the start state)
+        - symbol_classes: SymbolClasses : the columns of the table
+        - table: Sequence[Int] : the num_states x num_classes transition table, DEAD for missing transitions
+        - accept_states: Sequence[Int] : ids of the accept states
+    '''
+
+    def __init__(self, num_states, symbol_classes, table, accept_states):
+        '''
+        initialize the TableDFA object
+        '''
+        if len(table) != num_states * symbol_classes.num_classes:
+            raise ValueError("table size does not match the number of states and classes")
+
+        self._num_states = num_states
+        self._classes = symbol_classes
+        self._table = table
+        self._accept_states = frozenset(accept_states)
+
+    @classmethod
+    def from_dfa(cls, dfa):
+        '''
+        return the TableDFA of dfa
+        '''
+        return cls(len(dfa.states), dfa.symbol_classes, dfa.table, dfa.accept_states)
+
+    @property
+    def start_state(self):
+        return 0
+
+    @property
+    def alphabet(self):
+        return set(self._classes.class_of)
+
+    @property
+    def accept_states(self):
+        return set(self._accept_states)
+
+    @property
+    def states(self):
+        return set(range(self._num_states))
+
+    @property
+    def symbol_classes(self):
+        return self._classes
+
+    @property
+    def table(self):
+        return self._table
+
+    @property
+    def trans_func(self):
+        '''
+        return the transition map of the DFA, in the same Dict{(Int, Symbol) : Int} form as DFA.trans_func. The dict is rebuilt on every access
+        '''
+        num_classes = self._classes.num_classes
+        trans_func = {}
+
+        for src in range(self._num_states):
+            for sym, class_id in sorted(self._classes.class_of.items()):
+                dest = self._table[src * num_classes + class_id]
+
+                if dest != DEAD:
+                    trans_func[(src, sym)] = dest
+
+        return trans_func
+
+    def to_dfa(self):
+        '''
+        return the DFA with the same transitions, with per-state rows for the fastest matching
+        '''
+        return DFA(self._num_states, self.alphabet, set(self._accept_states), self.trans_func)
+
+    def get_next_state(self, curr_state, curr_char):
+        '''
+        return the next state id of curr_state, given the input curr_char. Return None if there is no defined transition (the input is rejected)
+        '''
+        dest = self._table[curr_state * self._classes.num_classes + self._classes.lookup(curr_char)]
+
+        return dest if dest != DEAD else None
+
+    def match(self, test_str):
+        '''
+        return True if the DFA accepts test_str, return False otherwise
+        '''
+        table = self._table
+        num_classes = self._classes.num_classes
+        state = 0
+
+        for class_id in map(self._classes.class_of.get, test_str, repeat(DEAD_CLASS)):
+            state = table[state * num_classes + class_id]
+
+            if state == DEAD:
+                return False
+
+        return state in self._accept_states
+
+    def __repr__(self):
+        return f"TableDFA(states={self._num_states}, classes={self._classes.num_classes}, accept_states={sorted(self._accept_states)})"
+
+def subset_construction(nfa):
+    '''
+    return the DFA equivalent to nfa, built with the subset construction
+
+    Only the subsets reachable from the start state are created. States are numbered in breadth-first order with symbols visited in sorted order, so the same NFA always produces the same DFA
+    '''
+
+    edges = _symbol_edges(nfa)
+
+    start_set = frozenset(nfa.get_epsilon_closure({nfa.start_state}))
+    ids = {start_set: 0}
+    worklist = deque([start_set])
+
+    accept_states = set()
+    trans_func = {}
+
+    while worklist:
+        curr_set = worklist.popleft()
+        curr_id = ids[curr_set]
+
+        if not nfa.accept_states.isdisjoint(curr_set):
+            accept_states.add(curr_id)
+
+        moves = _move(edges, curr_set)
+
+        for sym in sorted(moves):
+            next_set = frozenset(nfa.get_epsilon_closure(moves[sym]))
+
+            if next_set not in ids:
+                ids[next_set] = len(ids)
+                worklist.append(next_set)
+
+            trans_func[(curr_id, sym)] = ids[next_set]
+
+    return DFA(len(ids), set(nfa.alphabet), accept_states, trans_func)
+
+def hopcroft_minimize(dfa):
+    '''
+    return the minimal DFA equivalent to dfa, with its MinimizationStats
+
+    The states are split with Hopcroft's partition refinement: starting from {accepting, non-accepting}, a worklist of (splitter block, symbol) pairs
+    refines every block whose states disagree on whether the symbol leads into the splitter. Only the smaller half of a split is queued, which gives the
+    O(k n log n) bound. Missing transitions go to an implicit dead state, whose block is dropped from the result together with every state that
+    cannot reach an accept state
+    '''
+
+    num_states = dfa._num_states
+    symbols = sorted(dfa.alphabet)
+    dead = num_states
+
+    # inverse[sym][dest] = the states that move to dest on sym, with missing transitions sent to the dead state
+    inverse = {sym: [[] for _ in range(num_states + 1)] for sym in symbols}
+
+    for sym in symbols:
+        for src in range(num_states + 1):
+            dest = dfa.get_next_state(src, sym) if src != dead else None
+            inverse[sym][dead if dest is None else dest].append(src)
+
+    accepting = set(dfa.accept_states)
+    rejecting = set(range(num_states + 1)) - accepting
+
+    blocks = [set(block) for block in (accepting, rejecting) if block]
+    block_of = [0] * (num_states + 1)
+    for i, block in enumerate(blocks):
+        for s in block:
+            block_of[s] = i
+
+    smallest = min(range(len(blocks)), key=lambda i: len(blocks[i]))
+    worklist = {(smallest, sym) for sym in symbols}
+
+    while worklist:
+        splitter, sym = worklist.pop()
+
+        # the states that move into the splitter on sym, grouped by their block
+        touched = {}
+        for dest in blocks[splitter]:
+            for src in inverse[sym][dest]:
+                touched.setdefault(block_of[src], []).append(src)
+
+        for i, movers in touched.items():
+            if len(movers) == len(blocks[i]):
+                continue
+
+            # split block i into the movers and the rest, keeping the larger part under index i
+            new_block = set(movers)
+            blocks[i] -= new_block
+
+            if len(new_block) > len(blocks[i]):
+                blocks[i], new_block = new_block, blocks[i]
+
+            j = len(blocks)
+            blocks.append(new_block)
+            for s in new_block:
+                block_of[s] = j
+
+            for c in symbols:
+                # (i, c) still refines with the larger part, so only the smaller part needs queuing
+                worklist.add((j, c))
+
+    # the block of the dead state, and every state equivalent to it, is dropped
+    dead_block = block_of[dead]
+
+    # number the remaining blocks in breadth-first order from the start block
+    ids = {block_of[0]: 0}
+    queue = deque([block_of[0]])
+    trans_func = {}
+    accept_states = set()
+
+    while queue:
+        block = queue.popleft()
+        representative = next(iter(blocks[block]))
+
+        if representative in accepting:
+            accept_states.add(ids[block])
+
+        for sym in symbols:
+            dest = dfa.get_next_state(representative, sym)
+
+            if dest is None or block_of[dest] == dead_block:
+                continue
+
+            if block_of[dest] not in ids:
+                ids[block_of[dest]] = len(ids)
+                queue.append(block_of[dest])
+
+            trans_func[(ids[block], sym)] = ids[block_of[dest]]
+
+    if block_of[0] == dead_block:
+        # the DFA accepts nothing: keep the start state alone
+        ids = {dead_block: 0}
+        trans_func = {}
+
+    return DFA(len(ids), set(dfa.alphabet), accept_states, trans_func, MinimizationStats(num_states, len(ids)))
+
+class LazyDFA:
+    '''
+    LazyDFA class
+
+    A DFA whose states are built on demand while matching. Each DFA state is the epsilon-closed set of NFA states it stands for. Once a transition
+    has been computed it is cached, so a warm match costs one class lookup and one list read per character
+
+    Transitions are cached per symbol class (see SymbolClasses) rather than per character: every character of a class is computed once for all,
+    and a character outside the alphabet falls into the DEAD_CLASS column, which is DEAD from the start
+
+    The cache holds at most max_states DFA states. When it is full it is flushed as a whole and rebuilt from the state the matcher is currently in,
+    which bounds the memory used by patterns whose full DFA would blow up. Given max_memory, the cache is also flushed once the bytes of the state
+    sets and rows it holds (see memory_usage) reach max_memory
+
+    A LazyDFA can be shared between threads: cache misses are computed under a lock, and every match works on one generation of the cache, so a
+    flush by another thread never invalidates the state ids it holds
+    '''
+
+    def __init__(self, nfa, max_states=DEFAULT_CACHE_SIZE, max_memory=None):
+        '''
+        initialize the LazyDFA object
+
+        nfa: NFA: the automaton to determinize
+        max_states: Int: maximum number of DFA states kept in the cache
+        max_memory: Int: if given, maximum number of bytes of the cache (see memory_usage). A flushed cache always holds up to three states
+        '''
+
+        # after a flush the cache holds the start state, the current state and its successor
+        if max_states < 3:
+            raise ValueError("max_states must be at least 3")
+
+        self._nfa = nfa
+        self._classes = symbol_classes(nfa)
+        self._edges = _symbol_edges(nfa)
+        self._max_states = max_states
+        self._max_memory = max_memory
+
+        # bytes of the transition row of one state, with the int objects of the ids it can hold
+        num_classes = self._classes.num_classes
+        self._row_size = sys.getsizeof([None] * num_classes) + num_classes * _ID_SIZE
+        self._start_set = frozenset(nfa.get_epsilon_closure({nfa.start_state}))
+        self._accept_states = frozenset(nfa.accept_states)
+        self._lock = threading.Lock()
+
+        # number of times the cache was full and had to be flushed
+        self.flushes = 0
+
+        self._reset_cache()
+
+    def __getstate__(self):
+        # the lock cannot be pickled, and the cache is cheaper to rebuild than to ship
+        return (self._nfa, self._max_states, self._max_memory)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def cache_size(self):
+        '''
+        return the number of DFA states currently in the cache
+        '''
+        return len(self._cache[1])
+
+    @property
+    def max_states(self):
+        '''
+        return the maximum number of DFA states kept in the cache
+        '''
+        return self._max_states
+
+    @property
+    def max_memory(self):
+        '''
+        return the maximum number of bytes of the cache, or None if it is only bounded by max_states
+        '''
+        return self._max_memory
+
+    def memory_usage(self):
+        '''
+        return an estimate of the number of bytes held by the cache: its state sets and transition rows
+        '''
+        return self._memory
+
+    def _full(self):
+        '''
+        return True if no state can be added to the cache without going over max_states or max_memory
+        '''
+        return len(self._cache[1]) >= self._max_states or (self._max_memory is not None and self._memory >= self._max_memory)
+
+    def _reset_cache(self):
+        '''
+        drop every cached DFA state and transition, the start state is re-added with id 0
+        '''
+
+        # (Dict{FrozenSet[Int] : Int}, List[FrozenSet[Int]], List[List[Int]], List[Bool]) : the id of every cached state set, and the state set,
+        # the transition row (indexed by class id, None if not computed yet) and the acceptance of every id. The four are swapped together so
+        # readers always see one generation
+        self._cache = ({}, [], [], [])
+        self._memory = 0
+
+        self._add_state(self._start_set)
+
+    def _add_state(self, state_set):
+        '''
+        add state_set to the cache as a new DFA state and return its id
+        '''
+        ids, sets, rows, accepting = self._cache
+        state_id = len(sets)
+
+        ids[state_set] = state_id
+        sets.append(state_set)
+        rows.append([DEAD] + [None] * (self._classes.num_classes - 1))
+        accepting.append(not self._accept_states.isdisjoint(state_set))
+        self._memory += sys.getsizeof(state_set) + self._row_size + _STATE_OVERHEAD
+
+        return state_id
+
+    def _intern(self, state_set, flush):
+        '''
+        return the id of state_set in the cache, adding it if needed. If flush is True and the cache is full, it is flushed before adding
+        '''
+        state_id = self._cache[0].get(state_set)
+
+        if state_id is None:
+            if flush and self._full():
+                self.flushes += 1
+                self._reset_cache()
+
+                return self._intern(state_set, False)
+
+            state_id = self._add_state(state_set)
+
+        return state_id
+
+    def _compute(self, curr_set, cls):
+        '''
+        compute and cache the DFA state reached from the state set curr_set on a character of the class cls. Return its id (DEAD if no NFA state is reachable), together with
+        the generation of the cache the id belongs to
+        '''
+
+        ch = self._classes.representatives[cls]
+
+        next_states = set()
+        for s in curr_set:
+            for sym, dests in self._edges.get(s, ()):
+                if sym == ch:
+                    next_states |= dests
+
+        next_set = frozenset(self._nfa.get_epsilon_closure(next_states)) if next_states else None
+
+        with self._lock:
+            # curr_set may have been dropped by a flush in another thread
+            state = self._intern(curr_set, True)
+
+            if next_set is None:
+                next_id = DEAD
+            else:
+                next_id = self._cache[0].get(next_set)
+
+                if next_id is None:
+                    if self._full():
+                        # the cache is full: flush it and carry on from the current state
+                        self.flushes += 1
+                        self._reset_cache()
+                        state = self._intern(curr_set, False)
+
+                    next_id = self._intern(next_set, False)
+
+            self._cache[2][state][cls] = next_id
+
+            return next_id, self._cache
+
+    @property
+    def start_set(self):
+        '''
+        return the set of NFA states of the start state (the epsilon closure of the NFA start state)
+        '''
+        return self._start_set
+
+    def is_accepting_set(self, state_set):
+        '''
+        return True if the set of NFA states state_set contains an accept state
+        '''
+        return not self._accept_states.isdisjoint(state_set)
+
+    def advance(self, state_set, text):
+        '''
+        return the set of NFA states reached from the epsilon-closed set state_set after consuming text, an empty frozenset if the input is dead
+        '''
+        if not state_set:
+            return frozenset()
+
+        with self._lock:
+            state = self._intern(frozenset(state_set), True)
+            _, sets, rows, _ = self._cache
+
+        for cls in map(self._classes.class_of.get, text, repeat(DEAD_CLASS)):
+            next_state = rows[state][cls]
+
+            if next_state is None:
+                next_state, (_, sets, rows, _) = self._compute(sets[state], cls)
+
+            if next_state == DEAD:
+                return frozenset()
+
+            state = next_state
+
+        return sets[state]
+
+    def match(self, test_str):
+        '''
+        return True if the NFA accepts test_str, return False otherwise
+        '''
+        _, sets, rows, accepting = self._cache
+        state = 0
+
+        for cls in map(self._classes.class_of.get, test_str, repeat(DEAD_CLASS)):
+            next_state = rows[state][cls]
+
+            if next_state is None:
+                # the cache may have been flushed, continue in the generation the new id belongs to
+                next_state, (_, sets, rows, accepting) = self._compute(sets[state], cls)
+
+            if next_state == DEAD:
+                return False
+
+            state = next_state
+
+        return accepting[state]
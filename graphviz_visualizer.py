@@ -18,13 +18,13 @@ def visualize_nfa_graphviz(nfa, filename="nfa_gv"):
     for state in nfa.states:
         if state == nfa.start_state:
             dot.node(str(state), shape="circle", style="filled", fillcolor="#98FB98", label=f"Start\n{state}")
-        elif state == nfa.accept_state:
+        elif state in nfa.accept_states:
             dot.node(str(state), shape="doublecircle", style="filled", fillcolor="#FFB6C1", label=f"Accept\n{state}")
         else:
             dot.node(str(state), shape="circle", label=str(state))
 
     # Add transitions
-    for (src, symbol), dests in nfa._trans_func.items():
+    for (src, symbol), dests in nfa.trans_func.items():
         for dest in dests:
             # label = "ε" if symbol == "@" else symbol
             style = "dashed" if symbol == "@" else "solid"
@@ -0,0 +1,154 @@
+'''
+Opt-in engine instrumentation
+
+Inside a collect() block, the parser, the Thompson construction and the NFA simulation report into an EngineStats object: wall time per phase,
+the size of the built NFA, the number of epsilon-closure computations, the number of states expanded for every input character and the peak size
+of the active set.
+
+    with instrument.collect() as stats:
+        parse_regex("(a|b)*abb").to_nfa().match("abaabb")
+    print(stats)
+
+Outside a collect() block every hook is a single context variable read per call, so the disabled path costs close to nothing. The collector is
+held in a ContextVar, so concurrent threads and tasks each see their own.
+'''
+
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import time
+
+# parse_regex, Regex.to_nfa / ThompsonBuilder.to_nfa, NFA._build_closure_index and NFA.match / trace_match
+PHASES = ("parse", "construct", "closure_index", "simulate")
+
+_current = ContextVar("instrument_stats", default=None)
+
+class EngineStats:
+    '''
+    EngineStats class
+
+    The measurements collected inside a collect() block. Times are accumulated over every call of a phase
+
+    Attributes:
+        - phase_times: Dict{Str : Float} : wall time in seconds spent in every phase
+        - phase_calls: Dict{Str : Int} : number of calls of every phase
+        - nfa_states: Int : number of states of the last NFA built
+        - nfa_edges: Int : number of edges (epsilon-edges included) of the last NFA built
+        - closure_computations: Int : number of get_epsilon_closure calls
+        - expansions: array[Int] : for every input character simulated, the number of active states expanded to consume it
+        - peak_active_states: Int : largest active set seen during simulation
+        - callback: Callable : called as callback(phase, seconds, stats) at the end of every timed phase, if not None
+    '''
+
+    def __init__(self, callback=None):
+        '''
+        initialize the EngineStats object
+        '''
+        self.phase_times = {}
+        self.phase_calls = {}
+        self.nfa_states = 0
+        self.nfa_edges = 0
+        self.closure_computations = 0
+        self.expansions = array('l')
+        self.peak_active_states = 0
+        self.callback = callback
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        context manager that adds the wall time of its block to the phase name
+        '''
+        start = time.perf_counter()
+
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + seconds
+            self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+
+            if self.callback is not None:
+                self.callback(name, seconds, self)
+
+    def record_nfa(self, states, edges):
+        '''
+        record the size of a newly built NFA
+        '''
+        self.nfa_states = states
+        self.nfa_edges = edges
+
+    def record_step(self, expanded, active):
+        '''
+        record one simulated character: expanded states were expanded to consume it, and active states are active after it
+        '''
+        self.expansions.append(expanded)
+
+        if active > self.peak_active_states:
+            self.peak_active_states = active
+
+    def record_active(self, active):
+        '''
+        record the size of an active set that was not produced by a step (the start closure)
+        '''
+        if active > self.peak_active_states:
+            self.peak_active_states = active
+
+    @property
+    def characters(self):
+        '''
+        return the number of input characters simulated
+        '''
+        return len(self.expansions)
+
+    def __repr__(self):
+        lines = ["EngineStats:"]
+
+        for name in sorted(self.phase_times, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            lines.append(f"  {name}: {self.phase_times[name] * 1000:.3f} ms in {self.phase_calls[name]} calls")
+
+        lines.append(f"  nfa: {self.nfa_states} states, {self.nfa_edges} edges")
+        lines.append(f"  closure computations: {self.closure_computations}")
+        lines.append(f"  characters: {self.characters}, expansions: {sum(self.expansions)}, peak active states: {self.peak_active_states}")
+
+        return "\n".join(lines)
+
+def current():
+    '''
+    return the EngineStats of the enclosing collect() block, or None when instrumentation is off
+    '''
+    return _current.get()
+
+@contextmanager
+def collect(stats=None, callback=None):
+    '''
+    context manager that turns instrumentation on for its block and yields the EngineStats collecting into (stats, or a new one with callback)
+    '''
+    if stats is None:
+        stats = EngineStats(callback)
+
+    token = _current.set(stats)
+
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def timed(phase):
+    '''
+    decorator that accounts the calls of the decorated function to phase when instrumentation is on
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = _current.get()
+
+            if stats is None:
+                return function(*args, **kwargs)
+
+            with stats.phase(phase):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,253 @@
+'''
+In-process layered layout of NFAs
+
+A pure-Python alternative to the Graphviz dot engine for the visualizer, with no subprocess and a running time linear in the size of the NFA.
+It returns the same {'nodes': ..., 'edges': ...} form as web_visualizer.graphviz_layout, with states on ranks left to right.
+
+The Thompson NFA of a pattern is laid out from the construction itself: every AST node gets a box of ranks x bands, built from the boxes of its
+children. Concat puts them side by side, Union stacks its branches in nested bands below each other, and Star moves its body one band below
+the skip edge. Any other NFA (optimized, loaded from a file, ...) is laid out by plain layering: the rank of a state is its longest forward
+distance from the start state and the states of a rank are stacked in depth-first order.
+'''
+
+from array import array
+
+from regex import Regex, ThompsonBuilder, Concat, Union, Star
+from parser import parse_regex
+
+# distance between two ranks and between two bands, in the inch units of Graphviz
+RANK_SEP = 1.2
+BAND_SEP = 1.0
+
+class _ThompsonLayoutBuilder(ThompsonBuilder):
+    '''
+    ThompsonBuilder that lays out every fragment as it is built
+
+    The layout of the sub-NFA of an AST node is a box in a local grid of ranks x bands, with its start state at (0, 0) and its accept state at
+    (width, 0). Boxes are numbered in construction (post-)order, so a box is numbered after its children, and stored in flat arrays: its size,
+    and its parent with its offset in the parent box. The states placed by a box are stored the same way. Nothing but ints is allocated per node,
+    which keeps the garbage collector out of large builds
+    '''
+
+    def __init__(self):
+        super().__init__()
+
+        self._widths = array('l')
+        self._heights = array('l')
+        self._parents = array('l')
+        self._offsets = array('l')
+
+        # the (state, box, rank, band) of every state placed, flattened
+        self._placed = array('l')
+
+        # numbers of the boxes of the built children, in the order of the fragments of ThompsonBuilder.build
+        self._pending = []
+
+    def _new_box(self, width, height, fragment, children=()):
+        '''
+        add a box of width x height placing the states of fragment, with the (box, rank, band) children, and push it on the pending boxes
+        '''
+        box = len(self._widths)
+        self._widths.append(width)
+        self._heights.append(height)
+        self._parents.append(-1)
+        self._offsets.extend((0, 0))
+
+        if fragment is not None:
+            start, accept = fragment
+            self._placed.extend((start, box, 0, 0, accept, box, width, 0))
+
+        for child, rank, band in children:
+            self._parents[child] = box
+            self._offsets[2 * child] = rank
+            self._offsets[2 * child + 1] = band
+
+        self._pending.append(box)
+
+    def _on_fragment(self, node, fragment):
+        pending = self._pending
+        widths = self._widths
+        heights = self._heights
+
+        if isinstance(node, Concat):
+            right = pending.pop()
+            left = pending.pop()
+
+            # one rank for the epsilon-edge between them
+            self._new_box(widths[left] + 1 + widths[right], max(heights[left], heights[right]), None,
+                          ((left, 0, 0), (right, widths[left] + 1, 0)))
+
+        elif isinstance(node, Union):
+            right = pending.pop()
+            left = pending.pop()
+
+            # the left branch runs on the band of the start and accept states, the right one below it
+            self._new_box(max(widths[left], widths[right]) + 2, heights[left] + heights[right], fragment,
+                          ((left, 1, 0), (right, 1, heights[left])))
+
+        elif isinstance(node, Star):
+            body = pending.pop()
+
+            # the skip edge keeps the band of the start and accept states, the body and its back edge go one band below
+            self._new_box(widths[body] + 2, heights[body] + 1, fragment, ((body, 1, 1),))
+
+        else:
+            # Literal, CharClass, Epsilon: a single edge
+            self._new_box(1, 1, fragment)
+
+    def positions(self):
+        '''
+        return {state: (rank, band)} for the NFA built last
+        '''
+        parents = self._parents
+        offsets = self._offsets
+
+        # absolute position of every box, parents first
+        origins = array('l', bytes(offsets.itemsize * len(offsets)))
+
+        for box in range(len(parents) - 1, -1, -1):
+            parent = parents[box]
+
+            if parent >= 0:
+                origins[2 * box] = origins[2 * parent] + offsets[2 * box]
+                origins[2 * box + 1] = origins[2 * parent + 1] + offsets[2 * box + 1]
+
+        placed = self._placed
+
+        return {placed[i]: (origins[2 * placed[i + 1]] + placed[i + 2], origins[2 * placed[i + 1] + 1] + placed[i + 3])
+                for i in range(0, len(placed), 4)}
+
+def thompson_positions(regex):
+    '''
+    return (nfa, positions): the Thompson NFA of regex (a Str or a Regex AST), and {state: (rank, band)} for all its states
+    '''
+    if not isinstance(regex, Regex):
+        regex = parse_regex(regex)
+
+    builder = _ThompsonLayoutBuilder()
+    nfa = builder.to_nfa(regex)
+
+    return nfa, builder.positions()
+
+def layered_positions(nfa, trans_func=None):
+    '''
+    return {state: (rank, band)} for all the states of any NFA
+
+    The back edges are found by an iterative depth-first search from the start state, then from the unreached states in id order. The rank of a
+    state is its longest distance from a root over the other edges, and the states of a rank get the bands 0, 1, ... in depth-first order
+    '''
+    trans_func = nfa.trans_func if trans_func is None else trans_func
+
+    successors = {}
+    for (src, sym), dests in trans_func.items():
+        successors.setdefault(src, []).extend(sorted(dests))
+
+    state_ids = sorted(nfa.states)
+    roots = [nfa.start_state] + state_ids
+
+    preorder = []
+    postorder = []
+    back_edges = set()
+    visited = set()
+    on_stack = set()
+
+    for root in roots:
+        if root in visited:
+            continue
+
+        visited.add(root)
+        on_stack.add(root)
+        preorder.append(root)
+        work = [(root, iter(successors.get(root, ())))]
+
+        while work:
+            state, children = work[-1]
+
+            for child in children:
+                if child in on_stack:
+                    back_edges.add((state, child))
+                elif child not in visited:
+                    visited.add(child)
+                    on_stack.add(child)
+                    preorder.append(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    break
+            else:
+                work.pop()
+                on_stack.discard(state)
+                postorder.append(state)
+
+    # longest path over the forward edges, in topological order
+    ranks = dict.fromkeys(state_ids, 0)
+
+    for state in reversed(postorder):
+        rank = ranks[state] + 1
+
+        for child in successors.get(state, ()):
+            if (state, child) not in back_edges and ranks[child] < rank:
+                ranks[child] = rank
+
+    positions = {}
+    bands = {}
+
+    for state in preorder:
+        rank = ranks[state]
+        band = bands.get(rank, 0)
+        bands[rank] = band + 1
+        positions[state] = (rank, band)
+
+    return positions
+
+def _matching_ids(built, nfa, edges):
+    '''
+    return {state of built: state of nfa} if the two NFAs have the same structure once their states are matched by rank of id, None otherwise
+    '''
+    built_ids = sorted(built.states)
+    nfa_ids = sorted(nfa.states)
+
+    if len(built_ids) != len(nfa_ids):
+        return None
+
+    to_nfa = dict(zip(built_ids, nfa_ids))
+    built_edges = {(to_nfa[src], sym, to_nfa[dest]) for (src, sym), dests in built.trans_func.items() for dest in dests}
+
+    if built_edges != set(edges) or to_nfa[built.start_state] != nfa.start_state:
+        return None
+
+    return to_nfa
+
+def layered_layout(nfa, edges, regex=None):
+    '''
+    Lay the NFA out in process
+
+    edges is the edge index of the NFA (see layout_cache.canonical_key). If regex (a Str or a Regex AST) is given and nfa is its Thompson NFA,
+    with any state numbering, the layout follows the construction; otherwise the NFA is layered from its edges
+
+    return the layout as {'nodes': {name: [x, y]}, 'edges': {edge id: [x₁, y₁, .., xₙ, yₙ]}}, in the units and orientation of graphviz_layout.
+    Only the edges that do not go forward get points, a control point half a band above them so they do not run over the edges they go back along
+    '''
+    positions = None
+
+    if regex is not None:
+        built, built_positions = thompson_positions(regex)
+        to_nfa = _matching_ids(built, nfa, edges)
+
+        if to_nfa is not None:
+            positions = {to_nfa[state]: position for state, position in built_positions.items()}
+
+    if positions is None:
+        positions = layered_positions(nfa)
+
+    nodes = {str(state): [rank * RANK_SEP, -band * BAND_SEP] for state, (rank, band) in positions.items()}
+    edge_points = {}
+
+    for edge_id, (src, sym, dest) in enumerate(edges):
+        if src == dest:
+            continue
+
+        (x1, y1), (x2, y2) = nodes[str(src)], nodes[str(dest)]
+
+        if x2 <= x1:
+            edge_points[edge_id] = [x1, y1, (x1 + x2) / 2, max(y1, y2) + BAND_SEP / 2, x2, y2]
+
+    return {'nodes': nodes, 'edges': edge_points}
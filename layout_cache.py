@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# default number of layouts kept in memory
+DEFAULT_LAYOUT_CACHE_SIZE = 256
+
+# default number of layout files kept in the disk tier
+DEFAULT_LAYOUT_DISK_SIZE = 4096
+
+def canonical_key(nfa, trans_func=None):
+    '''
+    return (key, ids, edges): a hex digest of the structure of nfa, the sorted list of its state ids, and its edge index
+
+    The states are renamed to their rank in ids before hashing, so two NFAs that only differ by their state numbering (e.g. the same pattern built
+    with another StateIDGenerator) share a key. A layout stored under the key with states given by rank can be reused by both
+
+    The edge index lists every (src, symbol, dest) edge of nfa once, sorted by (rank of src, symbol, rank of dest). The position of an edge in it
+    is a stable edge id: the same for every NFA with the same key
+
+    trans_func: the transition map of nfa, if the caller already bound it
+    '''
+    trans_func = nfa.trans_func if trans_func is None else trans_func
+    ids = sorted(nfa.states)
+    rank = {s: i for i, s in enumerate(ids)}
+
+    ranked_edges = sorted((rank[src], sym, rank[dest]) for (src, sym), dests in trans_func.items() for dest in dests)
+    structure = (len(ids), rank[nfa.start_state], sorted(rank[s] for s in nfa.accept_states), ranked_edges)
+
+    key = hashlib.sha256(json.dumps(structure, ensure_ascii=False).encode("UTF-8")).hexdigest()
+    edges = [(ids[src], sym, ids[dest]) for src, sym, dest in ranked_edges]
+
+    return key, ids, edges
+
+class LayoutCache:
+    '''
+    LayoutCache class
+
+    A two-tier cache of graph layouts keyed by canonical_key. The memory tier is a thread-safe LRU of maxsize entries. The optional disk tier keeps
+    one JSON file per key in directory, written atomically, so several worker processes pointed at the same directory share their layouts; a
+    layout found on disk is promoted to the memory tier. The disk tier holds at most max_files layouts: a read refreshes the modification time of
+    a file, and the files least recently written or read are deleted first, by whichever worker goes over the bound
+
+    Values must be JSON-serializable
+    '''
+
+    def __init__(self, maxsize=DEFAULT_LAYOUT_CACHE_SIZE, directory=None, max_files=DEFAULT_LAYOUT_DISK_SIZE):
+        '''
+        initialize the LayoutCache object
+
+        maxsize: Int: number of layouts kept in memory
+        directory: Str: directory of the disk tier, None to keep layouts in memory only
+        max_files: Int: number of layouts kept in the disk tier
+        '''
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        if max_files < 1:
+            raise ValueError("max_files must be at least 1")
+
+        self._maxsize = maxsize
+        self._directory = directory
+        self._max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self._directory, f"{key}.json")
+
+    def _put_memory(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        '''
+        return the layout stored under key, or None
+        '''
+        with self._lock:
+            value = self._entries.get(key)
+
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self._directory is not None:
+            try:
+                with open(self._path(key), encoding="UTF-8") as f:
+                    value = json.load(f)
+
+                # keep the layouts in use away from eviction
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                value = None
+
+            if value is not None:
+                self._put_memory(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        '''
+        store the layout value under key, in memory and on disk
+        '''
+        self._put_memory(key, value)
+
+        if self._directory is not None:
+            # write to a temporary file and rename it, so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+
+            try:
+                with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, self._path(key))
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            self._evict_files()
+
+    def _evict_files(self):
+        '''
+        delete the least recently used layout files of the disk tier beyond max_files
+        '''
+        files = []
+
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        # deleted by another worker meanwhile
+                        pass
+
+        if len(files) <= self._max_files:
+            return
+
+        files.sort()
+
+        for _, path in files[:len(files) - self._max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        '''
+        drop every layout of the memory tier, the disk tier is kept
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
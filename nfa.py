@@ -1,45 +1,63 @@
+from itertools import count
+
+import instrument
+
+from dfa import LazyDFA, subset_construction, DEFAULT_CACHE_SIZE
+from bitset_nfa import BitsetNFA
+from compact_nfa import CompactNFA
+from search import Searcher
+from stream import StreamMatcher
+
 class StateIDGenerator:
     '''
     StateIDGenerator represents a generator for state id, return a new id for a state everytime get_id() is called
     -> Guarantees each state has a unique id
+
+    Every NFA construction uses its own generator (see regex.ThompsonBuilder), so builds are re-entrant and always number their states from 1.
+    get_new_id draws from an itertools.count, which is atomic, so a generator shared between threads never hands out the same id twice
     '''
     def __init__(self):
-        self._id = 0
+        self._ids = count(1)
 
     def get_new_id(self):
-        self._id += 1
-
-        return self._id
+        return next(self._ids)
     
     def reset_id(self):
-        self._id = 0
-
-global_id_gen = StateIDGenerator()
+        self._ids = count(1)
     
 class NFA: 
     '''
     NFA class
 
-    Since we are using the Thompson's Rule to construct NFA's from a regex, we know for sure that each NFA will have exactly 1 start state and 1 accept state
+    Since we are using the Thompson's Rule to construct NFA's from a regex, we know for sure that each NFA will have exactly 1 start state and 1 accept state.
+    Rewritten NFA's (see optimize.py) may have several accept states: they are given as accept_states, and accept is then None
 
     Attributes:
         - states: Set[Int] : Set of all the state ids
         - alphabet: Set[Str] : The alphabet of the NFA
         - start: Int : Id of the start state
         - accept: Int: Id of the accept state 
+        - accept_states: Set[Int] : Ids of all the accept states, {accept} by default
         - trans_func: Dict{(Int, Symbol) : Set[Int]} : Dictionary that map a pair of state id and symbol in the alphabet to another state (possible the same state)
     '''
 
-    def __init__(self, states={}, alphabet={}, start=0, accept=0, trans_func = {}):
+    def __init__(self, states=None, alphabet=None, start=0, accept=0, trans_func=None, accept_states=None):
         '''
         initialize the NFA object 
         '''
-        self._states = states
-        self._alphabet = alphabet
+        self._states = states if states is not None else set()
+        self._alphabet = alphabet if alphabet is not None else set()
         self._start = start
         self._accept = accept
+        self._accept_states = set(accept_states) if accept_states is not None else {accept}
+
+        self._trans_func = trans_func if trans_func is not None else {}
 
-        self._trans_func = trans_func
+        # lazily-built DFA used by dfa_match, dropped whenever the NFA changes
+        self._lazy_dfa = None
+
+        # Dict{Int : FrozenSet[Int]} : epsilon closure of every state that has epsilon-transitions, built on first use
+        self._closure_index = None
 
     @property
     def start_state(self):
@@ -62,6 +80,13 @@ class NFA:
         '''
         return self._accept
 
+    @property
+    def accept_states(self):
+        '''
+        return the set of all the accept states of the NFA
+        '''
+        return self._accept_states
+
     @property
     def trans_func(self):
         '''
@@ -87,6 +112,7 @@ class NFA:
 
         if not(id in self._states):
             self._states.add(id)
+            self._lazy_dfa = None
         else:
             raise ValueError("State already exists")
 
@@ -97,21 +123,104 @@ class NFA:
 
         return self.trans_func.get((curr_state, curr_char), set())
 
+    @instrument.timed("closure_index")
+    def _build_closure_index(self):
+        '''
+        compute the epsilon closure of every state that has outgoing epsilon-transitions, and store it in self._closure_index
+
+        The epsilon-edges are split into strongly connected components with an iterative Tarjan pass. Tarjan finishes a component only after every
+        component reachable from it, so each closure is the component itself plus the already computed closures of its successors, and all states of
+        an epsilon-cycle (e.g. the loop added by Star) share one closure
+        '''
+
+        eps_edges = {}
+        for (src, sym), dests in self._trans_func.items():
+            if sym == "ε":
+                eps_edges[src] = dests
+
+        index = {}
+        order = {}
+        low = {}
+        scc_stack = []
+        on_stack = set()
+
+        for root in eps_edges:
+            if root in order:
+                continue
+
+            order[root] = low[root] = len(order)
+            scc_stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(eps_edges[root]))]
+
+            while work:
+                state, dests = work[-1]
+                descended = False
+
+                for dest in dests:
+                    if dest not in order:
+                        # visit dest before finishing state
+                        order[dest] = low[dest] = len(order)
+                        scc_stack.append(dest)
+                        on_stack.add(dest)
+                        work.append((dest, iter(eps_edges.get(dest, ()))))
+                        descended = True
+                        break
+                    elif dest in on_stack:
+                        low[state] = min(low[state], order[dest])
+
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[state])
+
+                if low[state] == order[state]:
+                    # state is the root of a component: pop it and compute its closure
+                    members = []
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack.discard(member)
+                        members.append(member)
+                        if member == state:
+                            break
+
+                    closure = set(members)
+                    for member in members:
+                        for dest in eps_edges.get(member, ()):
+                            closure.update(index.get(dest, (dest,)))
+
+                    closure = frozenset(closure)
+                    for member in members:
+                        index[member] = closure
+
+        self._closure_index = index
+
+        return index
+
     def get_epsilon_closure(self, states):
         '''
         return the epsilon closure of states
+
+        The closure of every single state is precomputed once (see _build_closure_index), so this is a union of cached entries
         '''
 
-        stack = list(states)
-        epsilon_closure = set(states)
+        stats = instrument.current()
+        if stats is not None:
+            stats.closure_computations += 1
+
+        index = self._closure_index
+        if index is None:
+            index = self._build_closure_index()
 
-        while (len(stack) > 0):
-            state = stack.pop()
+        epsilon_closure = set(states)
 
-            if (state is not None):
-                new_epsilon_closure = self.trans_func.get((state, "ε"), set())
-                stack += list(new_epsilon_closure)
-                epsilon_closure |= new_epsilon_closure
+        for state in states:
+            closure = index.get(state)
+            if closure is not None:
+                epsilon_closure |= closure
 
         return epsilon_closure
 
@@ -137,6 +246,11 @@ class NFA:
             # The pair key exists, so add dest into its set of next state ids
             self._trans_func[(src, sym)].add(dest)
 
+        self._lazy_dfa = None
+        if sym == "ε":
+            # only epsilon-transitions change the closures
+            self._closure_index = None
+
     def __repr__(self):
         '''
         return a string representation of the NFA
@@ -144,7 +258,7 @@ class NFA:
         lines = []
         lines.append(f"States: {self._states}")
         lines.append(f"Starting states: {self._start}")
-        lines.append(f"Accepting states: {self._accept}")
+        lines.append(f"Accepting states: {self._accept if self._accept is not None else self._accept_states}")
 
         for (src, symbol), dests in self._trans_func.items():
             for d in dests:
@@ -152,13 +266,19 @@ class NFA:
         
         return "\n".join(lines)
 
+    @instrument.timed("simulate")
     def match(self, test_str):
         '''
         return True if the NFA accepts test_str, return False otherwise
         '''
+        stats = instrument.current()
+
         start_state = self.start_state
         curr_states = self.get_epsilon_closure({start_state})
 
+        if stats is not None:
+            stats.record_active(len(curr_states))
+
         for ch in test_str:
             # optional: fail-fast if char not in alphabet
             if ch not in self.alphabet:
@@ -174,19 +294,28 @@ class NFA:
                 return False
 
             # now take epsilon-closure of those destinations only
+            expanded = len(curr_states)
             curr_states = self.get_epsilon_closure(next_states)
 
-        # accept only if accept state is in the final closure
-        return self.accept_state in curr_states
+            if stats is not None:
+                stats.record_step(expanded, len(curr_states))
+
+        # accept only if an accept state is in the final closure
+        return not self._accept_states.isdisjoint(curr_states)
 
 
     def trace_match(self, test_str):
         """
         Generator that yields the set of active states after each character is processed.
         """
+        stats = instrument.current()
+
         curr_states = self.get_epsilon_closure({self.start_state})
         yield curr_states.copy()
 
+        if stats is not None:
+            stats.record_active(len(curr_states))
+
         for ch in test_str:
             if ch not in self.alphabet:
                 yield set()  # empty = dead
@@ -196,7 +325,62 @@ class NFA:
             for s in curr_states:
                 next_states |= self.get_next_state(s, ch)
 
+            expanded = len(curr_states)
             curr_states = self.get_epsilon_closure(next_states)
             yield curr_states.copy()
 
-            
+            if stats is not None:
+                stats.record_step(expanded, len(curr_states))
+
+    def to_dfa(self):
+        '''
+        return the DFA equivalent to the NFA, built with the full subset construction
+        '''
+        return subset_construction(self)
+
+    def lazy_dfa(self, max_states=DEFAULT_CACHE_SIZE):
+        '''
+        return the lazily-populated DFA of the NFA, creating it on first use. The same LazyDFA is returned until the NFA is modified or max_states changes
+        '''
+        if self._lazy_dfa is None or self._lazy_dfa._max_states != max_states:
+            self._lazy_dfa = LazyDFA(self, max_states)
+
+        return self._lazy_dfa
+
+    def dfa_match(self, test_str):
+        '''
+        return True if the NFA accepts test_str, return False otherwise
+
+        Same result as match, but runs on the cached lazy DFA, so repeated matches cost one lookup per character
+        '''
+        return self.lazy_dfa().match(test_str)
+
+    def to_bitset(self):
+        '''
+        return a BitsetNFA matching engine for the NFA. The engine is a snapshot: later changes to the NFA are not reflected in it
+        '''
+        return BitsetNFA(self)
+
+    def freeze(self):
+        '''
+        return the frozen, array-backed CompactNFA form of the NFA
+        '''
+        return CompactNFA.from_nfa(self)
+
+    def stream(self, use_dfa=False):
+        '''
+        return a new StreamMatcher that matches the NFA against an input fed in chunks. If use_dfa is True the chunks go through the cached lazy DFA
+        '''
+        return StreamMatcher(self, self.lazy_dfa() if use_dfa else None)
+
+    def search(self, text, pos=0, endpos=None):
+        '''
+        return the Match of the leftmost-longest occurrence of the NFA's language in text[pos:endpos] (a str, bytes or mmap), or None
+        '''
+        return Searcher(self).search(text, pos, endpos)
+
+    def finditer(self, text, pos=0, endpos=None):
+        '''
+        return an iterator over the Match of every non-overlapping leftmost-longest occurrence of the NFA's language in text[pos:endpos]
+        '''
+        return Searcher(self).finditer(text, pos, endpos)
@@ -0,0 +1,160 @@
+from collections import namedtuple
+
+from nfa import NFA
+
+# state and edge counts of an NFA before and after optimize_nfa
+OptimizationStats = namedtuple("OptimizationStats", ["states_before", "states_after", "edges_before", "edges_after"])
+
+def _count_edges(nfa):
+    '''
+    return the number of edges of nfa
+    '''
+    return sum(len(dests) for dests in nfa.trans_func.values())
+
+def _rebuild(nfa, states, trans_func, start, accept_states):
+    '''
+    return a new NFA with the given parts, keeping only the symbols still used by trans_func in the alphabet
+    '''
+    alphabet = {sym for (_, sym) in trans_func}
+    alphabet.discard("ε")
+
+    accept = next(iter(accept_states)) if len(accept_states) == 1 else None
+
+    return NFA(states, alphabet, start, accept, trans_func, accept_states)
+
+def remove_epsilons(nfa):
+    '''
+    return an NFA without epsilon-transitions that accepts the same language as nfa
+
+    Every state p gets the symbol edges of all the states in its epsilon-closure, and p accepts if its closure contains an accept state. The states
+    that were only reachable through epsilon-edges become unreachable, prune() removes them
+    '''
+    symbol_edges = {}
+    for (src, sym), dests in nfa.trans_func.items():
+        if sym != "ε":
+            symbol_edges.setdefault(src, []).append((sym, dests))
+
+    trans_func = {}
+    accept_states = set()
+
+    for p in nfa.states:
+        closure = nfa.get_epsilon_closure({p})
+
+        if not nfa.accept_states.isdisjoint(closure):
+            accept_states.add(p)
+
+        for q in closure:
+            for sym, dests in symbol_edges.get(q, ()):
+                trans_func.setdefault((p, sym), set()).update(dests)
+
+    return _rebuild(nfa, set(nfa.states), trans_func, nfa.start_state, accept_states)
+
+def prune(nfa):
+    '''
+    return a copy of nfa without the states that are unreachable from the start state or that cannot reach an accept state (dead states)
+    '''
+    successors = {}
+    predecessors = {}
+
+    for (src, sym), dests in nfa.trans_func.items():
+        for dest in dests:
+            successors.setdefault(src, set()).add(dest)
+            predecessors.setdefault(dest, set()).add(src)
+
+    def reach(roots, edges):
+        seen = set(roots)
+        stack = list(roots)
+
+        while stack:
+            for t in edges.get(stack.pop(), ()):
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+
+        return seen
+
+    # the start state is always kept, even if the NFA accepts nothing
+    live = (reach({nfa.start_state}, successors) & reach(nfa.accept_states, predecessors)) | {nfa.start_state}
+
+    trans_func = {}
+    for (src, sym), dests in nfa.trans_func.items():
+        if src in live:
+            kept = dests & live
+            if kept:
+                trans_func[(src, sym)] = set(kept)
+
+    return _rebuild(nfa, live, trans_func, nfa.start_state, nfa.accept_states & live)
+
+def _refine(states, initial_key, edges):
+    '''
+    return a Dict{Int : Int} that maps every state to its block in the coarsest partition of states that refines initial_key and in which states of
+    the same block have the same set of (symbol, block) pairs over edges
+    '''
+    block_of = {}
+    keys = {}
+    for s in states:
+        block_of[s] = keys.setdefault(initial_key(s), len(keys))
+
+    while True:
+        signatures = {}
+        new_block_of = {}
+
+        for s in states:
+            signature = (block_of[s], frozenset((sym, block_of[t]) for sym, t in edges.get(s, ())))
+            new_block_of[s] = signatures.setdefault(signature, len(signatures))
+
+        if len(signatures) == len(set(block_of.values())):
+            return new_block_of
+
+        block_of = new_block_of
+
+def _quotient(nfa, block_of):
+    '''
+    return the NFA obtained by merging the states of nfa that share a block, each block is represented by its smallest state id
+    '''
+    representative = {}
+    for s in sorted(nfa.states):
+        representative.setdefault(block_of[s], s)
+
+    def rep(s):
+        return representative[block_of[s]]
+
+    trans_func = {}
+    for (src, sym), dests in nfa.trans_func.items():
+        trans_func.setdefault((rep(src), sym), set()).update(rep(d) for d in dests)
+
+    return _rebuild(nfa, set(representative.values()), trans_func, rep(nfa.start_state), {rep(s) for s in nfa.accept_states})
+
+def merge_bisimilar(nfa):
+    '''
+    return nfa with its forward-bisimilar and then its backward-bisimilar states merged
+
+    Two states are forward-bisimilar if they agree on acceptance and every edge of one is matched by an edge with the same symbol of the other into
+    the same block; they accept the same suffixes. Backward bisimulation is the same relation over the reversed edges, starting from the
+    start state; those states are reached by the same prefixes. Merging either kind keeps the language
+    '''
+    forward = {}
+    for (src, sym), dests in nfa.trans_func.items():
+        forward.setdefault(src, []).extend((sym, d) for d in dests)
+
+    nfa = _quotient(nfa, _refine(nfa.states, lambda s: s in nfa.accept_states, forward))
+
+    backward = {}
+    for (src, sym), dests in nfa.trans_func.items():
+        for dest in dests:
+            backward.setdefault(dest, []).append((sym, src))
+
+    return _quotient(nfa, _refine(nfa.states, lambda s: s == nfa.start_state, backward))
+
+def optimize_nfa(nfa):
+    '''
+    return a smaller NFA that accepts the same language as nfa, with the OptimizationStats of the rewrite
+
+    The pipeline removes the epsilon-transitions, prunes unreachable and dead states, merges bisimilar states and prunes again. nfa itself is not
+    modified, so the original Thompson NFA can still be shown in teaching views
+    '''
+    optimized = prune(merge_bisimilar(prune(remove_epsilons(nfa))))
+
+    stats = OptimizationStats(len(nfa.states), len(optimized.states), _count_edges(nfa), _count_edges(optimized))
+
+    return optimized, stats
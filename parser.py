@@ -1,71 +1,91 @@
+import instrument
 from regex import Regex, Union, Concat, Literal, Star, Epsilon
 
+class RegexSyntaxError(ValueError):
+    '''
+    Raised by parse_regex for an invalid regex, pos is the index in the pattern where the error was found
+    '''
+
+    def __init__(self, message, pos):
+        super().__init__(f"{message} at position {pos}")
+        self.pos = pos
+
+def _balanced(nodes, operator):
+    '''
+    join nodes, in order, into a balanced tree of the binary operator (Concat or Union), so the depth of the tree is logarithmic in len(nodes)
+    '''
+
+    while len(nodes) > 1:
+        paired = [operator(nodes[i], nodes[i + 1]) for i in range(0, len(nodes) - 1, 2)]
+
+        if len(nodes) % 2 == 1:
+            paired.append(nodes[-1])
+
+        nodes = paired
+
+    return nodes[0]
+
+@instrument.timed("parse")
 def parse_regex(s: str) -> Regex:
-    pos = 0  # shared index
+    '''
+    parse s into a Regex AST
+
+    The parser is iterative: every open group is a frame on an explicit stack that holds the finished alternatives of the group and the factors of the
+    alternative being read. Each character is handled in constant time, so patterns are parsed in linear time with constant stack depth. Runs of
+    factors and alternatives are joined into balanced Concat and Union trees instead of left-deep chains
 
-    def parse_union():
-        # parse the union part
-        nonlocal pos
+    Raise RegexSyntaxError (a ValueError) with the position of the error if s is not a valid regex
+    '''
 
-        node = parse_concat()
+    # a frame is (position of the '(' or None for the whole pattern, alternatives, factors)
+    stack = [(None, [], [])]
 
-        while pos < len(s) and s[pos] == '|':
-            pos += 1
-            right = parse_concat()
-            node = Union(node, right)
+    def close_alternative(pos):
+        # join the factors of the current alternative and move it to the alternatives of the frame
+        _, alternatives, factors = stack[-1]
 
-        return node
+        if not factors:
+            raise RegexSyntaxError("Empty alternative", pos)
 
-    def parse_concat():
-        # parse the concatenation part
-        nonlocal pos
+        alternatives.append(_balanced(factors, Concat))
+        factors.clear()
 
-        node = parse_star()
+    for pos, ch in enumerate(s):
+        if ch == '(':
+            stack.append((pos, [], []))
 
-        while pos < len(s) and s[pos] not in '|)':
-            node = Concat(node, parse_star())
+        elif ch == ')':
+            if len(stack) == 1:
+                raise RegexSyntaxError("Unmatched ')'", pos)
 
-        return node
+            close_alternative(pos)
+            _, alternatives, _ = stack.pop()
+            stack[-1][2].append(_balanced(alternatives, Union))
 
-    def parse_star():
-        # parse the star part
-        nonlocal pos
+        elif ch == '|':
+            close_alternative(pos)
 
-        node = parse_atom()
-        
-        while pos < len(s) and s[pos] == '*':
-            pos += 1
-            node = Star(node)
+        elif ch == '*':
+            factors = stack[-1][2]
 
-        return node
+            if not factors:
+                raise RegexSyntaxError("Nothing to repeat", pos)
 
-    def parse_atom():
-        # parse the literal part
-        nonlocal pos
+            factors[-1] = Star(factors[-1])
 
-        if s[pos] == '(':
-            pos += 1
-            node = parse_union()
-            if pos >= len(s) or s[pos] != ')':
-                raise ValueError(f"Unmatched '(' at position {pos}")
-            pos += 1
-            return node
-        
-        elif s[pos] == "@":
+        elif ch == '@':
             '''
             Use @ instead of epsilon for empty string
             '''
-            pos += 1
-            return Epsilon()
-        
+            stack[-1][2].append(Epsilon())
+
         else:
-            char = s[pos]
-            pos += 1
-            return Literal(char)
+            stack[-1][2].append(Literal(ch))
+
+    if len(stack) > 1:
+        raise RegexSyntaxError("Unmatched '('", stack[-1][0])
 
-    ast = parse_union()
+    close_alternative(len(s))
+    _, alternatives, _ = stack.pop()
 
-    if pos != len(s):
-        raise ValueError(f"Unexpected trailing input at position {pos}")
-    
-    return ast
\ No newline at end of file
+    return _balanced(alternatives, Union)
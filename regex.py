@@ -1,68 +1,234 @@
 from abc import abstractmethod
-from nfa import NFA, global_id_gen
 
-# global_id_gen = StateIDGenerator()
+import instrument
+from nfa import NFA, StateIDGenerator
+
+class ThompsonBuilder:
+    '''
+    ThompsonBuilder appends the states and edges of every sub-NFA into one shared arena (a single states set and a single transition dict), so
+    building the NFA of an AST never copies or merges the sub-NFA's
+
+    The AST is walked with an explicit work stack instead of recursion. Every node is visited twice: _enter runs before its children are built,
+    _exit runs after, with the (start, accept) fragments of its children. Deeply nested patterns therefore never hit the recursion limit
+
+    id_gen is the StateIDGenerator of this build. A fresh one is used by default, so concurrent builds never share state ids
+    '''
+
+    # called as _on_fragment(node, fragment) after every node is built, in post-order. Subclasses that observe the construction set it
+    _on_fragment = None
+
+    def __init__(self, id_gen=None):
+        self._id_gen = id_gen if id_gen is not None else StateIDGenerator()
+        self._states = set()
+        self._alphabet = set()
+        self._trans_func = {}
+
+    def new_state(self):
+        '''
+        add a new state into the arena and return its id
+        '''
+        state = self._id_gen.get_new_id()
+        self._states.add(state)
+
+        return state
+
+    def add_transition(self, src, sym, dest):
+        '''
+        add the transition src --sym--> dest into the arena
+        '''
+        dests = self._trans_func.get((src, sym))
+
+        if dests is None:
+            self._trans_func[(src, sym)] = {dest}
+        else:
+            dests.add(dest)
+
+        if sym != "ε":
+            self._alphabet.add(sym)
+
+    def build(self, regex):
+        '''
+        build the sub-NFA of regex into the arena and return its (start, accept) fragment
+        '''
+
+        # a frame is (node, context, exiting): context is what node._enter returned
+        work = [(regex, None, False)]
+        fragments = []
+        on_fragment = self._on_fragment
+
+        while work:
+            node, context, exiting = work.pop()
+
+            if exiting:
+                children = len(node.children())
+                sub_fragments = fragments[len(fragments) - children:]
+                del fragments[len(fragments) - children:]
+
+                fragment = node._exit(self, context, sub_fragments)
+                fragments.append(fragment)
+
+                if on_fragment is not None:
+                    on_fragment(node, fragment)
+            else:
+                work.append((node, node._enter(self), True))
+
+                # push the children in reverse so that the left-most one is built first
+                for child in reversed(node.children()):
+                    work.append((child, None, False))
+
+        return fragments.pop()
+
+    def _record_size(self):
+        stats = instrument.current()
+
+        if stats is not None:
+            stats.record_nfa(len(self._states), sum(len(dests) for dests in self._trans_func.values()))
+
+    @instrument.timed("construct")
+    def to_nfa(self, regex):
+        '''
+        return the NFA of regex, built into this arena
+        '''
+        start, accept = self.build(regex)
+        self._record_size()
+
+        return NFA(self._states, self._alphabet, start, accept, self._trans_func)
+
+    @instrument.timed("construct")
+    def to_set_nfa(self, regexes):
+        '''
+        return the NFA that joins the sub-NFA's of regexes under a new start state with an epsilon-transition to each of them, in the style of Union,
+        together with the list of the sub-NFA accept states in the order of regexes. The accept states are kept apart, so an accept state tells
+        which regex matched
+        '''
+        start = self.new_state()
+        accepts = []
+
+        for regex in regexes:
+            sub_start, sub_accept = self.build(regex)
+            self.add_transition(start, "ε", sub_start)
+            accepts.append(sub_accept)
+
+        accept = accepts[0] if len(accepts) == 1 else None
+        self._record_size()
+
+        return NFA(self._states, self._alphabet, start, accept, self._trans_func, set(accepts)), accepts
 
 class Regex():
+    '''
+    Base class of the AST nodes
+
+    Nodes compare and hash structurally: two ASTs are equal if they have the same shape, node types and characters. Both are computed with explicit
+    stacks, so they work on ASTs of any depth, and the hash is cached on every node (nodes are never modified after construction)
+    '''
+
+    # cached structural hash, set by __hash__
+    _hash = None
+
     def __init__(self):
         pass
+
+    def children(self):
+        '''
+        return the sub-expressions of the node
+        '''
+        return ()
+
+    def _fields(self):
+        '''
+        return the non-child data of the node that takes part in equality
+        '''
+        return ()
+
+    def __hash__(self):
+        if self._hash is None:
+            # hash the children before their parent, so the parent only combines cached values
+            work = [(self, False)]
+
+            while work:
+                node, children_done = work.pop()
+
+                if node._hash is not None:
+                    continue
+
+                if children_done:
+                    node._hash = hash((type(node).__name__, node._fields(), tuple(child._hash for child in node.children())))
+                else:
+                    work.append((node, True))
+                    work.extend((child, False) for child in node.children())
+
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Regex):
+            return NotImplemented
+
+        pairs = [(self, other)]
+
+        while pairs:
+            a, b = pairs.pop()
+
+            if a is b:
+                continue
+
+            if type(a) is not type(b) or hash(a) != hash(b) or a._fields() != b._fields():
+                return False
+
+            pairs.extend(zip(a.children(), b.children()))
+
+        return True
+
+    def _enter(self, builder):
+        '''
+        called by ThompsonBuilder before the children are built, the return value is passed to _exit
+        '''
+        return None
+
     @abstractmethod
-    def to_nfa():
+    def _exit(self, builder, context, fragments):
+        '''
+        called by ThompsonBuilder after the children are built, with their (start, accept) fragments. Return the fragment of the node
+        '''
         pass
 
+    def to_nfa(self, id_gen=None):
+        '''
+        return the NFA representation of the regex, built with Thompson's rule. States are numbered from 1 unless a StateIDGenerator is given
+        '''
+        return ThompsonBuilder(id_gen).to_nfa(self)
+
 class Concat(Regex):
     '''The concatenation operator'''
 
     def __init__(self, left, right):
         self._left = left
         self._right = right
-    
+
     @property
     def left(self):
-        return self._left   
-    
+        return self._left
+
     @property
     def right(self):
         return self._right
-    
-    def to_nfa(self):
-        '''
-        return the NFA representation of the Concat operation
-        '''
 
-        # get the sub-NFA's
-        left_nfa = self._left.to_nfa()
-        right_nfa = self._right.to_nfa()
+    def children(self):
+        return (self._left, self._right)
 
-        # merge the sub-NFA's alphabets top create the alphabet for the new NFA
-        output_nfa_alphabet = left_nfa.alphabet | right_nfa.alphabet
-
-        # get the transition functions of the sub-NFA's
-        left_nfa_trans_func = left_nfa.trans_func
-        right_nfa_trans_func = right_nfa.trans_func
-
-        # get the start and accept states
-        output_nfa_start_state = left_nfa.start_state
-        output_nfa_accept_state = right_nfa.accept_state
-
-        # obtain the output states set
-        output_nfa_states = {output_nfa_start_state, output_nfa_accept_state} | left_nfa.states | right_nfa.states
-
-        # merge the transition functions of the sub-NFA's to create the transition function of the output NFA
-        output_nfa_trans_func = left_nfa_trans_func | right_nfa_trans_func
-
-        # create output NFA
-        output_nfa = NFA(output_nfa_states, output_nfa_alphabet, output_nfa_start_state, 
-        output_nfa_accept_state, output_nfa_trans_func)
+    def _exit(self, builder, context, fragments):
+        '''
+        build the NFA of the Concat operation from the sub-NFA's
+        '''
+        (left_start, left_accept), (right_start, right_accept) = fragments
 
         # add the epsilon-transition from the left sub-NFA accept state to the right sub-NFA start state)
-        output_nfa.add_transition(left_nfa.accept_state, "ε", right_nfa.start_state)
+        builder.add_transition(left_accept, "ε", right_start)
+
+        return (left_start, right_accept)
 
-        return output_nfa
-    
     def __repr__(self):
         return f"Concat({self._left!r}, {self._right!r})"
-    
+
 class Union(Regex):
     '''
     The union operator
@@ -74,47 +240,40 @@ class Union(Regex):
 
     @property
     def left(self):
-        return self._left   
-    
+        return self._left
+
     @property
     def right(self):
         return self._right
-    
-    def to_nfa(self):
-        '''
-        return the NFA representation of the Union operation
-        '''
-        start_state = global_id_gen.get_new_id()
-        accept_state = global_id_gen.get_new_id()
-        
-        left_nfa = self._left.to_nfa()
-        right_nfa = self._right.to_nfa()
 
-        left_nfa_trans_func = left_nfa.trans_func
-        right_nfa_trans_func = right_nfa.trans_func
+    def children(self):
+        return (self._left, self._right)
 
-        # merge the sub-NFA's states and {start_state, accept_state} to create a new list of the states of NFA
-        output_states = {start_state, accept_state} | left_nfa.states | right_nfa.states
+    def _enter(self, builder):
+        # the new start and accept states are numbered before the sub-NFA's
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
-        # merge the sub-NFA's alphabets top create the alphabet for the new NFA
-        output_nfa_alphabet = left_nfa.alphabet | right_nfa.alphabet
+        return (start_state, accept_state)
 
-        # merge the sub-NFA's transition function to create a new NFA
-        output_nfa_trans_func = left_nfa_trans_func | right_nfa_trans_func
-
-        output_nfa = NFA(output_states, output_nfa_alphabet, start_state, accept_state, output_nfa_trans_func)
+    def _exit(self, builder, context, fragments):
+        '''
+        build the NFA of the Union operation from the sub-NFA's
+        '''
+        start_state, accept_state = context
+        (left_start, left_accept), (right_start, right_accept) = fragments
 
         # add epsilon transition from output_nfa start state to the start states of left_nfa and right_nfa
-        output_nfa.add_transition(start_state, "ε", left_nfa.start_state)
-        output_nfa.add_transition(start_state, "ε", right_nfa.start_state)
+        builder.add_transition(start_state, "ε", left_start)
+        builder.add_transition(start_state, "ε", right_start)
 
         # add epsilon transition from end states of left_nfa and right_nfa to the end state of output_nfa
 
         # Note: we know that any NFA constructed by Thompson's Rule will have exactly 1 start state and 1 accept state
-        output_nfa.add_transition(left_nfa.accept_state, "ε", accept_state)
-        output_nfa.add_transition(right_nfa.accept_state, "ε", accept_state)
+        builder.add_transition(left_accept, "ε", accept_state)
+        builder.add_transition(right_accept, "ε", accept_state)
 
-        return output_nfa
+        return (start_state, accept_state)
 
     def __repr__(self):
         return f"Union({self._left!r}, {self._right!r})"
@@ -124,59 +283,85 @@ class Star(Regex):
 
     def __init__(self, regex: Regex):
         self._regex = regex
-    
-    def to_nfa(self):
-        '''
-        return the NFA representation of the Star operation
-        '''
-
-        # get the sub-NFA
-        sub_NFA = self._regex.to_nfa()
-
-        # create new start and accept states
-        output_nfa_start_state = global_id_gen.get_new_id()
-        output_nfa_accept_state = global_id_gen.get_new_id()
 
-        # the new nfa's alphabet will be the same as the sub-NFA's alphabet
-        output_nfa_alphabet = sub_NFA.alphabet
+    @property
+    def regex(self):
+        return self._regex
 
-        # create a new states set
-        output_nfa_states = {output_nfa_start_state, output_nfa_accept_state} | sub_NFA.states
+    def children(self):
+        return (self._regex,)
 
-        # create the transition for the output NFA
-        output_nfa_trans_func = sub_NFA.trans_func
+    def _exit(self, builder, context, fragments):
+        '''
+        build the NFA of the Star operation from the sub-NFA
+        '''
+        [(sub_start, sub_accept)] = fragments
 
-        # create the output NFA
-        output_nfa = NFA(output_nfa_states, output_nfa_alphabet, output_nfa_start_state, output_nfa_accept_state, output_nfa_trans_func)
+        # create new start and accept states
+        output_nfa_start_state = builder.new_state()
+        output_nfa_accept_state = builder.new_state()
 
         # add the necessary epsilon-transitions
-        output_nfa.add_transition(output_nfa_start_state, "ε", output_nfa_accept_state)
-        output_nfa.add_transition(output_nfa_start_state, "ε", sub_NFA.start_state)
-        output_nfa.add_transition(sub_NFA.accept_state, "ε", output_nfa_accept_state)
-        output_nfa.add_transition(sub_NFA.accept_state, "ε", sub_NFA.start_state)
+        builder.add_transition(output_nfa_start_state, "ε", output_nfa_accept_state)
+        builder.add_transition(output_nfa_start_state, "ε", sub_start)
+        builder.add_transition(sub_accept, "ε", output_nfa_accept_state)
+        builder.add_transition(sub_accept, "ε", sub_start)
 
-        return output_nfa
+        return (output_nfa_start_state, output_nfa_accept_state)
 
     def __repr__(self):
         return f"Star({self._regex!r})"
 
 class Epsilon(Regex):
-    def to_nfa(self):
+    def _exit(self, builder, context, fragments):
         '''
         construct the NFA for an empty string according to Thompson's rule
         '''
-        start_state = global_id_gen.get_new_id()
-        accept_state = global_id_gen.get_new_id()
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
-        output_nfa = NFA({start_state, accept_state}, set(), start_state, accept_state)
-        output_nfa.add_transition(start_state, "ε", accept_state)
+        builder.add_transition(start_state, "ε", accept_state)
 
-        return output_nfa
+        return (start_state, accept_state)
 
     def __repr__(self):
 
         return "Epsilon()"
 
+class CharClass(Regex):
+    '''
+    A set of characters, any one of which matches. Equivalent to the Union of their Literals, but built as a single multi-symbol edge: one start
+    state and one accept state with one transition per character
+    '''
+
+    def __init__(self, chars):
+        self._chars = frozenset(chars)
+
+    @property
+    def chars(self):
+        '''
+        return the frozenset of characters of the class
+        '''
+        return self._chars
+
+    def _fields(self):
+        return (self._chars,)
+
+    def _exit(self, builder, context, fragments):
+        '''
+        construct the NFA for the character class: a single pair of states joined by one edge per character
+        '''
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
+
+        for char in sorted(self._chars):
+            builder.add_transition(start_state, char, accept_state)
+
+        return (start_state, accept_state)
+
+    def __repr__(self):
+        return f"CharClass({''.join(sorted(self._chars))!r})"
+
 class Literal(Regex):
     '''
     The literal operator
@@ -192,25 +377,26 @@ class Literal(Regex):
         '''
 
         return self._char
-    
-    def to_nfa(self):
+
+    def _fields(self):
+        return (self._char,)
+
+    def _exit(self, builder, context, fragments):
         '''
         construct the NFA for a single literal according to Thompson's rule
         '''
 
-        start_state = global_id_gen.get_new_id()
-        accept_state = global_id_gen.get_new_id()
-
-        output_nfa = NFA({start_state, accept_state}, {self.char}, start_state, accept_state, {})
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
-        output_nfa.add_transition(start_state, self._char, accept_state)
+        builder.add_transition(start_state, self._char, accept_state)
 
-        return output_nfa
+        return (start_state, accept_state)
 
     def __repr__(self):
         return f"Literal({self._char!r})"
-    
+
 # if __name__ == "__main__":
 #     test= Concat(Star(Literal("a")), Literal("b"))
 
-#     print(test.to_nfa())
\ No newline at end of file
+#     print(test.to_nfa())
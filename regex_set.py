@@ -0,0 +1,111 @@
+from bitset_nfa import BitsetNFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+from parser import parse_regex
+from regex import ThompsonBuilder
+
+class RegexSet:
+    '''
+    RegexSet class
+
+    Matches a string against many patterns at once. The Thompson NFA's of all the patterns are built into one arena and joined under a single
+    epsilon-start, and every accept state is tagged with the index of its pattern, so one scan of the input tells which patterns match the whole
+    string
+
+    The scan runs on the BitsetNFA of the combined automaton by default. With use_dfa=True it runs on its LazyDFA instead: once the cache is warm a
+    character costs one lookup whatever the number of patterns, so the cost grows with the input length only
+
+    Attributes:
+        - patterns: Tuple[Str | Regex] : the patterns, in index order
+        - nfa: NFA : the combined automaton
+    '''
+
+    def __init__(self, patterns, use_dfa=False, max_states=DEFAULT_CACHE_SIZE):
+        '''
+        initialize the RegexSet object
+
+        patterns: Iterable[Str | Regex]: regex strings (parsed with parse_regex) or ASTs
+        use_dfa: Bool: scan with the lazy DFA of the combined automaton instead of its bitset engine
+        max_states: Int: maximum number of DFA states cached by the lazy DFA
+        '''
+        self._patterns = tuple(patterns)
+
+        if not self._patterns:
+            raise ValueError("RegexSet needs at least one pattern")
+
+        regexes = [parse_regex(p) if isinstance(p, str) else p for p in self._patterns]
+        self._nfa, accepts = ThompsonBuilder().to_set_nfa(regexes)
+
+        # Dict{Int : Int} : the pattern index of every accept state
+        self._index_of = {accept: i for i, accept in enumerate(accepts)}
+
+        if use_dfa:
+            self._engine = LazyDFA(self._nfa, max_states)
+        else:
+            self._engine = BitsetNFA(self._nfa)
+
+        # the final states of a scan, mapped to the frozenset of the indices they match. Bounded like the lazy DFA cache and flushed when full
+        self._max_states = max_states
+        self._indices_cache = {}
+
+    @property
+    def patterns(self):
+        '''
+        return the patterns of the set, in index order
+        '''
+        return self._patterns
+
+    @property
+    def nfa(self):
+        '''
+        return the combined NFA of the patterns
+        '''
+        return self._nfa
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _scan(self, test_str):
+        '''
+        return the final state of the engine after consuming test_str: a frozenset of NFA states for the lazy DFA, a bitmask for the bitset engine
+        '''
+        engine = self._engine
+
+        if isinstance(engine, LazyDFA):
+            return engine.advance(engine.start_set, test_str)
+
+        active = engine.start_mask
+
+        for ch in test_str:
+            active = engine.step(active, ch)
+
+            if not active:
+                break
+
+        return active
+
+    def matches(self, test_str):
+        '''
+        return the frozenset of the indices of the patterns that match the whole of test_str
+        '''
+        final = self._scan(test_str)
+        indices = self._indices_cache.get(final)
+
+        if indices is None:
+            states = final if isinstance(final, frozenset) else self._engine.to_states(final)
+            indices = frozenset(self._index_of[s] for s in states if s in self._index_of)
+
+            if len(self._indices_cache) >= self._max_states:
+                self._indices_cache.clear()
+
+            self._indices_cache[final] = indices
+
+        return indices
+
+    def is_match(self, test_str):
+        '''
+        return True if at least one pattern matches the whole of test_str, return False otherwise
+        '''
+        return bool(self.matches(test_str))
+
+    def __repr__(self):
+        return f"RegexSet({list(self._patterns)!r})"
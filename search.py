@@ -0,0 +1,225 @@
+from collections import deque
+
+class Match:
+    '''
+    Match class
+
+    A match found by search or finditer: the half-open span [start, end) of the input. group() slices the input, so only the matched part is copied
+    '''
+
+    __slots__ = ("_text", "_start", "_end")
+
+    def __init__(self, text, start, end):
+        self._text = text
+        self._start = start
+        self._end = end
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def span(self):
+        return (self._start, self._end)
+
+    def group(self):
+        '''
+        return the matched part of the input (a str for a str input, bytes otherwise)
+        '''
+        return self._text[self._start:self._end]
+
+    def __repr__(self):
+        return f"<Match span=({self._start}, {self._end}) match={self.group()!r}>"
+
+def _char_reader(text):
+    '''
+    return (get, release): get(i) returns the i-th character of text, release() frees the buffer export
+
+    str inputs are indexed directly. bytes, bytearray, memoryview and mmap inputs are read through a memoryview, without copying, and every byte is
+    read as the character with the same code point (latin-1)
+    '''
+    if isinstance(text, str):
+        return text.__getitem__, lambda: None
+
+    view = memoryview(text).cast('B')
+
+    return (lambda i: chr(view[i])), view.release
+
+class _Level:
+    '''
+    _Level class
+
+    One match being looked for by Searcher: the threads (Dict{Int : Int}, the earliest start of every active state), the best (start, end) span
+    found so far (or None), and the first position the start closure is seeded at while no match is found
+    '''
+
+    __slots__ = ("threads", "best", "seed_from")
+
+    def __init__(self, seed_from):
+        self.threads = {}
+        self.best = None
+        self.seed_from = seed_from
+
+class Searcher:
+    '''
+    Searcher class
+
+    Unanchored leftmost-longest search over an NFA (an NFA, a CompactNFA or a CompiledPattern) with a Thompson simulation. Every active state carries
+    the earliest position a match through it could start at. The start closure is re-seeded at each position until a match is found; from then on
+    only threads that start at or before the best match are kept, and the match is final when none is left.
+
+    While a match is still growing, the next one is looked for in the same pass, from the end of the best match so far: it is dropped and
+    re-seeded whenever that end moves, and so on for the matches after it. Two threads in the same state have the same future, so a state held for
+    an earlier match is never held for a later one: if the earlier thread reaches an accept state again, the earlier match grows over the later
+    ones anyway. At most m threads are therefore active at any position, and search and finditer read each character once and cost O(n * m) for
+    n characters and m states, whatever the pattern
+
+    The epsilon-closed successors of every (state, symbol) pair are memoized, so repeated searches with one Searcher get faster. Characters outside
+    the alphabet have no successors and are not memoized, which bounds the memo by the size of the NFA whatever the input
+    '''
+
+    def __init__(self, nfa):
+        self._nfa = nfa
+        self._start_closure = tuple(nfa.get_epsilon_closure({nfa.start_state}))
+        self._accept_states = tuple(nfa.accept_states)
+        self._start_accepts = not set(self._start_closure).isdisjoint(self._accept_states)
+        self._alphabet = frozenset(nfa.alphabet)
+
+        # Dict{(Int, Str) : Tuple[Int]} : epsilon-closed successors of a state on a symbol of the alphabet
+        self._moves = {}
+
+    def _move(self, state, ch):
+        '''
+        return the epsilon-closed successors of state on ch
+        '''
+        key = (state, ch)
+        moves = self._moves.get(key)
+
+        if moves is None:
+            if ch not in self._alphabet:
+                return ()
+
+            dests = self._nfa.get_next_state(state, ch)
+            moves = tuple(self._nfa.get_epsilon_closure(dests)) if dests else ()
+            self._moves[key] = moves
+
+        return moves
+
+    def _spans(self, get, pos, endpos):
+        '''
+        Generator that yields the (start, end) span of every non-overlapping leftmost-longest match in positions [pos, endpos) of the input read by
+        get, from left to right. After an empty match the next one is looked for one character later
+        '''
+        if pos > endpos:
+            return
+
+        # the matches not yielded yet, oldest first, and those of them that still have threads or seed the start closure
+        levels = deque([_Level(pos)])
+        live = [levels[0]]
+        i = pos
+
+        while True:
+            # states held for earlier matches at position i
+            claimed = set()
+            k = 0
+
+            while k < len(live):
+                level = live[k]
+                threads = level.threads
+                best = level.best
+                seeding = best is None and i >= level.seed_from
+
+                if seeding:
+                    # a match can still start here
+                    for s in self._start_closure:
+                        if s not in threads and s not in claimed:
+                            threads[s] = i
+
+                for a in self._accept_states:
+                    start = threads.get(a)
+
+                    if start is not None and (best is None or start < best[0] or (start == best[0] and i > best[1])):
+                        best = (start, i)
+
+                # the accept state of an empty match here may be held for an earlier match
+                if seeding and best is None and self._start_accepts:
+                    best = (i, i)
+
+                if best != level.best:
+                    level.best = best
+                    # threads starting after the best match can never beat it
+                    level.threads = threads = {s: start for s, start in threads.items() if start <= best[0]}
+
+                    # the later matches overlap this one now, look for the next one again from its end
+                    del live[k + 1:]
+
+                    while levels[-1] is not level:
+                        levels.pop()
+
+                    following = _Level(best[1] if best[1] > best[0] else best[1] + 1)
+                    levels.append(following)
+                    live.append(following)
+
+                claimed.update(threads)
+                k += 1
+
+            if i >= endpos:
+                for level in levels:
+                    if level.best is not None:
+                        yield level.best
+
+                return
+
+            ch = get(i)
+            claimed = set()
+            next_live = []
+
+            for level in live:
+                next_threads = {}
+
+                for s, start in level.threads.items():
+                    for t in self._move(s, ch):
+                        if t not in claimed and start < next_threads.get(t, endpos + 1):
+                            next_threads[t] = start
+
+                claimed.update(next_threads)
+                level.threads = next_threads
+
+                if next_threads or level.best is None:
+                    next_live.append(level)
+
+            live = next_live
+            i += 1
+
+            # the oldest match is final once it has no thread left
+            while not levels[0].threads and levels[0].best is not None:
+                yield levels.popleft().best
+
+    def search(self, text, pos=0, endpos=None):
+        '''
+        return the Match of the leftmost-longest occurrence of the pattern in text[pos:endpos], or None
+        '''
+        endpos = len(text) if endpos is None else min(endpos, len(text))
+        get, release = _char_reader(text)
+
+        try:
+            span = next(self._spans(get, pos, endpos), None)
+        finally:
+            release()
+
+        return Match(text, *span) if span is not None else None
+
+    def finditer(self, text, pos=0, endpos=None):
+        '''
+        Generator that yields the Match of every non-overlapping leftmost-longest occurrence of the pattern in text[pos:endpos], from left to right.
+        After an empty match the search resumes one character later
+        '''
+        endpos = len(text) if endpos is None else min(endpos, len(text))
+        get, release = _char_reader(text)
+
+        try:
+            for span in self._spans(get, pos, endpos):
+                yield Match(text, *span)
+        finally:
+            release()
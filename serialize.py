@@ -0,0 +1,201 @@
+'''
+Binary serialization of compiled automata
+
+A file holds one automaton, a CompactNFA or a class-indexed DFA table, as a fixed header followed by flat int32 arrays in native byte order:
+
+    header      magic b"RNFA", byte order mark, FORMAT_VERSION, kind, then HEADER_FIELDS int32 counts
+    NFA body    ids, accepts, symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets
+    DFA body    table, accepts, symbols, symbol classes
+    pattern     the optional source regex, UTF-8, padded to 4 bytes
+
+Symbols are stored as code points. load() maps the file and casts the arrays to memoryviews over the mapping, so matching runs straight from the
+page cache: processes that load the same file share its pages, and loading costs no parsing and no copy of the edges. The arrays are checked for
+consistency in one linear pass (every index in range, offsets sorted), so a corrupt file raises ValueError at load rather than while matching.
+'''
+
+from array import array
+import mmap
+import struct
+
+from alphabet import SymbolClasses
+from compact_nfa import CompactNFA
+from dfa import DFA, TableDFA, DEAD
+
+MAGIC = b"RNFA"
+
+# bumped on every incompatible change of the layout
+FORMAT_VERSION = 1
+
+# written as a native int32, reads back differently on a machine with the other byte order
+BYTE_ORDER_MARK = 0x01020304
+
+KIND_NFA = 1
+KIND_DFA = 2
+
+# magic, byte order mark, version, kind, and the counts of the body (unused counts are 0)
+HEADER_FIELDS = 8
+_HEADER = struct.Struct(f"=4sIII{HEADER_FIELDS}i")
+
+def _padded(data):
+    return data + b"\0" * (-len(data) % 4)
+
+def dumps(automaton, pattern=""):
+    '''
+    return the bytes of the binary form of automaton: a DFA or TableDFA, or any NFA (an NFA, a CompactNFA, a CompiledPattern), which is frozen
+    into a CompactNFA first. pattern is the optional source regex stored with it
+    '''
+    pattern_bytes = pattern.encode("UTF-8")
+
+    if isinstance(automaton, (DFA, TableDFA)):
+        classes = automaton.symbol_classes
+        symbols = sorted(classes.class_of)
+
+        arrays = [array('i', automaton.table), array('i', sorted(automaton.accept_states)), array('i', map(ord, symbols)),
+                  array('i', (classes.class_of[sym] for sym in symbols))]
+        counts = [len(automaton.states), classes.num_classes, len(arrays[1]), len(symbols), len(pattern_bytes)]
+        kind = KIND_DFA
+    else:
+        nfa = getattr(automaton, "nfa", automaton)
+        compact = nfa if isinstance(nfa, CompactNFA) else CompactNFA.from_nfa(nfa)
+        (ids, start, accepts, symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets) = compact.__getstate__()
+
+        arrays = [ids, accepts, array('i', map(ord, symbols)), sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets]
+        counts = [start, len(ids), len(accepts), len(symbols), len(sym_targets), len(eps_targets), len(pattern_bytes)]
+        kind = KIND_NFA
+
+    counts += [0] * (HEADER_FIELDS - len(counts))
+    header = _HEADER.pack(MAGIC, BYTE_ORDER_MARK, FORMAT_VERSION, kind, *counts)
+
+    return header + b"".join(array('i', a).tobytes() for a in arrays) + _padded(pattern_bytes)
+
+def save(automaton, path, pattern=""):
+    '''
+    write the binary form of automaton (see dumps) to the file path
+    '''
+    with open(path, "wb") as f:
+        f.write(dumps(automaton, pattern))
+
+def _read_header(view):
+    '''
+    return the (kind, counts) of the header at the start of the byte memoryview view, raise ValueError if it is not a supported automaton file
+    '''
+    if len(view) < _HEADER.size:
+        raise ValueError("Truncated automaton file")
+
+    magic, byte_order_mark, version, kind, *counts = _HEADER.unpack_from(view)
+
+    if magic != MAGIC:
+        raise ValueError("Not an automaton file")
+
+    if byte_order_mark != BYTE_ORDER_MARK:
+        raise ValueError("Automaton file was written with a different byte order")
+
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported automaton file version {version}, expected {FORMAT_VERSION}")
+
+    if kind not in (KIND_NFA, KIND_DFA):
+        raise ValueError(f"Unknown automaton kind {kind}")
+
+    return kind, counts
+
+def _in_range(values, low, high):
+    '''
+    return True if every int of values is in [low, high)
+    '''
+    return len(values) == 0 or (min(values) >= low and max(values) < high)
+
+def _is_sorted(values, strict=False):
+    '''
+    return True if values is non-decreasing (increasing if strict)
+    '''
+    if strict:
+        return all(a < b for a, b in zip(values, values[1:]))
+
+    return all(a <= b for a, b in zip(values, values[1:]))
+
+def _check(condition, message):
+    if not condition:
+        raise ValueError(f"Corrupt automaton file: {message}")
+
+def _check_nfa(start, num_states, num_symbols, arrays):
+    '''
+    raise ValueError if the CompactNFA arrays are not consistent with each other
+    '''
+    ids, accepts, symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets = arrays
+
+    _check(0 <= start < num_states, "start state out of range")
+    _check(_is_sorted(ids, strict=True), "state ids not sorted")
+    _check(_in_range(accepts, 0, num_states), "accept state out of range")
+
+    for offsets, targets, name in [(sym_offsets, sym_targets, "symbol"), (eps_offsets, eps_targets, "epsilon")]:
+        _check(offsets[0] == 0 and offsets[-1] == len(targets) and _is_sorted(offsets), f"bad {name} edge offsets")
+        _check(_in_range(targets, 0, num_states), f"{name} edge target out of range")
+
+    _check(_in_range(sym_labels, 0, num_symbols), "edge symbol out of range")
+
+def _check_dfa(num_states, num_classes, arrays):
+    '''
+    raise ValueError if the TableDFA arrays are not consistent with each other
+    '''
+    table, accepts, symbols, classes = arrays
+
+    _check(num_states > 0, "no start state")
+    _check(_in_range(table, DEAD, num_states), "transition target out of range")
+    _check(_in_range(accepts, 0, num_states), "accept state out of range")
+    _check(_in_range(classes, 0, num_classes) and max(classes, default=0) == num_classes - 1, "symbol class out of range")
+
+def loads(data):
+    '''
+    return the (automaton, pattern) stored in the bytes-like object data (bytes, mmap, ...): a CompactNFA or a TableDFA whose arrays are memoryviews
+    over data, and the source regex
+
+    Nothing but the alphabet and the pattern is copied, the automaton keeps data alive. Raise ValueError if data is not a valid automaton file
+    '''
+    view = memoryview(data).cast('B')
+    kind, counts = _read_header(view)
+
+    if kind == KIND_NFA:
+        start, num_states, num_accepts, num_symbols, num_sym_edges, num_eps_edges, pattern_size = counts[:7]
+        lengths = [num_states, num_accepts, num_symbols, num_states + 1, num_sym_edges, num_sym_edges, num_states + 1, num_eps_edges]
+    else:
+        num_states, num_classes, num_accepts, num_symbols, pattern_size = counts[:5]
+        lengths = [num_states * num_classes, num_accepts, num_symbols, num_symbols]
+
+    if min(counts) < 0 or len(view) < _HEADER.size + 4 * sum(lengths) + pattern_size:
+        raise ValueError("Truncated automaton file")
+
+    # the int32 body, cast without copying, then cut into one memoryview per array
+    body = view[_HEADER.size:_HEADER.size + 4 * sum(lengths)].cast('i')
+    arrays = []
+    offset = 0
+
+    for length in lengths:
+        arrays.append(body[offset:offset + length])
+        offset += length
+
+    pattern_start = _HEADER.size + 4 * sum(lengths)
+    pattern = bytes(view[pattern_start:pattern_start + pattern_size]).decode("UTF-8")
+
+    if kind == KIND_NFA:
+        _check_nfa(start, num_states, num_symbols, arrays)
+        ids, accepts, symbols, sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets = arrays
+
+        automaton = CompactNFA(ids, start, accepts, [chr(c) for c in symbols],
+                               sym_offsets, sym_labels, sym_targets, eps_offsets, eps_targets)
+    else:
+        _check_dfa(num_states, num_classes, arrays)
+        table, accepts, symbols, classes = arrays
+
+        automaton = TableDFA(num_states, SymbolClasses({chr(c): class_id for c, class_id in zip(symbols, classes)}), table, accepts)
+
+    return automaton, pattern
+
+def load(path):
+    '''
+    return the (automaton, pattern) stored in the file path, see loads. The file is memory-mapped read-only, so the automaton is matched straight
+    from the page cache, which is shared by every process that loads the same file
+    '''
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return loads(mapped)
@@ -0,0 +1,305 @@
+'''
+Per-session stores of compiled patterns
+
+The visualizer keeps the CompiledPattern of every browser session under a session id, instead of one module-global pattern that concurrent
+users would overwrite. Sessions expire after ttl seconds without use, and the least recently used ones are evicted first to stay within
+maxsize sessions and max_memory bytes.
+
+MemorySessionStore keeps the patterns in the process. SQLiteSessionStore keeps them in an SQLite file in their binary form (see serialize), so
+every worker process of a deployment pointed at the same file sees the same sessions; each worker keeps the patterns it loaded, and only
+loads a pattern again when another worker replaced it.
+'''
+
+from collections import OrderedDict
+import secrets
+import sqlite3
+import threading
+import time
+
+import compiler
+
+DEFAULT_SESSION_TTL = 30 * 60
+DEFAULT_MAX_SESSIONS = 1024
+DEFAULT_SESSION_MAX_MEMORY = 64 * 1024 * 1024
+
+def new_session_id():
+    '''
+    return a new random session id
+    '''
+    return secrets.token_urlsafe(16)
+
+class MemorySessionStore:
+    '''
+    MemorySessionStore class
+
+    A thread-safe in-process store of compiled patterns by session id, with a TTL refreshed on every get and LRU eviction bounded by the number
+    of sessions (maxsize) and their total memory_usage() (max_memory)
+    '''
+
+    def __init__(self, maxsize=DEFAULT_MAX_SESSIONS, max_memory=DEFAULT_SESSION_MAX_MEMORY, ttl=DEFAULT_SESSION_TTL, clock=time.monotonic):
+        '''
+        initialize the MemorySessionStore object
+
+        clock: Callable : returns the current time in seconds, time.monotonic by default
+        '''
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self._maxsize = maxsize
+        self._max_memory = max_memory
+        self._ttl = ttl
+        self._clock = clock
+
+        # session id -> (pattern, size, last use), least recently used first
+        self._entries = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, session_id):
+        _, size, _ = self._entries.pop(session_id)
+        self._memory -= size
+
+    def get(self, session_id):
+        '''
+        return the pattern of session_id and refresh its TTL, or None if the session is unknown or expired
+        '''
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+
+            if entry is None:
+                return None
+
+            pattern, size, last_used = entry
+
+            if now - last_used > self._ttl:
+                self._pop(session_id)
+                return None
+
+            self._entries[session_id] = (pattern, size, now)
+            self._entries.move_to_end(session_id)
+
+            return pattern
+
+    def put(self, session_id, pattern):
+        '''
+        store pattern under session_id, evicting expired then least recently used sessions to stay within the bounds. A pattern larger than
+        max_memory is not stored
+        '''
+        now = self._clock()
+        size = pattern.memory_usage()
+
+        with self._lock:
+            if session_id in self._entries:
+                self._pop(session_id)
+
+            if size > self._max_memory:
+                return
+
+            self._entries[session_id] = (pattern, size, now)
+            self._memory += size
+
+            # the least recently used sessions come first, so the expired ones are all at the front
+            while self._entries:
+                oldest, (_, _, last_used) = next(iter(self._entries.items()))
+
+                if now - last_used <= self._ttl and len(self._entries) <= self._maxsize and self._memory <= self._max_memory:
+                    break
+
+                self._pop(oldest)
+
+    def delete(self, session_id):
+        '''
+        drop the session session_id, if it is stored
+        '''
+        with self._lock:
+            if session_id in self._entries:
+                self._pop(session_id)
+
+    def clear(self):
+        '''
+        drop every session
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+
+    @property
+    def memory(self):
+        '''
+        return the total memory_usage() of the stored patterns
+        '''
+        return self._memory
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteSessionStore:
+    '''
+    SQLiteSessionStore class
+
+    A store of compiled patterns by session id in the SQLite database file path, shared by every process that opens the same file. Patterns are
+    stored in their binary form and loaded back with compiler.loads; the bounds are those of MemorySessionStore, with the size of a pattern
+    being the size of its binary form
+
+    Every stored pattern has a version, changed on every put. A process keeps the last max_loaded patterns it loaded by (session id, version), so
+    a get is two primary key lookups (one to check the version and refresh the TTL) and never loads or recompiles an unchanged pattern
+    '''
+
+    def __init__(self, path, maxsize=DEFAULT_MAX_SESSIONS, max_memory=DEFAULT_SESSION_MAX_MEMORY, ttl=DEFAULT_SESSION_TTL, max_loaded=64,
+                 clock=time.time):
+        '''
+        initialize the SQLiteSessionStore object
+
+        clock: Callable : returns the current time in seconds. It must agree between the processes, time.time by default
+        '''
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self._path = path
+        self._maxsize = maxsize
+        self._max_memory = max_memory
+        self._ttl = ttl
+        self._max_loaded = max_loaded
+        self._clock = clock
+
+        # one connection per thread, sqlite3 connections cannot be shared between threads
+        self._local = threading.local()
+
+        # session id -> (version, pattern) of the patterns loaded by this process, least recently used first
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+        with self._connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                                      session_id TEXT PRIMARY KEY,
+                                      engine TEXT NOT NULL,
+                                      data BLOB NOT NULL,
+                                      size INTEGER NOT NULL,
+                                      version INTEGER NOT NULL,
+                                      last_used REAL NOT NULL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30)
+            # readers do not block the writer, so the workers can step through their sessions while another one stores a pattern
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+
+        return connection
+
+    def _remember(self, session_id, version, pattern):
+        with self._lock:
+            self._loaded[session_id] = (version, pattern)
+            self._loaded.move_to_end(session_id)
+
+            while len(self._loaded) > self._max_loaded:
+                self._loaded.popitem(last=False)
+
+    def _forget(self, session_id):
+        with self._lock:
+            self._loaded.pop(session_id, None)
+
+    def get(self, session_id):
+        '''
+        return the pattern of session_id and refresh its TTL, or None if the session is unknown or expired
+        '''
+        now = self._clock()
+
+        with self._connection() as connection:
+            row = connection.execute("SELECT engine, version, last_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+
+            if row is None:
+                self._forget(session_id)
+                return None
+
+            engine, version, last_used = row
+
+            if now - last_used > self._ttl:
+                connection.execute("DELETE FROM sessions WHERE session_id = ? AND version = ?", (session_id, version))
+                self._forget(session_id)
+                return None
+
+            connection.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+
+        with self._lock:
+            loaded = self._loaded.get(session_id)
+
+            if loaded is not None and loaded[0] == version:
+                self._loaded.move_to_end(session_id)
+                return loaded[1]
+
+        data = self._connection().execute("SELECT data FROM sessions WHERE session_id = ? AND version = ?", (session_id, version)).fetchone()
+
+        # replaced or evicted by another process in between
+        if data is None:
+            return self.get(session_id)
+
+        pattern = compiler.loads(data[0], engine)
+        self._remember(session_id, version, pattern)
+
+        return pattern
+
+    def put(self, session_id, pattern):
+        '''
+        store pattern under session_id, evicting expired then least recently used sessions to stay within the bounds. A pattern larger than
+        max_memory is not stored
+        '''
+        now = self._clock()
+        data = pattern.dumps()
+        version = secrets.randbits(62)
+
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+            if len(data) <= self._max_memory:
+                connection.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)", (session_id, pattern.engine, data, len(data), version, now))
+
+            connection.execute("DELETE FROM sessions WHERE last_used < ?", (now - self._ttl,))
+
+            # the sessions past maxsize or past max_memory, counted from the most recently used
+            connection.execute("""DELETE FROM sessions WHERE session_id IN (
+                                      SELECT session_id FROM (
+                                          SELECT session_id,
+                                                 ROW_NUMBER() OVER (ORDER BY last_used DESC, rowid DESC) AS position,
+                                                 SUM(size) OVER (ORDER BY last_used DESC, rowid DESC ROWS UNBOUNDED PRECEDING) AS total
+                                          FROM sessions)
+                                      WHERE position > ? OR total > ?)""", (self._maxsize, self._max_memory))
+
+        if len(data) <= self._max_memory:
+            self._remember(session_id, version, pattern)
+        else:
+            self._forget(session_id)
+
+    def delete(self, session_id):
+        '''
+        drop the session session_id, if it is stored
+        '''
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+        self._forget(session_id)
+
+    def clear(self):
+        '''
+        drop every session, of every process
+        '''
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions")
+
+        with self._lock:
+            self._loaded.clear()
+
+    @property
+    def memory(self):
+        '''
+        return the total size of the stored patterns
+        '''
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
@@ -0,0 +1,185 @@
+from collections import namedtuple
+
+from parser import _balanced
+from regex import Regex, Concat, Union, Star, Epsilon, Literal, CharClass
+
+class SimplifyResult(namedtuple("SimplifyResult", ["regex", "states_before", "states_after"])):
+    '''
+    result of simplify: the rewritten AST, and the number of Thompson NFA states of the AST before and after the rewrite
+    '''
+
+    __slots__ = ()
+
+    @property
+    def states_saved(self):
+        '''
+        return the number of NFA states removed by the rewrite
+        '''
+        return self.states_before - self.states_after
+
+def thompson_size(regex):
+    '''
+    return the number of states of the Thompson NFA of regex, without building it
+    '''
+    work = [(regex, False)]
+    sizes = []
+
+    while work:
+        node, children_done = work.pop()
+
+        if not children_done:
+            work.append((node, True))
+            work.extend((child, False) for child in reversed(node.children()))
+            continue
+
+        children = len(node.children())
+        size = sum(sizes[len(sizes) - children:])
+        del sizes[len(sizes) - children:]
+
+        # Concat only adds an epsilon-edge, the leaves add 2 states, Union and Star add a new start and accept state
+        if not isinstance(node, Concat):
+            size += 2
+
+        sizes.append(size)
+
+    return sizes.pop()
+
+def _alternatives(node):
+    '''
+    return the alternatives of a simplified node: the flattened operands if it is a Union, [node] otherwise
+    '''
+    if not isinstance(node, Union):
+        return [node]
+
+    alternatives = []
+    stack = [node]
+
+    while stack:
+        curr = stack.pop()
+
+        if isinstance(curr, Union):
+            stack.append(curr.right)
+            stack.append(curr.left)
+        else:
+            alternatives.append(curr)
+
+    return alternatives
+
+def _simplify_union(left, right):
+    '''
+    return the simplified Union of the simplified nodes left and right
+
+    The alternatives are flattened and deduplicated, single characters (Literal and CharClass alternatives) are merged into one CharClass, and an
+    Epsilon alternative is dropped when a starred alternative already matches the empty string
+    '''
+    alternatives = []
+    seen = set()
+    chars = set()
+    char_position = None
+
+    for alternative in _alternatives(left) + _alternatives(right):
+        if isinstance(alternative, (Literal, CharClass)):
+            if char_position is None:
+                char_position = len(alternatives)
+                alternatives.append(None)
+
+            chars |= {alternative.char} if isinstance(alternative, Literal) else alternative.chars
+
+        elif alternative not in seen:
+            seen.add(alternative)
+            alternatives.append(alternative)
+
+    if char_position is not None:
+        alternatives[char_position] = Literal(next(iter(chars))) if len(chars) == 1 else CharClass(chars)
+
+    if any(isinstance(alternative, Star) for alternative in alternatives):
+        alternatives = [alternative for alternative in alternatives if not isinstance(alternative, Epsilon)]
+
+    return _balanced(alternatives, Union)
+
+def _simplify_star(sub):
+    '''
+    return the simplified Star of the simplified node sub
+    '''
+
+    # (a*)* = a* and @* = @
+    if isinstance(sub, (Star, Epsilon)):
+        return sub
+
+    # (@|a)* = a*
+    if isinstance(sub, Union):
+        alternatives = [alternative for alternative in _alternatives(sub) if not isinstance(alternative, Epsilon)]
+
+        if not alternatives:
+            return Epsilon()
+
+        sub = _balanced(alternatives, Union)
+
+        if isinstance(sub, Star):
+            return sub
+
+    return Star(sub)
+
+def _simplify_concat(left, right):
+    '''
+    return the simplified Concat of the simplified nodes left and right
+    '''
+
+    # @a = a@ = a
+    if isinstance(left, Epsilon):
+        return right
+
+    if isinstance(right, Epsilon):
+        return left
+
+    # a*a* = a*
+    if isinstance(left, Star) and left == right:
+        return left
+
+    return Concat(left, right)
+
+def simplify(regex: Regex) -> SimplifyResult:
+    '''
+    return the SimplifyResult of the algebraic simplification of regex
+
+    The AST is rewritten bottom-up with an explicit stack: nested stars collapse, Epsilon units are dropped from concatenations, unions are
+    flattened and deduplicated, and single-character alternatives are merged into one CharClass (one multi-symbol edge). Rewrites are memoized
+    on the structural equality of the nodes, so repeated sub-expressions are simplified once and shared
+    '''
+    memo = {}
+    work = [(regex, False)]
+    results = []
+
+    while work:
+        node, children_done = work.pop()
+
+        if not children_done:
+            if node in memo:
+                results.append(memo[node])
+                continue
+
+            work.append((node, True))
+            work.extend((child, False) for child in reversed(node.children()))
+            continue
+
+        children = len(node.children())
+        subs = results[len(results) - children:]
+        del results[len(results) - children:]
+
+        if isinstance(node, Concat):
+            simplified = _simplify_concat(*subs)
+        elif isinstance(node, Union):
+            simplified = _simplify_union(*subs)
+        elif isinstance(node, Star):
+            simplified = _simplify_star(*subs)
+        elif isinstance(node, CharClass) and len(node.chars) == 1:
+            simplified = Literal(next(iter(node.chars)))
+        else:
+            simplified = node
+
+        memo[node] = simplified
+        results.append(simplified)
+
+    simplified = results.pop()
+
+    return SimplifyResult(simplified, thompson_size(regex), thompson_size(simplified))
@@ -0,0 +1,105 @@
+class StreamMatcher:
+    '''
+    StreamMatcher class
+
+    Matches an input that arrives in chunks (a multi-GB payload, a network stream) against an automaton in constant memory. The whole input fed so
+    far is accepted if is_accepting() is True after the last chunk, with the same result as match() on the concatenated chunks
+
+    The matcher state is the set of active NFA states, as in trace_match. With a LazyDFA the chunks are consumed through its cache of DFA states,
+    otherwise by stepping the NFA directly. Either way checkpoint() returns the active set, a small frozenset that can be stored and handed to
+    restore() to resume, even in another process
+
+    Chunks are str. A byte stream should be decoded with an incremental decoder (codecs.getincrementaldecoder) so that characters split across
+    chunks are handled
+    '''
+
+    def __init__(self, nfa, lazy_dfa=None):
+        '''
+        initialize the StreamMatcher object
+
+        nfa: NFA: the automaton to match against (an NFA, a CompactNFA or a CompiledPattern)
+        lazy_dfa: LazyDFA: optional lazy DFA of nfa used to consume the chunks
+        '''
+        self._nfa = nfa
+        self._lazy_dfa = lazy_dfa
+        self._alphabet = frozenset(nfa.alphabet)
+        self._accept_states = frozenset(nfa.accept_states)
+        self._start_set = frozenset(nfa.get_epsilon_closure({nfa.start_state}))
+
+        self.reset()
+
+    @property
+    def position(self):
+        '''
+        return the number of characters fed since the last reset
+        '''
+        return self._position
+
+    def reset(self):
+        '''
+        go back to the start state, as if nothing had been fed
+        '''
+        self._states = self._start_set
+        self._position = 0
+
+    def is_accepting(self):
+        '''
+        return True if the input fed so far is accepted, return False otherwise
+        '''
+        return not self._accept_states.isdisjoint(self._states)
+
+    def is_dead(self):
+        '''
+        return True if no continuation of the input fed so far can be accepted any more
+        '''
+        return not self._states
+
+    def _advance_nfa(self, states, chunk):
+        '''
+        return the active set after consuming chunk from the active set states, by stepping the NFA
+        '''
+        nfa = self._nfa
+
+        for ch in chunk:
+            # fail-fast if char not in alphabet
+            if ch not in self._alphabet:
+                return frozenset()
+
+            next_states = set()
+            for s in states:
+                next_states |= nfa.get_next_state(s, ch)
+
+            if not next_states:
+                return frozenset()
+
+            states = nfa.get_epsilon_closure(next_states)
+
+        return frozenset(states)
+
+    def feed(self, chunk):
+        '''
+        consume the next chunk of the input
+        '''
+        self._position += len(chunk)
+
+        if not self._states:
+            return
+
+        if self._lazy_dfa is not None:
+            self._states = self._lazy_dfa.advance(self._states, chunk)
+        else:
+            self._states = self._advance_nfa(self._states, chunk)
+
+    def checkpoint(self):
+        '''
+        return the (active states, position) state of the matcher, to be passed to restore() later
+        '''
+        return (self._states, self._position)
+
+    def restore(self, checkpoint):
+        '''
+        resume from a checkpoint() taken on a matcher of the same automaton
+        '''
+        states, position = checkpoint
+        self._states = frozenset(states)
+        self._position = position
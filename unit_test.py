@@ -1,8 +1,33 @@
+import itertools
+import os
+import pickle
+import sys
+import tempfile
 import unittest
 
 # Import everything from your NFA module
 # (adjust the import as needed)
-from regex import Literal, Union, Concat, Star
+from regex import Literal, Union, Concat, Star, Epsilon, CharClass
+from nfa import NFA
+from bitset_nfa import BitsetNFA
+from dfa import LazyDFA
+from parser import parse_regex, RegexSyntaxError
+import compiler
+from optimize import optimize_nfa
+from simplify import simplify
+from regex_set import RegexSet
+from alphabet import symbol_classes, DEAD_CLASS
+import serialize
+import instrument
+from layout_cache import LayoutCache, canonical_key
+from layered_layout import layered_layout, layered_positions, thompson_positions
+from session_store import MemorySessionStore, SQLiteSessionStore, new_session_id
+
+try:
+    import numpy
+    from vectorized import VectorizedDFA, dfa_matrix
+except ImportError:
+    numpy = None
 
 class TestNFAMatch(unittest.TestCase):
 
@@ -122,5 +147,794 @@ class TestNFAMatch(unittest.TestCase):
         self.assertFalse(nfa.match("A"))  # case-sensitive
         self.assertFalse(nfa.match(" "))
 
+class TestDFAMatch(unittest.TestCase):
+
+    # ab(a|b)*c|a*
+    def build_nfa(self):
+        return Union(
+            Concat(Concat(Literal("a"), Literal("b")), Concat(Star(Union(Literal("a"), Literal("b"))), Literal("c"))),
+            Star(Literal("a"))).to_nfa()
+
+    TEST_STRINGS = ["", "a", "aa", "ab", "abc", "abac", "abbbac", "abca", "b", "c", "ac", "aaab", "x", "abxc"]
+
+    def test_to_dfa_agrees_with_nfa(self):
+        nfa = self.build_nfa()
+        dfa = nfa.to_dfa()
+        for s in self.TEST_STRINGS:
+            self.assertEqual(dfa.match(s), nfa.match(s), s)
+
+    def test_to_dfa_is_deterministic(self):
+        dfa = self.build_nfa().to_dfa()
+        self.assertEqual(dfa.start_state, 0)
+        self.assertEqual(len(dfa.trans_func), len(set(dfa.trans_func)))
+        self.assertEqual(repr(dfa), repr(self.build_nfa().to_dfa()))
+
+    def test_dfa_match_agrees_with_nfa(self):
+        nfa = self.build_nfa()
+        for _ in range(2):
+            for s in self.TEST_STRINGS:
+                self.assertEqual(nfa.dfa_match(s), nfa.match(s), s)
+
+    def test_lazy_dfa_eviction(self):
+        nfa = self.build_nfa()
+        lazy = nfa.lazy_dfa(max_states=3)
+        for s in self.TEST_STRINGS:
+            self.assertEqual(lazy.match(s), nfa.match(s), s)
+        self.assertLessEqual(lazy.cache_size, 3)
+        self.assertGreater(lazy.flushes, 0)
+
+    def test_lazy_dfa_invalidated_by_add_transition(self):
+        nfa = Literal("a").to_nfa()
+        self.assertFalse(nfa.dfa_match("aa"))
+        nfa.add_transition(nfa.accept_state, "ε", nfa.start_state)
+        self.assertTrue(nfa.dfa_match("aa"))
+
+def all_strings(alphabet, max_len):
+    # every string over alphabet of length <= max_len
+    strings = [""]
+    for length in range(1, max_len + 1):
+        strings += ["".join(p) for p in itertools.product(alphabet, repeat=length)]
+    return strings
+
+class TestDFAMinimization(unittest.TestCase):
+
+    def test_known_minimal_sizes(self):
+        for pattern, size in [("(a|b)*abb", 4), ("a*", 1), ("(a|b)*", 1), ("a*a*a*", 1), ("ab|ac", 3), ("(ab)*|(ab)*", 2)]:
+            dfa = parse_regex(pattern).to_nfa().to_dfa()
+            minimal = dfa.minimize()
+            self.assertEqual(len(minimal.states), size, pattern)
+            self.assertEqual(minimal.minimization_stats, (len(dfa.states), size))
+
+    def test_minimized_dfa_is_equivalent(self):
+        for pattern in ["(a|b)*(bc|ab)(a|c)*", "((a|b)(a|b))*", "a(b|@)c*|bc", "(a*b*)*c"]:
+            nfa = parse_regex(pattern).to_nfa()
+            minimal = nfa.to_dfa().minimize()
+            for s in all_strings("abcd", 5):
+                self.assertEqual(minimal.match(s), nfa.match(s), (pattern, s))
+
+class TestSymbolClasses(unittest.TestCase):
+
+    def test_indistinguishable_symbols_share_a_class(self):
+        nfa = parse_regex("(a|b|c)*d(a|b|c)*").to_nfa()
+        classes = symbol_classes(nfa.to_dfa().minimize())
+        self.assertEqual(classes.num_classes, 3)
+        self.assertEqual(classes.lookup("a"), classes.lookup("c"))
+        self.assertNotEqual(classes.lookup("a"), classes.lookup("d"))
+        self.assertEqual(classes.lookup("x"), DEAD_CLASS)
+        self.assertEqual(classes.representatives[classes.lookup("b")], "a")
+        self.assertEqual(classes.byte_table()[ord("d")], classes.lookup("d"))
+
+    def test_dfa_table(self):
+        dfa = parse_regex("(a|b|c)*d").to_nfa().to_dfa()
+        classes = dfa.symbol_classes
+        for (src, sym), dest in dfa.trans_func.items():
+            self.assertEqual(dfa.table[src * classes.num_classes + classes.lookup(sym)], dest)
+        self.assertEqual(len(dfa.table), len(dfa.states) * classes.num_classes)
+
+    def test_lazy_dfa_caches_per_class(self):
+        # the Literal alternatives are merged into one CharClass, whose characters share their edges
+        nfa = simplify(parse_regex("(a|b|c|d|e)*f")).regex.to_nfa()
+        self.assertEqual(symbol_classes(nfa).num_classes, 3)
+        lazy = nfa.lazy_dfa()
+        for s in ["abcdef", "eeeef", "f", "abx", "fa", ""]:
+            self.assertEqual(lazy.match(s), nfa.match(s), s)
+        self.assertEqual(lazy.cache_size, 3)
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestVectorizedDFA(unittest.TestCase):
+
+    def test_matrix_layout(self):
+        dfa = parse_regex("(a|b|c)*d(a|b|c)*").to_nfa().to_dfa().minimize()
+        matrix = dfa_matrix(dfa)
+        self.assertEqual(matrix.dtype, numpy.int32)
+        self.assertEqual(matrix.shape, (3, 4))
+        # dead row, DEAD_CLASS column and padding column
+        self.assertTrue((matrix[2] == 2).all())
+        self.assertTrue((matrix[:, DEAD_CLASS] == 2).all())
+        self.assertEqual(matrix[:, 3].tolist(), [0, 1, 2])
+
+    def test_match_batch_agrees_with_match(self):
+        strings = all_strings("abcx", 5)
+        for pattern in ["(a|b)*abb", "ab|ba", "(ab)*c", "@", "(a|b|c)*"]:
+            nfa = parse_regex(pattern).to_nfa()
+            vectorized = VectorizedDFA(nfa)
+            expected = [nfa.match(s) for s in strings]
+            self.assertEqual(vectorized.match_batch(strings).tolist(), expected, pattern)
+            self.assertEqual(vectorized.match_batch([s.encode() for s in strings]).tolist(), expected, pattern)
+        self.assertEqual(vectorized.match_batch([]).tolist(), [])
+        self.assertEqual(vectorized.run(vectorized.encode(strings)).dtype, numpy.int32)
+
+class TestOptimizeNFA(unittest.TestCase):
+
+    PATTERNS = ["(a|b)*(bc|ab)(a|c)*", "(a*)*b", "a|a", "((a|b)(a|b))*", "a(b|@)c*|bc", "(ab|ac)*", "a@@b"]
+
+    def test_optimized_nfa_is_equivalent_and_epsilon_free(self):
+        for pattern in self.PATTERNS:
+            nfa = parse_regex(pattern).to_nfa()
+            optimized, stats = optimize_nfa(nfa)
+            self.assertNotIn("ε", {sym for (_, sym) in optimized.trans_func}, pattern)
+            self.assertLess(stats.states_after, stats.states_before, pattern)
+            self.assertEqual(stats.states_after, len(optimized.states))
+            for s in all_strings("abc", 5):
+                self.assertEqual(optimized.match(s), nfa.match(s), (pattern, s))
+                self.assertEqual(optimized.freeze().match(s), nfa.match(s), (pattern, s))
+                self.assertEqual(optimized.to_bitset().match(s), nfa.match(s), (pattern, s))
+
+    def test_original_is_kept(self):
+        nfa = parse_regex("(a|b)*c").to_nfa()
+        before = repr(nfa)
+        optimize_nfa(nfa)
+        self.assertEqual(repr(nfa), before)
+
+    def test_star_collapses_to_one_state(self):
+        optimized, _ = optimize_nfa(parse_regex("(a|b)*").to_nfa())
+        self.assertEqual(len(optimized.states), 1)
+        self.assertEqual(optimized.accept_states, {optimized.start_state})
+
+    def test_compile_with_optimize(self):
+        compiled = compiler.compile("(a|b)*abb", optimize=True)
+        self.assertTrue(compiled.match("babb"))
+        self.assertFalse(compiled.match("bab"))
+        self.assertLess(len(compiled.states), len(compiler.compile("(a|b)*abb").states))
+
+class TestSimplify(unittest.TestCase):
+
+    def test_structural_equality_and_hash(self):
+        self.assertEqual(parse_regex("(a|b)*c"), parse_regex("(a|b)*c"))
+        self.assertEqual(hash(parse_regex("(a|b)*c")), hash(parse_regex("(a|b)*c")))
+        self.assertNotEqual(parse_regex("(a|b)*c"), parse_regex("(a|c)*c"))
+        self.assertNotEqual(Star(Literal("a")), Literal("a"))
+        self.assertEqual(len({parse_regex("ab"), parse_regex("ab"), parse_regex("ba")}), 2)
+
+    def test_rewrites(self):
+        for pattern, expected in [
+            ("(a*)*", Star(Literal("a"))),
+            ("a|a", Literal("a")),
+            ("@a", Literal("a")),
+            ("a@", Literal("a")),
+            ("(a|b|c|d)", CharClass("abcd")),
+            ("(a|(b|a))*", Star(CharClass("ab"))),
+            ("(@|a)*", Star(Literal("a"))),
+            ("a*a*", Star(Literal("a"))),
+            ("@*", Epsilon()),
+            ("@|b*", Star(Literal("b"))),
+        ]:
+            self.assertEqual(simplify(parse_regex(pattern)).regex, expected, pattern)
+
+    def test_reports_states_saved(self):
+        result = simplify(parse_regex("(a|b|c|d)"))
+        self.assertEqual(result.states_before, len(parse_regex("(a|b|c|d)").to_nfa().states))
+        self.assertEqual(result.states_after, len(result.regex.to_nfa().states))
+        self.assertEqual(result.states_saved, result.states_before - 2)
+
+    def test_simplified_regex_is_equivalent(self):
+        for pattern in ["(a|b)*(bc|ab)(a|c)*", "((a*)*|b|a)c", "a(b|@)c*|bc|a", "(@|a|b)*(ab|ab)", "@@(a|b)@"]:
+            nfa = parse_regex(pattern).to_nfa()
+            simplified = simplify(parse_regex(pattern)).regex.to_nfa()
+            for s in all_strings("abc", 5):
+                self.assertEqual(simplified.match(s), nfa.match(s), (pattern, s))
+
+    def test_deep_ast(self):
+        depth = sys.getrecursionlimit() * 2
+        node, twin = Literal("a"), Literal("a")
+        for _ in range(depth):
+            node, twin = Star(node), Star(twin)
+        self.assertEqual(node, twin)
+        self.assertEqual(simplify(node).regex, Star(Literal("a")))
+
+class TestStreamMatcher(unittest.TestCase):
+
+    def matchers(self):
+        nfa = parse_regex("(a|b)*(bc|ab)c*").to_nfa()
+        yield nfa, nfa.stream()
+        yield nfa, nfa.stream(use_dfa=True)
+        for engine in compiler.ENGINES:
+            yield nfa, compiler.compile("(a|b)*(bc|ab)c*", engine=engine).stream()
+
+    def test_chunks_agree_with_match(self):
+        for nfa, matcher in self.matchers():
+            for s in ["", "ab", "aabcc", "bcx", "abab", "babcccc"]:
+                for size in (1, 2, 5):
+                    matcher.reset()
+                    for i in range(0, len(s), size):
+                        matcher.feed(s[i:i + size])
+                    self.assertEqual(matcher.is_accepting(), nfa.match(s), (s, size))
+                    self.assertEqual(matcher.position, len(s))
+
+    def test_checkpoint_and_restore(self):
+        for nfa, matcher in self.matchers():
+            matcher.feed("aab")
+            saved = pickle.loads(pickle.dumps(matcher.checkpoint()))
+            matcher.feed("x")
+            self.assertTrue(matcher.is_dead())
+            matcher.restore(saved)
+            matcher.feed("cc")
+            self.assertTrue(matcher.is_accepting())
+            self.assertEqual(matcher.position, 5)
+
+class TestSearch(unittest.TestCase):
+
+    def leftmost_longest(self, nfa, text):
+        for start in range(len(text) + 1):
+            for end in range(len(text), start - 1, -1):
+                if nfa.match(text[start:end]):
+                    return (start, end)
+        return None
+
+    def test_search_is_leftmost_longest(self):
+        for pattern in ["ab|a", "abcd|c", "(a|b)*b", "ba*|ab", "a*"]:
+            nfa = parse_regex(pattern).to_nfa()
+            for text in all_strings("abcd", 4):
+                m = nfa.search(text)
+                self.assertEqual(m.span() if m else None, self.leftmost_longest(nfa, text), (pattern, text))
+
+    def test_finditer(self):
+        pattern = compiler.compile("a*")
+        self.assertEqual([m.span() for m in pattern.finditer("baaab")], [(0, 0), (1, 4), (4, 4), (5, 5)])
+        pattern = compiler.compile("ab|b")
+        self.assertEqual([m.group() for m in pattern.finditer("xabbab", 1)], ["ab", "b", "ab"])
+        self.assertIsNone(pattern.search("xabbab", 0, 1))
+
+    def test_finditer_is_repeated_leftmost_longest(self):
+        for pattern in ["a*b|a", "ab|a", "(a|b)*b", "a*", "aa|aaa|b*", "a(b|@)c*|bc"]:
+            nfa = parse_regex(pattern).to_nfa()
+            for text in all_strings("abc", 5):
+                expected, pos = [], 0
+                while pos <= len(text):
+                    span = self.leftmost_longest(nfa, text[pos:])
+                    if span is None:
+                        break
+                    expected.append((pos + span[0], pos + span[1]))
+                    pos += span[1] if span[1] > span[0] else span[1] + 1
+                self.assertEqual([m.span() for m in nfa.finditer(text)], expected, (pattern, text))
+
+    def test_finditer_reads_each_character_once(self):
+        reads = []
+
+        class CountingStr(str):
+            def __getitem__(self, i):
+                reads.append(i)
+                return str.__getitem__(self, i)
+
+        # every "a" is a match, but whether "a*b" matches is only known at the end of the input
+        text = CountingStr("a" * 2000)
+        self.assertEqual(len(list(compiler.compile("a*b|a").finditer(text))), 2000)
+        self.assertEqual(sorted(reads), list(range(2000)))
+
+    def test_bytes_and_mmap(self):
+        import mmap
+        pattern = compiler.compile("e(r|rr)o*r")
+        data = b"ok ok error ok erroor"
+        self.assertEqual([m.span() for m in pattern.finditer(data)], [(6, 11), (15, 21)])
+        self.assertEqual(pattern.search(data).group(), b"error")
+        with mmap.mmap(-1, len(data)) as mapped:
+            mapped.write(data)
+            self.assertEqual([m.span() for m in pattern.finditer(mapped)], [(6, 11), (15, 21)])
+
+class TestRegexSet(unittest.TestCase):
+
+    PATTERNS = ["(a|b)*abb", "a*", "ab|ba", "(ab)*", "b(a|b)*", "@"]
+
+    def test_matches_agree_with_each_pattern(self):
+        nfas = [parse_regex(p).to_nfa() for p in self.PATTERNS]
+        for use_dfa in (False, True):
+            regex_set = RegexSet(self.PATTERNS, use_dfa=use_dfa)
+            for s in all_strings("abc", 5):
+                expected = {i for i, nfa in enumerate(nfas) if nfa.match(s)}
+                self.assertEqual(regex_set.matches(s), expected, (use_dfa, s))
+                self.assertEqual(regex_set.is_match(s), bool(expected))
+
+    def test_asts_and_single_start(self):
+        regex_set = RegexSet([Literal("a"), Star(Literal("b")), "ab"])
+        self.assertEqual(len(regex_set), 3)
+        self.assertEqual(regex_set.matches(""), {1})
+        self.assertEqual(len(regex_set.nfa.accept_states), 3)
+        self.assertGreater(len(regex_set.nfa.get_epsilon_closure({regex_set.nfa.start_state})), 3)
+        with self.assertRaises(ValueError):
+            RegexSet([])
+
+class TestEpsilonClosure(unittest.TestCase):
+
+    def naive_closure(self, nfa, states):
+        stack = list(states)
+        closure = set(states)
+        while stack:
+            for dest in nfa.trans_func.get((stack.pop(), "ε"), set()):
+                if dest not in closure:
+                    closure.add(dest)
+                    stack.append(dest)
+        return closure
+
+    def test_closure_matches_naive_walk(self):
+        # nested stars create epsilon-cycles
+        nfa = Concat(Star(Star(Union(Literal("a"), Star(Literal("b"))))), Literal("c")).to_nfa()
+        for s in nfa.states:
+            self.assertEqual(nfa.get_epsilon_closure({s}), self.naive_closure(nfa, {s}))
+        self.assertEqual(nfa.get_epsilon_closure(nfa.states), nfa.states)
+
+    def test_closure_invalidated_by_add_transition(self):
+        nfa = Concat(Literal("a"), Literal("b")).to_nfa()
+        self.assertEqual(nfa.get_epsilon_closure({nfa.start_state}), {nfa.start_state})
+        nfa.add_transition(nfa.start_state, "ε", nfa.accept_state)
+        self.assertEqual(nfa.get_epsilon_closure({nfa.start_state}), {nfa.start_state, nfa.accept_state})
+        self.assertTrue(nfa.match(""))
+
+class TestBitsetMatch(unittest.TestCase):
+
+    def test_bitset_agrees_with_nfa(self):
+        nfa = Concat(Star(Union(Literal("a"), Concat(Literal("b"), Literal("c")))), Star(Literal("a"))).to_nfa()
+        engine = nfa.to_bitset()
+        for s in ["", "a", "bc", "abca", "aabcbca", "b", "cb", "abcx", "x"]:
+            self.assertEqual(engine.match(s), nfa.match(s), s)
+            self.assertEqual(list(engine.trace_match(s)), list(nfa.trace_match(s)), s)
+
+    def test_shifted_and_general_edges_agree(self):
+        for pattern in ["abc|abd|a", "(a|ab)(c|bcd)", "[a-c]b|ab*", "((a|b)(a|b))*"]:
+            nfa = parse_regex(pattern).to_nfa()
+            for variant in (nfa, optimize_nfa(nfa)[0], nfa.freeze()):
+                engine = BitsetNFA(variant)
+                for s in all_strings("abcd", 4):
+                    self.assertEqual(engine.match(s), nfa.match(s), (pattern, s))
+                    self.assertEqual(list(engine.trace_match(s)), list(variant.trace_match(s)), (pattern, s))
+        # the literal edges of a Thompson NFA are all stepped by a shift
+        engine = parse_regex("abc|abd").to_nfa().to_bitset()
+        self.assertFalse(any(other_mask for _, other_mask, _ in engine._steps.values()))
+
+class TestCompactNFA(unittest.TestCase):
+
+    def build_nfa(self):
+        return Concat(Star(Union(Literal("a"), Concat(Literal("b"), Literal("c")))), Literal("d")).to_nfa()
+
+    def test_compact_agrees_with_nfa(self):
+        nfa = self.build_nfa()
+        compact = nfa.freeze()
+        for s in ["", "d", "ad", "bcd", "abcad", "abd", "dd", "x"]:
+            self.assertEqual(compact.match(s), nfa.match(s), s)
+            self.assertEqual(list(compact.trace_match(s)), list(nfa.trace_match(s)), s)
+
+    def test_compact_keeps_nfa_interface(self):
+        nfa = self.build_nfa()
+        compact = nfa.freeze()
+        self.assertEqual(compact.states, nfa.states)
+        self.assertEqual(compact.alphabet, nfa.alphabet)
+        self.assertEqual(compact.start_state, nfa.start_state)
+        self.assertEqual(compact.accept_state, nfa.accept_state)
+        self.assertEqual(compact.trans_func, nfa.trans_func)
+        for s in nfa.states:
+            self.assertEqual(compact.get_epsilon_closure({s}), nfa.get_epsilon_closure({s}))
+
+    def test_compact_is_immutable(self):
+        compact = self.build_nfa().freeze()
+        with self.assertRaises(AttributeError):
+            compact._start = 0
+
+class TestSerialize(unittest.TestCase):
+
+    PATTERNS = ["(a|b)*abb", "ab|ba", "(ab)*c", "@", "(a|b|c)*"]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "pattern.rnfa")
+
+    def test_compiled_pattern_round_trip(self):
+        for pattern in self.PATTERNS:
+            compiled = compiler.compile(pattern)
+            compiled.save(self.path)
+            loaded = compiler.load(self.path)
+            self.assertEqual(loaded.pattern, pattern)
+            self.assertEqual(loaded.nfa.memory_usage(), compiled.nfa.memory_usage())
+            for s in all_strings("abcx", 4):
+                self.assertEqual(loaded.match(s), compiled.match(s), (pattern, s))
+            self.assertEqual(pickle.loads(pickle.dumps(loaded)).match("abb"), compiled.match("abb"))
+            del loaded
+
+    def test_dfa_round_trip(self):
+        for pattern in self.PATTERNS:
+            dfa = parse_regex(pattern).to_nfa().to_dfa().minimize()
+            serialize.save(dfa, self.path)
+            loaded, _ = serialize.load(self.path)
+            self.assertEqual(loaded.trans_func, dfa.trans_func)
+            for s in all_strings("abcx", 4):
+                self.assertEqual(loaded.match(s), dfa.match(s), (pattern, s))
+            del loaded
+
+    def test_rejects_bad_files(self):
+        data = serialize.dumps(compiler.compile("ab*"))
+        for bad in [b"", b"XXXX" + data[4:], data[:-8]]:
+            with self.assertRaises(ValueError):
+                serialize.loads(bad)
+
+    def test_corrupt_body_raises_at_load(self):
+        import struct
+        for automaton in [compiler.compile("(a|b)*abb"), parse_regex("(a|b)*abb").to_nfa().to_dfa().minimize()]:
+            data = serialize.dumps(automaton)
+            for offset in range(serialize._HEADER.size, len(data) - 3, 4):
+                for value in [-1, 3, 1000]:
+                    bad = bytearray(data)
+                    struct.pack_into("=i", bad, offset, value)
+                    try:
+                        loaded, _ = serialize.loads(bytes(bad))
+                    except ValueError:
+                        continue
+                    # a corruption that keeps the arrays consistent loads an automaton that still matches without error
+                    for s in all_strings("abx", 4):
+                        loaded.match(s)
+                        if isinstance(loaded, serialize.CompactNFA):
+                            list(loaded.trace_match(s))
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_collects_phases_and_counters(self):
+        phases = []
+        with instrument.collect(callback=lambda phase, seconds, stats: phases.append(phase)) as stats:
+            nfa = parse_regex("(a|b)*abb").to_nfa()
+            self.assertTrue(nfa.match("abaabb"))
+        self.assertEqual(phases, ["parse", "construct", "closure_index", "simulate"])
+        self.assertEqual((stats.nfa_states, stats.nfa_edges), (len(nfa.states), sum(map(len, nfa.trans_func.values()))))
+        self.assertEqual(stats.characters, 6)
+        self.assertEqual(stats.closure_computations, 7)
+        self.assertEqual(stats.peak_active_states, max(map(len, nfa.trace_match("abaabb"))))
+
+    def test_off_outside_collect(self):
+        with instrument.collect() as stats:
+            pass
+        self.assertIsNone(instrument.current())
+        parse_regex("ab").to_nfa().match("ab")
+        self.assertEqual((stats.characters, stats.phase_times), (0, {}))
+
+class TestLayoutCache(unittest.TestCase):
+
+    def shifted(self, nfa, offset):
+        trans_func = {(src + offset, sym): {d + offset for d in dests} for (src, sym), dests in nfa.trans_func.items()}
+        return NFA({s + offset for s in nfa.states}, set(nfa.alphabet), nfa.start_state + offset, nfa.accept_state + offset, trans_func)
+
+    def test_canonical_key_ignores_numbering(self):
+        nfa = parse_regex("(a|b)*c").to_nfa()
+        key, ids, edges = canonical_key(nfa)
+        self.assertEqual(canonical_key(self.shifted(nfa, 100))[0], key)
+        self.assertEqual(canonical_key(compiler.compile("(a|b)*c", engine="nfa"))[0], key)
+        self.assertNotEqual(canonical_key(parse_regex("(a|b)*d").to_nfa())[0], key)
+        self.assertEqual(ids, sorted(nfa.states))
+        self.assertEqual(sorted(edges), sorted((src, sym, d) for (src, sym), dests in nfa.trans_func.items() for d in dests))
+
+    def test_lru_and_disk_tiers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LayoutCache(maxsize=2, directory=directory)
+            for key in "abc":
+                cache.put(key, {"nodes": [[1.0, 2.0]], "key": key})
+            self.assertEqual(len(cache), 2)
+            # "a" was evicted from memory but is still on disk, also for another worker
+            self.assertEqual(cache.get("a")["key"], "a")
+            self.assertEqual(cache.disk_hits, 1)
+            self.assertEqual(LayoutCache(directory=directory).get("b")["key"], "b")
+            self.assertIsNone(cache.get("d"))
+        self.assertIsNone(LayoutCache().get("a"))
+
+    def test_disk_tier_evicts_least_recently_used_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LayoutCache(maxsize=1, directory=directory, max_files=2)
+            cache.put("a", {"key": "a"})
+            cache.put("b", {"key": "b"})
+            os.utime(os.path.join(directory, "a.json"), (1000, 1000))
+            os.utime(os.path.join(directory, "b.json"), (2000, 2000))
+            # reading "a" from disk makes it the most recently used file
+            self.assertEqual(LayoutCache(directory=directory).get("a")["key"], "a")
+            cache.put("c", {"key": "c"})
+            self.assertEqual(sorted(os.listdir(directory)), ["a.json", "c.json"])
+
+    def test_cytoscape_edges_follow_the_edge_index(self):
+        from unittest import mock
+        import web_visualizer
+
+        # a nondeterministic NFA with parallel edges between the same states
+        nfa = NFA({1, 2}, {"a", "b"}, 1, 2, {(1, "a"): {2}, (1, "b"): {2}, (2, "ε"): {1}})
+        _, _, edges = canonical_key(nfa)
+
+        # fake 'plain' output: every edge is a spline bent upward by its id, labelled with the id as graphviz_layout asked
+        plain = ["graph 1 3 1", "node 1 0 0 0.5 0.5 1 solid circle black lightgrey", "node 2 2 0 0.5 0.5 2 solid circle black lightgrey"]
+        for edge_id, (src, sym, dest) in enumerate(edges):
+            x1, x2 = (0, 2) if src == 1 else (2, 0)
+            plain.append(f"edge {src} {dest} 4 {x1} 0 {x1} {edge_id + 1} {x2} {edge_id + 1} {x2} 0 {edge_id} 1 1 solid black")
+        plain.append("stop")
+
+        web_visualizer.layout_cache.clear()
+        with mock.patch("graphviz.Digraph.pipe", return_value="\n".join(plain).encode("UTF-8")):
+            elems = web_visualizer.nfa_to_cytoscape_elems(nfa)
+
+        cy_edges = [e["data"] for e in elems if "id" in e["data"] and e["data"]["id"].startswith("e")]
+        self.assertEqual(sorted((int(e["source"]), e["label"], int(e["target"])) for e in cy_edges), sorted(edges))
+        self.assertTrue(all(len(e["distances"]) == 2 and len(e["weights"]) == 2 for e in cy_edges))
+        # the two parallel edges keep distinct curves
+        self.assertEqual(len({tuple(e["distances"]) for e in cy_edges}), len(cy_edges))
+
+class TestSessionStore(unittest.TestCase):
+
+    class Clock:
+        # one second passes at every reading
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            self.now += 1
+            return self.now
+
+    def check_store(self, make_store):
+        clock = self.Clock()
+        store = make_store(maxsize=2, ttl=60, clock=clock)
+        patterns = [compiler.compile(p) for p in ("(a|b)*abb", "ab*", "c")]
+
+        store.put("s1", patterns[0])
+        store.put("s2", patterns[1])
+        self.assertTrue(store.get("s1").match("abb"))
+        # s2 is the least recently used, evicted by a third session
+        store.put("s3", patterns[2])
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get("s2"))
+
+        # a get refreshes the TTL of its session only
+        clock.now += 50
+        self.assertIsNotNone(store.get("s1"))
+        clock.now += 50
+        self.assertIsNotNone(store.get("s1"))
+        self.assertIsNone(store.get("s3"))
+
+        store.delete("s1")
+        self.assertIsNone(store.get("s1"))
+        self.assertIsNone(store.get("unknown"))
+        return clock
+
+    def test_memory_store(self):
+        self.check_store(MemorySessionStore)
+        pattern = compiler.compile("(a|b)*abb")
+        store = MemorySessionStore(max_memory=pattern.memory_usage())
+        store.put("s1", pattern)
+        store.put("s2", pattern)
+        self.assertEqual(len(store), 1)
+        self.assertIs(store.get("s2"), pattern)
+        self.assertNotEqual(new_session_id(), new_session_id())
+
+    def test_sqlite_store_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.db")
+            self.check_store(lambda **kwargs: SQLiteSessionStore(path, **kwargs))
+
+            # two stores on the same file, as two workers would open it
+            worker_a, worker_b = SQLiteSessionStore(path), SQLiteSessionStore(path)
+            worker_a.put("s", compiler.compile("(a|b)*abb"))
+            loaded = worker_b.get("s")
+            self.assertTrue(loaded.match("aabb"))
+            self.assertEqual(loaded.pattern, "(a|b)*abb")
+            # loaded once per version
+            self.assertIs(worker_b.get("s"), loaded)
+            worker_a.put("s", compiler.compile("c"))
+            self.assertTrue(worker_b.get("s").match("c"))
+
+class TestPrecomputeTrace(unittest.TestCase):
+
+    def test_trace_is_stored_once_per_distinct_set(self):
+        from web_visualizer import precompute_trace
+
+        nfa = compiler.compile("(a|b)*abb")
+        trace = precompute_trace(nfa, "abaabb")
+        self.assertTrue(trace["accepted"])
+        self.assertEqual(len(trace["steps"]), 7)
+        self.assertEqual(len(trace["sets"]), len(set(trace["steps"])))
+        expected = [sorted(str(s) for s in active) for active in nfa.trace_match("abaabb")]
+        self.assertEqual([trace["sets"][i] for i in trace["steps"]], expected)
+
+    def test_dead_trace_covers_the_whole_string(self):
+        from web_visualizer import precompute_trace
+
+        trace = precompute_trace(compiler.compile("(a|b)*abb"), "abxab")
+        self.assertFalse(trace["accepted"])
+        self.assertEqual(len(trace["steps"]), 6)
+        self.assertEqual(trace["sets"][trace["steps"][-1]], [])
+
+class TestLayeredLayout(unittest.TestCase):
+
+    def test_thompson_bands_do_not_overlap(self):
+        nfa, positions = thompson_positions("(a|b)*(bc|ab)(dasf|bfaskd)*")
+        self.assertEqual(set(positions), nfa.states)
+        self.assertEqual(len(set(positions.values())), len(positions))
+        self.assertEqual(positions[nfa.start_state], (0, 0))
+        # the accept state ends the main band, right of every other state
+        rank, band = positions[nfa.accept_state]
+        self.assertEqual(band, 0)
+        self.assertEqual(rank, max(r for r, _ in positions.values()))
+
+    def test_layout_follows_the_construction_of_the_pattern(self):
+        pattern = compiler.compile("(a|b)*abb", engine="nfa")
+        _, _, edges = canonical_key(pattern)
+        layout = layered_layout(pattern, edges, pattern.pattern)
+        self.assertEqual(set(layout["nodes"]), {str(s) for s in pattern.states})
+        self.assertEqual(len({tuple(p) for p in layout["nodes"].values()}), len(layout["nodes"]))
+        # only the back edge of the star gets a control point
+        self.assertEqual(len(layout["edges"]), 1)
+        [(edge_id, points)] = layout["edges"].items()
+        self.assertEqual(edges[edge_id][1], "ε")
+        self.assertEqual(len(points), 6)
+
+    def test_other_nfas_are_layered(self):
+        nfa = compiler.compile("(a|b)*abb", optimize=True, simplify=True)
+        positions = layered_positions(nfa)
+        self.assertEqual(set(positions), nfa.states)
+        self.assertEqual(len(set(positions.values())), len(positions))
+        self.assertEqual(positions[nfa.start_state][0], 0)
+        # a pattern whose Thompson NFA is not the given NFA falls back to layering
+        _, _, edges = canonical_key(nfa)
+        self.assertEqual(len(layered_layout(nfa, edges, "(a|b)*abb")["nodes"]), len(nfa.states))
+
+class TestThompsonBuilder(unittest.TestCase):
+
+    def test_deep_ast_does_not_recurse(self):
+        depth = sys.getrecursionlimit() * 2
+        node = Literal("a")
+        for _ in range(depth):
+            node = Concat(node, Literal("b"))
+        nfa = node.to_nfa()
+        self.assertEqual(len(nfa.states), 2 * (depth + 1))
+        self.assertTrue(nfa.match("a" + "b" * depth))
+        self.assertFalse(nfa.match("a" + "b" * (depth - 1)))
+
+        node = Literal("a")
+        for _ in range(depth):
+            node = Star(node)
+        self.assertTrue(node.to_nfa().match("aaa"))
+
+    def test_sub_nfas_are_not_shared(self):
+        star = Star(Literal("a"))
+        self.assertTrue(star.to_nfa().match("aa"))
+        self.assertTrue(Concat(star, Literal("b")).to_nfa().match("aab"))
+        self.assertFalse(star.to_nfa().match("ab"))
+
+    def test_nfa_defaults_are_not_shared(self):
+        first, second = NFA(), NFA()
+        first.add_states(1)
+        self.assertEqual(second.states, set())
+
+class TestParser(unittest.TestCase):
+
+    def test_parse_and_match(self):
+        nfa = parse_regex("(a|b)*(bc|ab)@c*").to_nfa()
+        self.assertTrue(nfa.match("abc"))
+        self.assertTrue(nfa.match("babccc"))
+        self.assertFalse(nfa.match("ba"))
+
+    def test_deeply_nested_groups(self):
+        depth = sys.getrecursionlimit() * 2
+        nfa = parse_regex("(" * depth + "a|b" + ")" * depth + "c").to_nfa()
+        self.assertTrue(nfa.match("ac"))
+        self.assertTrue(nfa.match("bc"))
+        self.assertFalse(nfa.match("abc"))
+
+    def test_long_concat_is_balanced(self):
+        node = parse_regex("a" * 1024)
+        depth = 0
+        while isinstance(node, Concat):
+            node = node.left
+            depth += 1
+        self.assertEqual(depth, 10)
+
+    def test_error_positions(self):
+        for pattern, pos in [("(ab", 0), ("a(b|(c)", 1), ("ab)", 2), ("a||b", 2), ("*a", 0), ("a|", 2), ("", 0), ("()", 1)]:
+            with self.assertRaises(RegexSyntaxError) as cm:
+                parse_regex(pattern)
+            self.assertEqual(cm.exception.pos, pos, pattern)
+            self.assertIsInstance(cm.exception, ValueError)
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        compiler.purge()
+
+    def test_engines_agree(self):
+        for engine in compiler.ENGINES:
+            compiled = compiler.compile("(a|b)*abb", engine=engine)
+            self.assertEqual(compiled.engine, engine)
+            for s in ["abb", "aabb", "babb", "ab", "abba", ""]:
+                self.assertEqual(compiled.match(s), compiled.nfa.match(s), (engine, s))
+
+    def test_cache_hits_and_misses(self):
+        first = compiler.compile("ab*")
+        self.assertIs(compiler.compile("ab*"), first)
+        self.assertIsNot(compiler.compile("ab*", engine="nfa"), first)
+        info = compiler.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 2, 2))
+        self.assertGreater(info.memory, 0)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = compiler.PatternCache(maxsize=2)
+        patterns = {p: compiler.compile(p) for p in ["a", "b", "c"]}
+        cache.put("a", patterns["a"])
+        cache.put("b", patterns["b"])
+        cache.get("a")
+        cache.put("c", patterns["c"])
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("a"), patterns["a"])
+
+        cache = compiler.PatternCache(max_memory=patterns["a"].memory_usage())
+        cache.put("a", patterns["a"])
+        cache.put("b", patterns["b"])
+        self.assertEqual(cache.info().currsize, 1)
+
+    def test_warm_dfa_match_does_not_flush(self):
+        words = ["abc", "abd", "acb", "bad", "bca", "cab", "cda", "dab", "dbc", "dcd"] * 2
+        pattern = "(" + "|".join(w[:2] + str(i % 10) + w[2] for i, w in enumerate(words)) + ")*"
+        compiled = compiler.compile(pattern)
+        text = "".join(w[:2] + str(i % 10) + w[2] for i, w in enumerate(words)) * 100
+        self.assertTrue(compiled.match(text))
+        self.assertTrue(compiled.match(text))
+        self.assertEqual(compiled._matcher.flushes, 0)
+        # the DFA cache counts the bytes it holds, and the pattern is counted at the bound of its share of the compile cache
+        self.assertLessEqual(compiled._matcher.memory_usage(), compiler._cache.entry_memory)
+        nfa_only = compiler.compile(pattern, engine="nfa")
+        self.assertEqual(compiled.memory_usage(), nfa_only.memory_usage() + compiler._cache.entry_memory)
+
+    def test_lazy_dfa_memory_bound(self):
+        nfa = parse_regex("(a|b)*a" + "(a|b)" * 8).to_nfa()
+        lazy = LazyDFA(nfa, max_memory=20000)
+        for s in all_strings("ab", 11):
+            self.assertEqual(lazy.match(s), nfa.match(s), s)
+            self.assertLess(lazy.memory_usage(), 20000 + 3000)
+        self.assertGreater(lazy.flushes, 0)
+        self.assertEqual(pickle.loads(pickle.dumps(lazy)).max_memory, 20000)
+
+    def test_compiled_pattern_is_immutable(self):
+        compiled = compiler.compile("a")
+        with self.assertRaises(AttributeError):
+            compiled._engine = "nfa"
+
+    def test_compile_many(self):
+        patterns = ["(a|b)*c", "ab|ba", "(a|b)*c", "a*b*"]
+        expected = [repr(parse_regex(p).to_nfa().freeze()) for p in patterns]
+        for use_processes in (False, True):
+            compiler.purge()
+            compiled = compiler.compile_many(patterns, workers=2, use_processes=use_processes)
+            self.assertEqual([c.pattern for c in compiled], patterns)
+            self.assertIs(compiled[0], compiled[2])
+            self.assertEqual([repr(c.nfa) for c in compiled], expected)
+            self.assertIs(compiler.compile("ab|ba"), compiled[1])
+
+    def test_builds_number_states_independently(self):
+        ast = parse_regex("(a|b)*c")
+        self.assertEqual(repr(ast.to_nfa()), repr(ast.to_nfa()))
+        self.assertEqual(min(ast.to_nfa().states), 1)
+
+    def test_match_many(self):
+        compiled = compiler.compile("(a|b)*abb")
+        strings = ["abb", "ab", "babb", "", "aabb", "abba"] * 7
+        expected = bytearray(compiled.match(s) for s in strings)
+        self.assertEqual(compiled.match_many(strings, chunksize=5, workers=1), expected)
+        self.assertEqual(compiled.match_many(iter(strings), chunksize=5, workers=2), expected)
+        self.assertEqual(list(compiled.match_many(strings, chunksize=4, workers=2, lazy=True)), [bool(r) for r in expected])
+        self.assertEqual(compiled.match_many([], workers=2), bytearray())
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(RegexSyntaxError):
+            compiler.compile("a(")
+        with self.assertRaises(ValueError):
+            compiler.compile("a", engine="perl")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
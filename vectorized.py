@@ -0,0 +1,139 @@
+'''
+NumPy-vectorized DFA matching
+
+The transition function of a DFA is exported as a dense int32 matrix of states x symbol classes, and a batch of strings is matched in lockstep: one
+fancy-indexing step advances every string by one character, so the per-character work runs in NumPy's C loops instead of the interpreter.
+
+NumPy is an optional dependency, only needed by this module.
+'''
+
+from alphabet import DEAD_CLASS
+from dfa import DFA, DEAD
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for vectorized matching, install it with: pip install numpy")
+
+def dfa_matrix(dfa):
+    '''
+    return the transition matrix of dfa as a NumPy int32 array of shape (num_states + 1, num_classes + 1)
+
+    Row num_states is the dead state, every missing transition leads to it and it never leaves it. Column c is the symbol class c of
+    dfa.symbol_classes (DEAD_CLASS included), and the last column is the padding class, which leaves every state unchanged, so strings of different
+    lengths can be padded to one length
+    '''
+    _require_numpy()
+
+    num_states = len(dfa.states)
+    num_classes = dfa.symbol_classes.num_classes
+
+    matrix = np.empty((num_states + 1, num_classes + 1), dtype=np.int32)
+    table = np.frombuffer(dfa.table, dtype=np.int32).reshape(num_states, num_classes)
+
+    matrix[:num_states, :num_classes] = np.where(table == DEAD, num_states, table)
+    matrix[num_states, :num_classes] = num_states
+    matrix[:, num_classes] = np.arange(num_states + 1, dtype=np.int32)
+
+    return matrix
+
+class VectorizedDFA:
+    '''
+    VectorizedDFA class
+
+    Matches batches of strings against a DFA with NumPy. The strings are encoded once into a (length x batch) matrix of class ids, then the state
+    vector of the whole batch is advanced one column at a time with a single fancy-indexing lookup into the transition matrix
+
+    An NFA (or anything with a to_dfa method) is determinized and minimized first
+    '''
+
+    def __init__(self, automaton):
+        '''
+        initialize the VectorizedDFA object from a DFA or an NFA
+        '''
+        _require_numpy()
+
+        dfa = automaton if isinstance(automaton, DFA) else automaton.to_dfa().minimize()
+        classes = dfa.symbol_classes
+
+        self._dfa = dfa
+        self._matrix = dfa_matrix(dfa)
+        self._pad_class = classes.num_classes
+
+        # acceptance of every row of the matrix, the dead row rejects
+        self._accepting = np.zeros(len(dfa.states) + 1, dtype=bool)
+        self._accepting[list(dfa.accept_states)] = True
+
+        # class id of every code point up to the largest one of the alphabet, plus a DEAD_CLASS sentinel for every larger code point
+        max_code = max((ord(sym) for sym in classes.class_of), default=0)
+        self._code_classes = np.full(max_code + 2, DEAD_CLASS, dtype=np.int32)
+        for sym, class_id in classes.class_of.items():
+            self._code_classes[ord(sym)] = class_id
+
+    @property
+    def dfa(self):
+        '''
+        return the DFA the matrix was built from
+        '''
+        return self._dfa
+
+    @property
+    def matrix(self):
+        '''
+        return the int32 transition matrix, see dfa_matrix
+        '''
+        return self._matrix
+
+    def encode(self, strings):
+        '''
+        return the (max length x batch) int32 matrix of the class ids of strings (str or bytes, read as latin-1), padded with the padding class
+        '''
+        strings = list(strings)
+        lengths = np.fromiter(map(len, strings), dtype=np.intp, count=len(strings))
+        width = int(lengths.max(initial=0))
+
+        if width == 0:
+            return np.empty((0, len(strings)), dtype=np.int32)
+
+        # one fixed-width NumPy string per input, viewed as a matrix of code points
+        if strings and isinstance(strings[0], (bytes, bytearray)):
+            codes = np.array(strings, dtype=f"S{width}").view(np.uint8)
+        else:
+            codes = np.array(strings, dtype=f"U{width}").view(np.uint32)
+
+        codes = codes.reshape(len(strings), width)
+        classes = self._code_classes[np.minimum(codes, len(self._code_classes) - 1)]
+
+        # the positions past the end of each string are padding, whatever code point fills them
+        classes[np.arange(width) >= lengths[:, None]] = self._pad_class
+
+        return np.ascontiguousarray(classes.T)
+
+    def run(self, encoded):
+        '''
+        return the vector of the final states of the columns of encoded (an encode() matrix); dead strings end in the dead row
+        '''
+        # index the flattened matrix with state * width + class, in place, which is cheaper than 2-d fancy indexing
+        flat = self._matrix.ravel()
+        width = self._matrix.shape[1]
+
+        # take() only writes into an out array of the matrix's own dtype, the index needs the wider intp
+        states = np.zeros(encoded.shape[1], dtype=self._matrix.dtype)
+        index = np.empty(encoded.shape[1], dtype=np.intp)
+
+        for column in encoded:
+            np.multiply(states, width, out=index)
+            index += column
+            np.take(flat, index, out=states)
+
+        return states
+
+    def match_batch(self, strings):
+        '''
+        return a NumPy boolean vector that tells, for every string of strings, whether the DFA accepts it
+        '''
+        return self._accepting[self.run(self.encode(strings))]
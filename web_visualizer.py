@@ -1,121 +1,241 @@
-from parser import parse_regex
 from dash import Dash, html, dcc, Input, Output, State, callback_context as ctx, no_update
 import graphviz
 import dash_cytoscape as cyto
-from nfa import global_id_gen
+import os
+
+import compiler
+from layered_layout import layered_layout
+from layout_cache import LayoutCache, canonical_key
+from session_store import MemorySessionStore, SQLiteSessionStore, new_session_id
 
 SCALE_X = 100
 SCALE_Y = 100
 
-test_nfa = None
+# layout engines of nfa_to_cytoscape_elems: Graphviz dot, or the in-process layered layout of layered_layout.py
+LAYOUT_ENGINES = ("graphviz", "layered")
+
+# layouts of the NFAs already rendered. Set NFA_LAYOUT_CACHE_DIR to a directory shared by the workers to let them reuse each other's layouts
+layout_cache = LayoutCache(directory=os.environ.get("NFA_LAYOUT_CACHE_DIR"))
+
+# compiled pattern of every browser session. Set NFA_SESSION_DB to an SQLite file shared by the workers of a multi-process deployment, so any
+# worker can serve any session
+session_store = SQLiteSessionStore(os.environ["NFA_SESSION_DB"]) if os.environ.get("NFA_SESSION_DB") else MemorySessionStore()
+
+def parse_plain_edge(parts):
+    '''
+    Parse the fields of an 'edge' statement of the Graphviz 'plain' output
+
+    return (edge id, points): the edge id is the label we gave the edge (see graphviz_layout), points are the flat [x₁, y₁, .., xₙ, yₙ] control
+    points of its spline
+    '''
+
+    '''
+    ---------------------
+    General format of this statement:
+            edge tail head n x₁ y₁ .. xₙ yₙ [label xl yl] style color
+    ---------------------
+    '''
+    n = int(parts[3])
+    points = [float(v) for v in parts[4:4 + 2 * n]]
+    label = parts[4 + 2 * n]
+
+    return int(label), points
+
+def graphviz_layout(nfa, edges):
+    '''
+    Lay the NFA out with the Graphviz dot engine
+
+    edges is the edge index of the NFA: the (src, symbol, dest) of every edge, whose position is its edge id. Each edge is sent to Graphviz with its
+    id as label, so the 'edge' statements of the output are matched back to their edge in constant time, parallel edges included
+
+    return the layout as {'nodes': {name: [x, y]}, 'edges': {edge id: [x₁, y₁, .., xₙ, yₙ]}}, in Graphviz units
+    '''
+
+    # build the graph structure using graphviz DOT engine
+    dot_eng = graphviz.Digraph(format='plain')
+    dot_eng.attr(rankdir="LR")
+
+    # load the NFA states into dot_eng
+    for s in nfa.states:
+        dot_eng.node(str(s))
+
+    # load the NFA edges into dot_eng, labelled with their edge id
+    for edge_id, (src, sym, dest) in enumerate(edges):
+        dot_eng.edge(str(src), str(dest), label=str(edge_id))
+
+    # render to 'plain' format and extract positions
+    # decode in "UTF-8" format as this is the default text output from Graphviz
+    plain_output = dot_eng.pipe(format="plain").decode("UTF-8")
+
+    nodes = {}
+    edge_points = {}
+
+    # parse the 'plain' output format
+
+    for line in plain_output.splitlines():
+        parts = line.split()
+
+        # only need the 'node' and the 'edge' statements, disregard the 'graph' and 'stop' statements
+        if parts[0] == 'node':
+            '''
+            ---------------------
+            General format of this statement:
+
+                    node name x y width height label style shape color fillcolor
+
+            ---------------------
+            '''
+
+            # get the node's name, x and y coordinates
+            # these information are contained in the first 4 indices of parts
+            name, x, y = parts[1:4]
+            nodes[name] = [float(x), float(y)]
+
+        elif parts[0] == 'edge':
+            edge_id, points = parse_plain_edge(parts)
+            edge_points[edge_id] = points
+
+    return {'nodes': nodes, 'edges': edge_points}
+
+def cached_layout(nfa, trans_func, engine="graphviz"):
+    '''
+    return (layout, edges): the layout of the NFA by the given engine (one of LAYOUT_ENGINES) and its edge index
+
+    A graphviz layout is taken from layout_cache when a structurally identical NFA was laid out before. The cache stores states by their rank
+    among the sorted state ids (see layout_cache.canonical_key), and they are mapped back to the names of this NFA. Edge ids are the same for
+    every NFA with the same key. The layered layout is cheap enough to be recomputed, and is also used when the dot binary is missing
+    '''
+    if engine not in LAYOUT_ENGINES:
+        raise ValueError(f"Unknown layout engine {engine!r}, expected one of {LAYOUT_ENGINES}")
+
+    key, ids, edges = canonical_key(nfa, trans_func)
+
+    if engine == "layered":
+        return layered_layout(nfa, edges, getattr(nfa, "pattern", None)), edges
+
+    cached = layout_cache.get(key)
+
+    names = [str(s) for s in ids]
+
+    if cached is None:
+        try:
+            layout = graphviz_layout(nfa, edges)
+        except graphviz.ExecutableNotFound:
+            return layered_layout(nfa, edges, getattr(nfa, "pattern", None)), edges
+
+        layout_cache.put(key, {
+            'nodes': [layout['nodes'][name] for name in names],
+            'edges': [layout['edges'].get(edge_id, []) for edge_id in range(len(edges))],
+        })
+
+        return layout, edges
 
-# test_regex = "(a|b)"
-# test_nfa = parse_regex(test_regex).to_nfa()
+    layout = {
+        'nodes': {name: position for name, position in zip(names, cached['nodes'])},
+        'edges': dict(enumerate(cached['edges'])),
+    }
 
-def nfa_to_cytoscape_elems(nfa):
+    return layout, edges
+
+def control_points(points, source, target):
     '''
-    Convert the NFA into Cytoscape elements
+    Convert the interior control points of a Graphviz spline, in Cytoscape coordinates, to the control-point-distances and control-point-weights
+    of a Cytoscape 'unbundled-bezier' edge from source to target
+
+    return (distances, weights), or None for a loop or a straight edge
+    '''
+    dx, dy = target[0] - source[0], target[1] - source[1]
+    length_sq = dx * dx + dy * dy
+
+    # the first and the last points are the ends of the spline, on the node borders
+    interior = points[1:-1]
+
+    if length_sq == 0 or not interior:
+        return None
+
+    length = length_sq ** 0.5
+    distances = []
+    weights = []
+
+    for x, y in interior:
+        px, py = x - source[0], y - source[1]
+
+        # distance along the normal (-dy, dx) of the source -> target line, and position along that line
+        distances.append(round((px * -dy + py * dx) / length, 2))
+        weights.append(round((px * dx + py * dy) / length_sq, 4))
+
+    return distances, weights
+
+def nfa_to_cytoscape_elems(nfa, engine="graphviz"):
+    '''
+    Convert the NFA into Cytoscape elements, laid out by engine (one of LAYOUT_ENGINES)
     '''
     
     if nfa:
 
-        # build the graph structure using graphviz DOT engine
-        dot_eng = graphviz.Digraph(format='plain')
-        dot_eng.attr(rankdir="LR")
+        # bind the transition function once, a CompactNFA rebuilds it on every access
+        trans_func = nfa.trans_func
+        accept_names = {str(s) for s in nfa.accept_states}
+        start_name = str(nfa.start_state)
 
-        # load the NFA states into dot_eng
-        for s in nfa.states:
-            dot_eng.node(str(s))
+        layout, edge_index = cached_layout(nfa, trans_func, engine)
 
-        # load the NFA edges into dot_eng
-        for (src, sym), dests in nfa.trans_func.items():
-            for dest in dests:
-                dot_eng.edge(str(src), str(dest), label=sym)
-        
-        # render to 'plain' format and extract positions
-        # decode in "UTF-8" format as this is the default text output from Graphviz
-        plain_output = dot_eng.pipe(format="plain").decode("UTF-8")
+        nodes = []
+        edges = [{'data': {'source': 'initial_marker', 'target': start_name, 'label': 'Start'}}]
+
+        for name, (x, y) in layout['nodes'].items():
+            # JSON format for the node, appropriate format for Cytoscape
+            # scale the coordinates appropriately
+            node_elem = {
+                'data': {
+                    'id':name, 
+                    'label': "q"+name
+                },
+                'position': {
+                    'x': x * SCALE_X,
+                    'y': -y * SCALE_Y
+                },
+                'classes': 'state'
+            }
+
+            if (name in accept_names):
+                node_elem['classes'] += " " + "accept"
+            
+            if (name == start_name):
+                node_elem['classes'] += " " + "start"
 
-        # coordinates for the 'invisible' start state (the invisible state that the 'Start' edge originates from)
-        x_start, y_start = 0.0, 0.0
+            nodes.append(node_elem)
 
-        nodes = []
-        edges = [{'data': {'source': 'initial_marker', 'target': str(nfa.start_state), 'label': 'Start'}}]
-
-        # parse the 'plain' output format
-
-        for line in plain_output.splitlines():
-            parts = line.split()
-
-            # only need the 'node' and the 'edge' statements, disregard the 'graph' and 'stop' statements
-            if parts[0] == 'node':
-                '''
-                ---------------------
-                General format of this statement:
-
-                        node name x y width height label style shape color fillcolor
-
-                ---------------------
-                '''
-
-                # get the node's name, x and y coordinates
-                # these information are contained in the first 4 indices of parts
-                name, x, y = parts[1:4]
-
-                # JSON format for the node, appropriate format for Cytoscape
-                # scale the coordinates appropriately
-                node_elem = {
-                    'data': {
-                        'id':name, 
-                        'label': "q"+name
-                    },
-                    'position': {
-                        'x': float(x) * SCALE_X,
-                        'y': -float(y) * SCALE_Y
-                    },
-                    'classes': 'state'
-                }
+        for edge_id, (src, sym, dest) in enumerate(edge_index):
+            head, tail = str(src), str(dest)
+
+            # JSON format for the edge, appropriate format for Cytoscape
+            edge_elem = {
+                'data': {
+                    'id': f"e{edge_id}",
+                    'source': head,
+                    'target': tail,
+                    'label': sym
+                },
+                'classes': 'edge'
+            }
+
+            # keep the spline computed by Graphviz, scaled like the nodes
+            points = layout['edges'].get(edge_id)
 
-                if (name == str(nfa.accept_state)):
-                    node_elem['classes'] += " " + "accept"
-                
-                if (name == str(nfa.start_state)):
-                    x_start = float(x)
-                    y_start = float(y)
-
-                    node_elem['classes'] += " " + "start"
-                
-
-                nodes.append(node_elem)
-
-            if (parts[0] == 'edge'):
-                '''
-                ---------------------
-                General format of this statement:
-                        edge tail head n x₁ y₁ .. xₙ yₙ [label xl yl] style color
-                ---------------------
-                '''
-
-                # cytoscape only need the 'tail' and 'head' parameters to create an edge
-                head, tail = parts[1:3]
-                
-                # get the label for the edge
-                label= ''
-                for (src, sym), dests in nfa.trans_func.items():
-                    if (str(src) == head) and (int(tail) in nfa.trans_func[(src, sym)]):
-                        label = sym
-
-                # JSON format for the edge, appropriate format for Cytoscape
-                edge_elem = {
-                    'data': {
-                        'source': head,
-                        'target': tail,
-                        'label': label
-                    },
-                    'classes': 'edge'
-                }        
-
-                edges.append(edge_elem)
+            if points and head in layout['nodes'] and tail in layout['nodes']:
+                scaled = [(points[i] * SCALE_X, -points[i + 1] * SCALE_Y) for i in range(0, len(points), 2)]
+                (x1, y1), (x2, y2) = layout['nodes'][head], layout['nodes'][tail]
+                curve = control_points(scaled, (x1 * SCALE_X, -y1 * SCALE_Y), (x2 * SCALE_X, -y2 * SCALE_Y))
+
+                if curve is not None:
+                    edge_elem['data']['distances'], edge_elem['data']['weights'] = curve
+                    edge_elem['classes'] += " " + "curved"
+
+            edges.append(edge_elem)
+
+        # coordinates for the 'invisible' start state (the invisible state that the 'Start' edge originates from)
+        x_start, y_start = layout['nodes'].get(start_name, (0.0, 0.0))
 
         # append the invisible 'initial_marker' node as the head for the 'Start' edge
         nodes.append({
@@ -131,18 +251,41 @@ def nfa_to_cytoscape_elems(nfa):
     else:
         return []
     
-def get_active_states(nfa, ch, prev_states):
-    # curr_states = nfa.get_epsilon_closure({nfa.start_state})
-    curr_states = nfa.get_epsilon_closure(prev_states)
-    
-    # compute states reachable by consuming ch
-    next_states = set()
-    for s in curr_states:
-        next_states |= nfa.get_next_state(s, ch)
+def precompute_trace(nfa, test_str):
+    '''
+    return the whole trace of the NFA on test_str, in the compact form stepped through by the clientside callback of the app:
+
+        - string: Str : test_str
+        - sets: List[List[Str]] : every distinct set of active states of the trace, as node ids
+        - steps: List[Int] : for every position 0..len(test_str), the index in sets of the states active after that many characters
+        - accepted: Bool : True if the NFA accepts test_str
+
+    A trace usually goes through few distinct sets, so each one is shipped to the browser once
+    '''
+    sets = []
+    set_ids = {}
+    steps = []
+    active = set()
+
+    for active in nfa.trace_match(test_str):
+        key = frozenset(active)
+        set_id = set_ids.get(key)
+
+        if set_id is None:
+            set_id = set_ids[key] = len(sets)
+            sets.append(sorted(str(s) for s in active))
 
-    new_active_states = nfa.get_epsilon_closure(next_states)
-    # print(f"{ch}: {new_active_states}")
-    return (ch, new_active_states)
+        steps.append(set_id)
+
+    # the trace stops at the first character out of the alphabet, the string stays dead until its end
+    steps.extend([steps[-1]] * (len(test_str) + 1 - len(steps)))
+
+    return {
+        'string': test_str,
+        'sets': sets,
+        'steps': steps,
+        'accepted': not nfa.accept_states.isdisjoint(active),
+    }
 
 '''
 ---------------------
@@ -179,6 +322,15 @@ stylesheet = [
                     'color': '#34495e'
                 }
     },
+    # edges that follow the spline computed by Graphviz
+    {
+        'selector': '.curved',
+        'style': {
+                    'curve-style': 'unbundled-bezier',
+                    'control-point-distances': 'data(distances)',
+                    'control-point-weights': 'data(weights)',
+                }
+    },
     {
         'selector': '#initial_marker',
         'style': {
@@ -215,13 +367,29 @@ app.layout = html.Div([
                     n_clicks=0,
                     style={'margin': '10px', 'padding': '10px'}
                 ), 
+                # off by default: the Thompson NFA is the teaching view
+                dcc.Checklist(
+                    id='optimize-nfa',
+                    options=[{'label': ' Optimize (remove ε, merge states)', 'value': 'optimize'}],
+                    value=[],
+                    inline=True
+                ),
+                # Graphviz gives the best drawing, the layered layout runs in process and scales to large NFAs
+                dcc.RadioItems(
+                    id='layout-engine',
+                    options=[{'label': ' Graphviz', 'value': 'graphviz'}, {'label': ' Layered (fast)', 'value': 'layered'}],
+                    value='graphviz',
+                    inline=True
+                ),
             ]),
 
 
             html.Div([
+                # debounce: the trace is computed when the string is submitted (Enter or focus lost), not on every keystroke
                 dcc.Input(id="input-string", 
                                 type = "text", 
                                 placeholder = 'Enter test string', 
+                                debounce=True,
                                 style={
                                         "fontFamily": "Courier New, monospace",
                                         "fontSize": "20px",
@@ -229,6 +397,12 @@ app.layout = html.Div([
                                         "color": "#2c3e50",
                                         'textAlign': 'center'
                                     }),
+                html.Button(
+                        'Back', 
+                        id='trace-back-button', 
+                        n_clicks=0,
+                        style={'margin': '10px', 'padding': '10px'}
+                    ),
                 html.Button(
                         'Step', 
                         id='trace-nfa-button', 
@@ -236,6 +410,7 @@ app.layout = html.Div([
                         style={'margin': '10px', 'padding': '10px'}
                     ),
             ]),
+            dcc.Slider(id='trace-slider', min=0, max=0, step=1, value=0, marks=None, updatemode='drag'),
         ], style={
             'alignItem': 'start'
         }),
@@ -253,7 +428,15 @@ app.layout = html.Div([
 
     
 
+    html.Div(id='message-output', style={'textAlign': 'center', 'color': '#c0392b'}),
+
+    # the test string, split around the character consumed last
     html.Div(id='test-string-output',
+             children=[
+                html.Span(id='trace-before'),
+                html.Span(id='trace-current', style={'textDecoration': 'underline', 'fontSize': '1.2em', 'color': '#c0392b'}),
+                html.Span(id='trace-after'),
+             ],
              style={
                 "fontFamily": "Courier New, monospace",
                 "fontSize": "32px",
@@ -266,7 +449,7 @@ app.layout = html.Div([
         id = 'NFA-graph',
         layout={'name': 'preset', 'spacingFactor': 2.0, 'avoidOverlap': True},
         style={'width': '100%', 'height': '400px'},
-        elements = nfa_to_cytoscape_elems(test_nfa),
+        elements = [],
         stylesheet=stylesheet
     ),  
     html.Div(id='acceptance-output',
@@ -277,9 +460,13 @@ app.layout = html.Div([
             "color": "#2c3e50",
             'textAlign': 'center'
         }),
+    # position in the trace: number of characters consumed
     dcc.Store(id='str-idx'),
-    dcc.Store(id='nfa-curr-states'),
-    dcc.Store(id='test-string-acceptance'),
+    # the precomputed trace of the test string, see precompute_trace
+    dcc.Store(id='trace-data'),
+    dcc.Store(id='base-stylesheet', data=stylesheet),
+    # key of the compiled pattern of this page in session_store, set when the first NFA is generated
+    dcc.Store(id='session-id'),
 
 ])
 
@@ -287,60 +474,43 @@ app.layout = html.Div([
 
 @app.callback(
     Output('NFA-graph', 'layout'),
-    Output('NFA-graph', 'stylesheet'),
     Output('NFA-graph', 'elements'),
-    Output(component_id='test-string-output', component_property='children'),
-    Output(component_id='acceptance-output', component_property='children'),
-    Output('str-idx', 'data'),
-    Output('nfa-curr-states', 'data'),
-    Output('test-string-acceptance', 'data'),
+    Output('message-output', 'children'),
+    Output('trace-data', 'data'),
     Output(component_id='input-string', component_property='value'),
-
+    Output('session-id', 'data'),
 
     Input('reset-button', 'n_clicks'),
     Input('generate-nfa-button', 'n_clicks'),
-    Input('trace-nfa-button', 'n_clicks'),
+    Input(component_id='input-string', component_property='value'),
 
-    State(component_id='input-string', component_property='value'),
     State(component_id='input-regex', component_property='value'),
-    State('NFA-graph', 'elements'),
-    State('str-idx', 'data'),
-    State('nfa-curr-states', 'data'),
-    State('test-string-acceptance', 'data'),
+    State('optimize-nfa', 'value'),
+    State('layout-engine', 'value'),
+    State('session-id', 'data'),
 )
-def handle_callback(reset_clicks, 
-                    generate_clicks, 
-                    trace_clicks, 
-                    input_test_string, 
+def handle_callback(reset_clicks,
+                    generate_clicks,
+                    input_test_string,
                     input_regex,
-                    current_elements, 
-                    str_idx,
-                    nfa_curr_states,
-                    test_string_acceptance):
-    
-    global test_nfa
+                    optimize_nfa,
+                    layout_engine,
+                    session_id):
 
     # 1. Identify Trigger
     trigger_id = ctx.triggered_id
     default_layout = {'name': 'preset'}
-    str_idx = str_idx or {'idx': 0}
     input_test_string = input_test_string or ''
 
-    nfa_curr_states = nfa_curr_states or {'curr_states': set()}
-    test_string_acceptance = test_string_acceptance or False
-
     # --- A. Reset Button Trigger ---
     if trigger_id == 'reset-button':
         return (
             {
                 'name': 'preset', 'fit': True, 'animate': True, 'animationDuration': 500,
-                'reset_trigger': reset_clicks, 
+                'reset_trigger': reset_clicks,
             },
             no_update,
-            no_update, 
             no_update,
-            f"Accepted? {test_string_acceptance}",
-            str_idx,
             no_update,
             no_update,
             no_update
@@ -348,147 +518,109 @@ def handle_callback(reset_clicks,
 
     # --- B. NFA Generation Trigger ---
     elif trigger_id == 'generate-nfa-button':
+        session_id = session_id or new_session_id()
+
         try:
 
-            # Re-calculate and generate new elements
-            global_id_gen.reset_id()
-            test_nfa = parse_regex(input_regex).to_nfa()
-            cyto_nfa_elems = nfa_to_cytoscape_elems(test_nfa)
+            # Compile (or fetch the cached compiled pattern) and generate new elements
+            optimize = 'optimize' in (optimize_nfa or [])
+            test_nfa = compiler.compile(input_regex, optimize=optimize, simplify=optimize)
+            cyto_nfa_elems = nfa_to_cytoscape_elems(test_nfa, layout_engine or "graphviz")
 
-            nfa_curr_states['curr_states'] = [test_nfa.start_state]
+            # keep the compiled pattern for the test strings of this session
+            session_store.put(session_id, test_nfa)
 
-            # Return new elements, default layout, and updated test string value
-            return (default_layout, 
-                    stylesheet, 
-                    cyto_nfa_elems, 
+            # Return new elements, default layout and the trace of the empty string, and clear the test string
+            return (default_layout,
+                    cyto_nfa_elems,
                     '',
-                    f"Accepted? {test_string_acceptance}",
-                    None,
-                    nfa_curr_states,
-                    no_update,
-                    '')
-            
+                    precompute_trace(test_nfa, ''),
+                    '',
+                    session_id)
+
         except Exception as e:
             # Handle error during generation
-            return (default_layout, 
-                    stylesheet, 
-                    [], 
-                    f"Error: Invalid Regex! {str(e)}", 
-                    f"Accepted? {None}", 
-                    no_update,
-                    no_update,
-                    no_update
-                    )
-        
-    # --- C. Trace Button Trigger ---
-    elif trigger_id == 'trace-nfa-button':
-
-        if (len(current_elements) != 0):
-
-            if(len(input_test_string) > 0):
-                if (str_idx['idx'] >= len(input_test_string)):
-                    str_idx['idx'] = 0
-                    nfa_curr_states['curr_states'] = [test_nfa.start_state]
-
-                active_states = get_active_states(test_nfa, input_test_string[str_idx['idx']], set(nfa_curr_states['curr_states']))
-
-                if (len(active_states[1]) > 0):
-                    if not(test_nfa.accept_state in (nfa_curr_states['curr_states'])):
-                        dynamic_stylesheet = stylesheet + [
-                            {'selector': f'node[id="{s}"]', 'style': {'background-color': '#e74c3c'}}
-                            for s in (active_states[1] | test_nfa.get_epsilon_closure({test_nfa.start_state}) | set(nfa_curr_states['curr_states']))
-                        ]
-                        nfa_curr_states['curr_states'] = list(active_states[1])
-
-                    else:
-                        dynamic_stylesheet = stylesheet + [
-                            {'selector': f'node[id="{s}"]', 'style': {'background-color': '#e74c3c'}}
-                            for s in (active_states[1] | test_nfa.get_epsilon_closure({test_nfa.start_state}))
-                        ]
-                        nfa_curr_states['curr_states'] = list(active_states[1])
-
-                        
-                else:
-                    dynamic_stylesheet = stylesheet
-
-                    nfa_curr_states['curr_states'] = list(active_states[1])
-
-                string_display_children = []
-                test_string_acceptance = test_nfa.match(input_test_string)
-                
-                for i, char in enumerate(input_test_string):
-                    # Check if the current character index (i) matches the index (str_idx) being simulated
-                    if i == str_idx['idx']:
-                        # Apply specific style to the currently simulated character
-                        styled_char = html.Span(
-                            char, 
-                            style={
-                                'textDecoration': 'underline !important', # <-- Add !important
-                                'fontWeight': 'bold !important',         # <-- Add !important
-                                'fontSize': '1.2em',                     
-                                'color': '#c0392b'
-                            }
-                        )
-                    else:
-                        # Use a standard span for all other characters
-                        styled_char = html.Span(char)
-                    
-                    string_display_children.append(styled_char)
-                
-                str_idx['idx'] += 1
-
-                return (no_update, 
-                        dynamic_stylesheet, 
-                        current_elements, 
-                        string_display_children,
-                        f"Accepted? {test_string_acceptance}",
-                        str_idx,
-                        nfa_curr_states,
-                        test_string_acceptance,
-                        no_update)
-
-            else:
-                dynamic_stylesheet = stylesheet + [
-                    {'selector': f'node[id="{s}"]', 'style': {'background-color': '#e74c3c'}}
-                    for s in test_nfa.get_epsilon_closure({test_nfa.start_state})
-                ]
-
-                return (no_update, 
-                        dynamic_stylesheet, 
-                        no_update, 
-                        no_update,
-                        f"Accepted? {test_nfa.match('')}",
-                        no_update,
-                        no_update,
-                        no_update,
-                        no_update)
-
-        else:
-            return (no_update, 
-                    stylesheet, 
-                    current_elements, 
-                    f'Please generate the NFA first!',
-                    no_update,
-                    str_idx,
-                    no_update,
+            session_store.delete(session_id)
+
+            return (default_layout,
+                    [],
+                    f"Error: Invalid Regex! {str(e)}",
+                    None,
                     no_update,
-                    no_update)
+                    session_id)
+
+    # --- C. Test String Submitted ---
+    elif trigger_id == 'input-string':
 
-    # --- D. Default/Input String Trigger (input-string or initial load) ---
+        # the session's pattern, as compiled when the NFA was generated
+        test_nfa = session_store.get(session_id) if session_id else None
+
+        if test_nfa is None:
+            return (no_update, no_update, 'Please generate the NFA first!', None, no_update, no_update)
+
+        # the whole trace is computed once, stepping through it runs in the browser
+        return (no_update, no_update, '', precompute_trace(test_nfa, input_test_string), no_update, no_update)
+
+    # --- D. Default (initial load) ---
     else:
-        # If any other input (like input-string or input-regex while not generating) 
-        # triggers the callback, we must return the current state of the graph.
-        return (
-            no_update, 
-            stylesheet,          
-            current_elements, 
-            f'{input_test_string}',
-            f"Accepted? {test_string_acceptance}",
-            str_idx,
-            no_update,
-            no_update,
-            no_update
-        )
+        return (no_update, no_update, no_update, no_update, no_update, no_update)
+
+# Steps through the precomputed trace without a round-trip to the server: Step consumes the next character (and starts over after the last
+# one), Back gives one back and the slider jumps to any position. A new trace starts at position 0
+app.clientside_callback(
+    """
+    function(step_clicks, back_clicks, slider_value, trace, base_stylesheet, str_idx) {
+        const triggered = dash_clientside.callback_context.triggered.map(t => t.prop_id);
+
+        if (!trace) {
+            return [base_stylesheet, '', '', '', 'Accepted? None', {idx: 0}, 0, 0];
+        }
+
+        const n = trace.string.length;
+        let idx = (str_idx && !triggered.includes('trace-data.data')) ? str_idx.idx : 0;
+
+        if (triggered.includes('trace-nfa-button.n_clicks')) {
+            idx = idx >= n ? 0 : idx + 1;
+        } else if (triggered.includes('trace-back-button.n_clicks')) {
+            idx = Math.max(idx - 1, 0);
+        } else if (triggered.includes('trace-slider.value')) {
+            idx = Math.min(Math.max(slider_value || 0, 0), n);
+        }
+
+        const highlight = trace.sets[trace.steps[idx]].map(s => ({
+            selector: `node[id="${s}"]`,
+            style: {'background-color': '#e74c3c'}
+        }));
+
+        return [
+            base_stylesheet.concat(highlight),
+            trace.string.slice(0, Math.max(idx - 1, 0)),
+            idx > 0 ? trace.string[idx - 1] : '',
+            trace.string.slice(idx),
+            `Accepted? ${trace.accepted ? 'True' : 'False'}`,
+            {idx: idx},
+            n,
+            idx
+        ];
+    }
+    """,
+    Output('NFA-graph', 'stylesheet'),
+    Output('trace-before', 'children'),
+    Output('trace-current', 'children'),
+    Output('trace-after', 'children'),
+    Output('acceptance-output', 'children'),
+    Output('str-idx', 'data'),
+    Output('trace-slider', 'max'),
+    Output('trace-slider', 'value'),
+
+    Input('trace-nfa-button', 'n_clicks'),
+    Input('trace-back-button', 'n_clicks'),
+    Input('trace-slider', 'value'),
+    Input('trace-data', 'data'),
+
+    State('base-stylesheet', 'data'),
+    State('str-idx', 'data'),
+)
 
 if __name__ == "__main__":
         app.run(debug=True) 
\ No newline at end of file